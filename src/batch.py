@@ -0,0 +1,192 @@
+from __future__ import annotations
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field, asdict
+from time import perf_counter
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+import json
+import sys
+import traceback
+
+from benchmark import make_pipeline, pipeline_stats, read_program
+from eisa import EISA
+from memory_subsystem import MemorySubsystem
+from pipeline import PipeLine
+
+
+@dataclass
+class MachineConfig:
+    """the configuration of the machine a job runs on, defaults to the same machine as the UI
+    """
+    yes_pipe: bool = True
+    forwarding: bool = False
+    predictor: Optional[str] = None  # the name of the branch predictor to use, see PREDICTORS
+    out_of_order: bool = False  # use the ScoreboardPipeLine
+    issue_width: Optional[int] = None  # use a SuperscalarPipeLine issuing up to this many instructions per cycle
+    skip_stalls: bool = True
+
+    cache_size: int = EISA.CACHE_SIZE
+    cache_read_speed: int = EISA.CACHE_READ_SPEED
+    cache_write_speed: int = EISA.CACHE_WRITE_SPEED
+    ram_read_speed: int = EISA.RAM_READ_SPEED
+    ram_write_speed: int = EISA.RAM_WRITE_SPEED
+    cache_enabled: bool = True
+
+    max_cycles: int = int(EISA.PROGRAM_MAX_CYCLE_LIMIT)
+
+
+@dataclass
+class Job:
+    """a single simulation to run, which has to be picklable to be sent to a worker process
+    """
+    name: str
+    program: Union[str, List[int]]  # the path to an assembled program, or the encoded instructions, loaded at address 0
+    ram: Dict[int, List[int]] = field(default_factory=dict)  # words to store in RAM before running, indexed by the first address
+    config: MachineConfig = field(default_factory=MachineConfig)
+    ram_ranges: List[Tuple[int, int]] = field(default_factory=list)  # the (address, length) of the RAM to collect once the job finishes
+
+    @classmethod
+    def from_dict(cls, job: dict) -> Job:
+        """creates a job from its JSON form, where the keys of ram are strings
+        """
+        return cls(
+            name=job['name'],
+            program=job['program'],
+            ram={int(address): words for address, words in job.get('ram', {}).items()},
+            config=MachineConfig(**job.get('config', {})),
+            ram_ranges=[tuple(ram_range) for ram_range in job.get('ram_ranges', [])],  # type: ignore
+        )
+
+
+@dataclass
+class JobResult:
+    name: str
+    stop_reason: Optional[str]  # the name of the StopReason, None if the job raised an error
+    cycles: int = 0
+    instructions: int = 0
+    elapsed: float = 0.0  # host time taken to run the job, in seconds
+    registers: List[int] = field(default_factory=list)
+    ram: Dict[int, List[int]] = field(default_factory=dict)  # the words in each of the job's ram_ranges, indexed by the first address
+    stats: Dict[str, float] = field(default_factory=dict)  # see benchmark.pipeline_stats
+    error: Optional[str] = None  # the traceback, if the job raised an error
+
+    def __str__(self) -> str:
+        if self.error is not None:
+            return f'{self.name}: failed\n{self.error}'
+        return f'{self.name}: stopped on {self.stop_reason} after {self.cycles} cycles, {self.instructions} instructions, {self.elapsed:.3f}s'
+
+
+def load_program(program: Union[str, List[int]]) -> List[int]:
+    """reads an assembled program, which is one instruction per line in binary
+    """
+    if not isinstance(program, str):
+        return list(program)
+    return read_program(program)
+
+
+def build_pipeline(job: Job) -> PipeLine:
+    """creates the machine described by the job, with its program and RAM initializers loaded
+
+    Parameters
+    ----------
+    job : Job
+        the job to create the machine for
+
+    Returns
+    -------
+    PipeLine
+        the pipeline, ready to run
+    """
+    config = job.config
+    memory = MemorySubsystem(EISA.ADDRESS_SIZE, config.cache_size, config.cache_read_speed, config.cache_write_speed,
+                             EISA.RAM_SIZE, config.ram_read_speed, config.ram_write_speed)
+    memory.cache_enabled = memory.cache2_enabled = config.cache_enabled
+
+    pipeline = make_pipeline(memory, config.yes_pipe, config.forwarding, config.predictor, config.out_of_order, config.issue_width)
+    pipeline.skip_stalls = config.skip_stalls
+
+    for address, word in enumerate(load_program(job.program)):
+        memory._RAM[address] = word
+    for start, words in job.ram.items():
+        for address, word in enumerate(words, start):
+            memory._RAM[address] = word
+
+    return pipeline
+
+
+def run_job(job: Job) -> JobResult:
+    """runs a single job to completion, any error is returned in the result rather than raised,
+    so that one bad job doesn't stop the rest of the batch
+    """
+    try:
+        pipeline = build_pipeline(job)
+
+        start = perf_counter()
+        result = pipeline.run(max_cycles=job.config.max_cycles)
+        elapsed = perf_counter() - start
+
+        ram = pipeline._memory._RAM._memory
+        return JobResult(
+            job.name, result.stop_reason.name, result.cycles, result.instructions, elapsed,
+            registers=list(pipeline._registers),
+            ram={address: ram[address:address + length] for address, length in job.ram_ranges},
+            stats=pipeline_stats(pipeline),
+        )
+    except Exception:
+        return JobResult(job.name, None, error=traceback.format_exc())
+
+
+def run_batch(jobs: Iterable[Job], workers: Optional[int] = None) -> Iterator[JobResult]:
+    """runs each job in its own worker process, yielding the results as they finish, which isn't necessarily in the order of the jobs
+
+    Parameters
+    ----------
+    jobs : Iterable[Job]
+        the jobs to run
+    workers : Optional[int], optional
+        the number of worker processes, by default None to use one per host core.
+        with a single worker the jobs are run in this process instead, which is easier to debug
+
+    Yields
+    ------
+    JobResult
+        the result of each job
+    """
+    if workers == 1:
+        yield from map(run_job, jobs)
+        return
+
+    with ProcessPoolExecutor(workers) as executor:
+        futures = [executor.submit(run_job, job) for job in jobs]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+if __name__ == '__main__':
+    arg_parse = ArgumentParser(description='runs a batch of simulations across a pool of worker processes')
+    arg_parse.add_argument('jobs', type=str,
+                           help='a JSON file holding a list of jobs, each with a name, a program, '
+                                'and optionally ram initializers, a config, and ram_ranges to collect, see Job')
+    arg_parse.add_argument('-j', type=int, default=None, dest='workers',
+                           help='the number of worker processes, defaults to one per core')
+    arg_parse.add_argument('-o', type=str, default=None, dest='output',
+                           help='a file to write the results to, one JSON object per line as each job finishes, defaults to stdout')
+
+    args = arg_parse.parse_args()
+
+    with open(args.jobs) as f:
+        jobs = [Job.from_dict(job) for job in json.load(f)]
+
+    out = open(args.output, 'w') if args.output is not None else sys.stdout
+    failed = 0
+    try:
+        for result in run_batch(jobs, args.workers):
+            out.write(json.dumps(asdict(result)) + '\n')
+            out.flush()
+            failed += result.error is not None
+            print(result, file=sys.stderr)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,176 @@
+from __future__ import annotations
+from argparse import ArgumentParser
+from dataclasses import dataclass
+from typing import List
+import time
+
+import numpy as np  # pip install numpy
+from tabulate import tabulate  # pip install tabulate
+
+from cache_trace import AccessKind, CacheConfig, TraceCache, POLICIES, add_trace_arguments, record_from_args
+from vector_cache import cache_hits, trace_addresses
+
+
+def next_uses(lines: np.ndarray) -> np.ndarray:
+    """the position of the next access to the same line as each access, len(lines) if the line isn't used again
+
+    Parameters
+    ----------
+    lines : np.ndarray
+        the line of each access, in order
+    """
+    n = len(lines)
+    order = np.argsort(lines, kind='stable')
+    same = lines[order[1:]] == lines[order[:-1]]
+    following = np.full(n, n, dtype=np.int64)
+    following[order[:-1][same]] = order[1:][same]
+    return following
+
+
+def opt_hits(addresses: np.ndarray, config: CacheConfig) -> np.ndarray:
+    """which accesses hit in a cache with Belady's optimal replacement, which evicts the way whose line is used again furthest in the future.
+    every access which misses is filled, the same as MemorySubsystem.read does, so the cache can't choose to bypass a line.
+
+    the next use of each access is worked out up front, so the replay only has to compare the next uses of the ways in a set
+
+    Parameters
+    ----------
+    addresses : np.ndarray
+        the addresses accessed, in order
+    config : CacheConfig
+        the geometry of the cache, its policy is ignored
+
+    Returns
+    -------
+    np.ndarray
+        True for each access which hit
+    """
+    lines = np.asarray(addresses, dtype=np.int64) // config.line_words
+    n = len(lines)
+    following = next_uses(lines).tolist()
+
+    sets = config.sets
+    ways = config.ways
+    tags = [-1] * (sets * ways)  # the line held by each way, indexed by set * ways + way, -1 if the way is empty
+    nexts = [n + 1] * (sets * ways)  # the next use of the line held by each way, past every line which isn't used again when the way is empty
+    hits = np.zeros(n, dtype=bool)
+
+    for i, line in enumerate(lines.tolist()):
+        base = (line % sets) * ways
+        try:
+            way = tags.index(line, base, base + ways)
+            hits[i] = True
+        except ValueError:
+            way = max(range(base, base + ways), key=nexts.__getitem__)
+            tags[way] = line
+        nexts[way] = following[i]
+
+    return hits
+
+
+def policy_hits(addresses: np.ndarray, config: CacheConfig) -> np.ndarray:
+    """which accesses hit in a cache with its own replacement policy, when each address is looked up and then filled.
+    round_robin replays the pointer of CacheBlock, which moves on for the lookup and again for the fill, see vector_cache.cache_hits
+
+    Parameters
+    ----------
+    addresses : np.ndarray
+        the addresses accessed, in order
+    config : CacheConfig
+        the geometry and policy of the cache
+
+    Returns
+    -------
+    np.ndarray
+        True for each access which hit
+    """
+    try:
+        return cache_hits(addresses, config)
+    except ValueError:
+        pass
+
+    cache = TraceCache(config)
+    hits = np.zeros(len(addresses), dtype=bool)
+    for i, address in enumerate(np.asarray(addresses).tolist()):
+        if cache.lookup(address):
+            hits[i] = True
+        else:
+            cache.fill(address)
+    return hits
+
+
+@dataclass
+class OptComparison:
+    """the misses of a cache's replacement policy next to the fewest misses any policy could have
+    """
+    config: CacheConfig
+    accesses: int
+    compulsory: int  # the first accesses to each line, which every policy misses
+    policy_misses: int
+    opt_misses: int
+
+    @property
+    def excess(self) -> int:
+        """the misses the policy has which optimal replacement avoids
+        """
+        return self.policy_misses - self.opt_misses
+
+
+def compare_to_opt(addresses: np.ndarray, config: CacheConfig) -> OptComparison:
+    """replays the addresses through a cache with its own policy and with optimal replacement
+
+    Parameters
+    ----------
+    addresses : np.ndarray
+        the addresses accessed, in order
+    config : CacheConfig
+        the geometry and policy of the cache
+
+    Returns
+    -------
+    OptComparison
+        the misses of each
+    """
+    lines = np.asarray(addresses, dtype=np.int64) // config.line_words
+    n = len(lines)
+    return OptComparison(config, n, len(np.unique(lines)),
+                         n - int(policy_hits(addresses, config).sum()), n - int(opt_hits(addresses, config).sum()))
+
+
+def format_comparisons(comparisons: List[OptComparison]) -> str:
+    """the comparisons as a table
+    """
+    rows = [
+        [str(c.config), c.config.size, c.accesses, c.compulsory, c.policy_misses, c.opt_misses, c.excess,
+         100 * c.policy_misses / max(c.accesses, 1), 100 * c.opt_misses / max(c.accesses, 1)]
+        for c in comparisons
+    ]
+    return tabulate(rows, headers=['cache', 'words', 'accesses', 'compulsory', 'policy misses', 'opt misses', 'excess',
+                                   'policy miss %', 'opt miss %'], floatfmt='.2f')
+
+
+if __name__ == '__main__':
+    arg_parse = ArgumentParser(description="compares the misses of a cache's replacement policy with Belady's optimal replacement, over a program's accesses")
+    add_trace_arguments(arg_parse)
+    arg_parse.add_argument('--kind', choices=[kind.name.lower() for kind in AccessKind], nargs='+', default=None,
+                           help='only count these kinds of access, defaults to all of them')
+    arg_parse.add_argument('--sets', type=int, nargs='+', default=[CacheConfig().sets])
+    arg_parse.add_argument('--ways', type=int, nargs='+', default=[CacheConfig().ways])
+    arg_parse.add_argument('--line-words', type=int, nargs='+', default=[CacheConfig().line_words])
+    arg_parse.add_argument('--policy', choices=POLICIES, default=CacheConfig().policy)
+
+    args = arg_parse.parse_args()
+
+    trace = record_from_args(args)
+    kinds = [AccessKind[kind.upper()] for kind in args.kind] if args.kind is not None else None
+    addresses = trace_addresses(trace, kinds)
+
+    start = time.perf_counter()
+    comparisons = [
+        compare_to_opt(addresses, CacheConfig(sets, ways, line_words, policy=args.policy))
+        for sets in args.sets for ways in args.ways for line_words in args.line_words
+    ]
+    elapsed = time.perf_counter() - start
+
+    print(format_comparisons(comparisons))
+    print(f'\n{len(comparisons)} caches in {elapsed:.3f}s')
@@ -0,0 +1,357 @@
+from __future__ import annotations
+from argparse import ArgumentParser, Namespace
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Type
+import gc
+import os
+import time
+
+from tabulate import tabulate  # pip install tabulate
+
+from bit_vectors import BitVector
+from branch_predictor import BranchUnit, PREDICTORS
+from eisa import EISA
+from memory_devices import CACHE_POLICIES, RAM
+from memory_subsystem import MemorySubsystem, MemoryRequest
+from pipeline import PipeLine, Instruction, OpCode
+from scoreboard import ScoreboardPipeLine
+from superscalar import SuperscalarPipeLine
+
+dir_name = os.path.dirname(__file__)
+default_program = os.path.join(dir_name, '..', 'demos', 'exchange_sort.out')
+
+# the objects which get created by the pipeline as it runs
+counted_types: List[Type] = [Instruction, BitVector, MemoryRequest]
+
+# constructors which create instances without going through __init__
+alternate_constructors: Dict[Type, List[str]] = {
+    Instruction: ['from_decoded']
+}
+
+
+@contextmanager
+def count_allocations(types: List[Type]) -> Iterator[Dict[str, int]]:
+    """counts the number of instances of each of the passed types (including subclasses) that get created,
+    by temporarily wrapping their constructors
+
+    Parameters
+    ----------
+    types : List[Type]
+        the types to count
+
+    Yields
+    ------
+    Dict[str, int]
+        the number of instances created so far, indexed by the name of the type
+    """
+    counts = {t.__name__: 0 for t in types}
+    originals: List[Tuple[Type, str, Any]] = []
+
+    def counting_init(name: str, init):
+        def __init__(self, *args, **kwargs):
+            counts[name] += 1
+            init(self, *args, **kwargs)
+        return __init__
+
+    def counting_classmethod(name: str, method):
+        def wrapper(cls, *args, **kwargs):
+            counts[name] += 1
+            return method.__func__(cls, *args, **kwargs)
+        return classmethod(wrapper)
+
+    for t in types:
+        originals.append((t, '__init__', t.__dict__['__init__']))
+        t.__init__ = counting_init(t.__name__, t.__dict__['__init__'])
+
+        for constructor in alternate_constructors.get(t, []):
+            originals.append((t, constructor, t.__dict__[constructor]))
+            setattr(t, constructor, counting_classmethod(t.__name__, t.__dict__[constructor]))
+
+    try:
+        yield counts
+    finally:
+        for t, attr, original in reversed(originals):
+            setattr(t, attr, original)
+
+
+def read_program(program: str) -> List[int]:
+    """reads an assembled program, which is one instruction per line in binary
+    """
+    with open(program) as f:
+        return [int(line, 2) for line in f if line.strip()]
+
+
+def store_array(ram: RAM, address: int, array_size: int) -> None:
+    """stores the length of an array followed by the array in descending order, which is the layout used by the exchange sort demo
+    """
+    ram[address] = array_size
+    for i in range(array_size):
+        ram[address + 1 + i] = array_size - i
+
+
+def make_pipeline(memory: MemorySubsystem, yes_pipe: bool, forwarding: bool = False, predictor: Optional[str] = None,
+                  out_of_order: bool = False, issue_width: Optional[int] = None) -> PipeLine:
+    """creates the pipeline described by the options, starting at address 0 with every register cleared
+
+    Parameters
+    ----------
+    memory : MemorySubsystem
+        the memory the pipeline runs from
+    yes_pipe : bool
+        whether pipelining is enabled
+    forwarding : bool, optional
+        whether operand forwarding is enabled, by default False
+    predictor : Optional[str], optional
+        the name of the branch predictor to use, see PREDICTORS, by default None to not predict branches
+    out_of_order : bool, optional
+        whether to use the out of order ScoreboardPipeLine, which doesn't support disabling pipelining, forwarding, or a predictor,
+        by default False
+    issue_width : Optional[int], optional
+        if passed, a SuperscalarPipeLine issuing up to this many instructions per cycle is used, 
+        which has the same restrictions as out_of_order. by default None to use the scalar pipeline
+
+    Returns
+    -------
+    PipeLine
+        the pipeline, with nothing loaded into memory
+
+    Raises
+    ------
+    ValueError
+        if the options ask for something the chosen pipeline doesn't support
+    """
+    if out_of_order and issue_width is not None:
+        raise ValueError('out_of_order and issue_width each choose a pipeline, pass only one of them')
+    if out_of_order or issue_width is not None:
+        unsupported = [option for option, is_set in (('yes_pipe=False', not yes_pipe), ('forwarding', forwarding),
+                                                     ('predictor', predictor is not None)) if is_set]
+        if unsupported:
+            name = 'ScoreboardPipeLine' if out_of_order else 'SuperscalarPipeLine'
+            raise ValueError(f"{name} doesn't support {', '.join(unsupported)}")
+
+    registers = [0 for i in range(EISA.NUM_GP_REGS)]
+    if out_of_order:
+        pipeline = ScoreboardPipeLine(0, registers, memory)
+    elif issue_width is not None:
+        pipeline = SuperscalarPipeLine(0, registers, memory, issue_width)
+    else:
+        pipeline = PipeLine(0, registers, memory)
+    pipeline.yes_pipe = yes_pipe
+    pipeline.forwarding = forwarding
+    if predictor is not None:
+        pipeline.branch_unit = BranchUnit(PREDICTORS[predictor]())
+    return pipeline
+
+
+def load_pipeline(program: str, array_size: int, yes_pipe: bool, forwarding: bool = False, predictor: Optional[str] = None,
+                  out_of_order: bool = False, issue_width: Optional[int] = None, cache_policy: Optional[str] = None,
+                  cache_ways: int = 2) -> PipeLine:
+    """creates a pipeline with the passed program loaded at address 0, on the same memory as the UI
+
+    Parameters
+    ----------
+    program : str
+        path to the assembled program
+    array_size : int
+        if positive, an array is stored right after the program, see store_array
+    yes_pipe, forwarding, predictor, out_of_order, issue_width
+        the pipeline to create, see make_pipeline
+    cache_policy : Optional[str], optional
+        if passed, both caches are ArrayCaches with this replacement policy, see CACHE_POLICIES, by default None for the default caches
+    cache_ways : int, optional
+        the number of ways of each set of the ArrayCaches, by default 2
+
+    Returns
+    -------
+    PipeLine
+        the pipeline, ready to run
+    """
+    memory = MemorySubsystem(EISA.ADDRESS_SIZE, EISA.CACHE_SIZE, EISA.CACHE_READ_SPEED, EISA.CACHE_WRITE_SPEED,
+                             EISA.RAM_SIZE, EISA.RAM_READ_SPEED, EISA.RAM_WRITE_SPEED)
+    if cache_policy is not None:
+        memory.use_array_caches(cache_ways, cache_policy)
+    pipeline = make_pipeline(memory, yes_pipe, forwarding, predictor, out_of_order, issue_width)
+
+    words = read_program(program)
+    for addr, word in enumerate(words):
+        memory._RAM[addr] = word
+
+    if array_size > 0:
+        store_array(memory._RAM, len(words), array_size)
+
+    return pipeline
+
+
+def add_program_arguments(arg_parse: ArgumentParser, verb: str = 'run') -> None:
+    """adds the arguments shared by the tools which run a program: the program and its array, 
+    the cycle limit, and the options of the in order pipeline. see pipeline_from_args
+
+    Parameters
+    ----------
+    arg_parse : ArgumentParser
+        the parser to add the arguments to
+    verb : str, optional
+        what the tool does with the program, for the help text, by default 'run'
+    """
+    arg_parse.add_argument('program', type=str, nargs='?', default=default_program,
+                           help=f'the assembled program to {verb}, defaults to the exchange sort demo')
+    arg_parse.add_argument('-a', type=int, default=16, dest='array_size',
+                           help='the size of the array stored after the program, 0 to not store one')
+    arg_parse.add_argument('-c', type=int, default=int(EISA.PROGRAM_MAX_CYCLE_LIMIT), dest='max_cycles',
+                           help=f'the maximum number of cycles to {verb} for')
+    arg_parse.add_argument('--no-pipe', action='store_true', help='disable pipelining')
+    arg_parse.add_argument('--forwarding', action='store_true', help='forward results to the instructions using them')
+    arg_parse.add_argument('--predictor', choices=list(PREDICTORS), default=None,
+                           help='predict branches with the passed direction predictor, rather than stalling fetch on every branch')
+
+
+def pipeline_from_args(args: Namespace) -> PipeLine:
+    """loads the program on the pipeline described by the arguments added by add_program_arguments
+    """
+    return load_pipeline(args.program, args.array_size, not args.no_pipe, args.forwarding, args.predictor)
+
+
+def run(pipeline: PipeLine, max_cycles: int, skip_stalls: bool = False) -> None:
+    """runs the pipeline until the program finishes
+
+    Parameters
+    ----------
+    pipeline : PipeLine
+        the pipeline to run
+    max_cycles : int
+        the maximum number of cycles to run for
+    skip_stalls : bool, optional
+        whether to skip over frozen memory stalls, by default False
+    """
+    while pipeline._pipeline[4].opcode != OpCode.END and pipeline._cycles < max_cycles:
+        if skip_stalls:
+            pipeline.cycle_skipping(max_cycles - pipeline._cycles)
+        else:
+            pipeline.cycle_pipeline()
+
+
+def pipeline_stats(pipeline: PipeLine) -> Dict[str, float]:
+    """collects the statistics kept by the pipeline and whichever of its optional parts are enabled
+
+    Parameters
+    ----------
+    pipeline : PipeLine
+        the pipeline, after it has been run
+
+    Returns
+    -------
+    Dict[str, float]
+        the value of each statistic, indexed by its name
+    """
+    results: Dict[str, float] = {}
+    for stat, count in vars(pipeline.forwarding_stats).items():
+        results[stat.replace('_', ' ')] = count
+    if pipeline.branch_unit is not None:
+        results['branch accuracy'] = pipeline.branch_unit.accuracy
+    if pipeline.cpi_stack is not None:
+        for category, cpi in pipeline.cpi_stack.cpi().items():
+            results[f'CPI {category.replace("_", " ")}'] = cpi
+    if isinstance(pipeline, ScoreboardPipeLine):
+        for stat, count in vars(pipeline.stats).items():
+            results[stat.replace('_', ' ')] = count
+    if isinstance(pipeline, SuperscalarPipeLine):
+        results['instructions/cycle'] = pipeline._instructions_retired / max(pipeline._cycles, 1)
+        for slot in range(pipeline.issue_width):
+            results[f'slot {slot} fill rate'] = pipeline.stats.fill_rate(slot)
+        for stat in ('dependency_splits', 'pairing_splits', 'fetch_splits', 'dependency_stalls'):
+            results[stat.replace('_', ' ')] = getattr(pipeline.stats, stat)
+
+    return results
+
+
+def benchmark(program: str, array_size: int, yes_pipe: bool, max_cycles: int, skip_stalls: bool = False,
+              forwarding: bool = False, predictor: Optional[str] = None, out_of_order: bool = False,
+              issue_width: Optional[int] = None, cache_policy: Optional[str] = None, cache_ways: int = 2) -> Dict[str, float]:
+    """runs the program twice, once to time it, 
+    and once to measure the number of objects allocated per simulated cycle, since counting them slows the pipeline down
+
+    Parameters
+    ----------
+    program : str
+        path to the assembled program
+    array_size : int
+        the size of the array to store after the program, see load_pipeline
+    yes_pipe : bool
+        whether pipelining is enabled
+    max_cycles : int
+        the maximum number of cycles to run for
+    skip_stalls : bool, optional
+        whether to skip over frozen memory stalls, by default False
+    forwarding : bool, optional
+        whether operand forwarding is enabled, by default False
+    predictor : Optional[str], optional
+        the name of the branch predictor to use, by default None to not predict branches
+    out_of_order : bool, optional
+        whether to use the out of order ScoreboardPipeLine, by default False
+    issue_width : Optional[int], optional
+        the issue width of the SuperscalarPipeLine to use, by default None to use the scalar pipeline
+    cache_policy : Optional[str], optional
+        the replacement policy of the ArrayCaches to use, by default None for the default caches
+    cache_ways : int, optional
+        the number of ways of each set of the ArrayCaches, by default 2
+
+    Returns
+    -------
+    Dict[str, float]
+        the results of the benchmark, for the out of order and superscalar pipelines 
+        this includes the cycles the program takes on PipeLine and the speedup over it
+    """
+    pipeline = load_pipeline(program, array_size, yes_pipe, forwarding, predictor, out_of_order, issue_width, cache_policy, cache_ways)
+
+    gc_before = [stats['collections'] for stats in gc.get_stats()]
+    start = time.perf_counter()
+    run(pipeline, max_cycles, skip_stalls)
+    elapsed = time.perf_counter() - start
+    gc_after = [stats['collections'] for stats in gc.get_stats()]
+
+    results: Dict[str, float] = {
+        'cycles': pipeline._cycles,
+        'seconds': elapsed,
+        'cycles/s': pipeline._cycles / elapsed if elapsed else float('inf'),
+    }
+    for gen, (before, after) in enumerate(zip(gc_before, gc_after)):
+        results[f'gc gen{gen} collections'] = after - before
+    results.update(pipeline_stats(pipeline))
+
+    if out_of_order or issue_width is not None:
+        # the other pipelines don't take the same cycles as PipeLine even when they only go one instruction at a time,
+        # so they are compared against PipeLine itself
+        scalar = load_pipeline(program, array_size, True, cache_policy=cache_policy, cache_ways=cache_ways)
+        run(scalar, max_cycles, skip_stalls)
+        results['PipeLine cycles'] = scalar._cycles
+        results['speedup over PipeLine'] = scalar._cycles / max(pipeline._cycles, 1)
+
+    pipeline = load_pipeline(program, array_size, yes_pipe, forwarding, predictor, out_of_order, issue_width, cache_policy, cache_ways)
+    with count_allocations(counted_types) as counts:
+        run(pipeline, max_cycles, skip_stalls)
+
+    for name, count in counts.items():
+        results[f'{name}/cycle'] = count / max(pipeline._cycles, 1)
+
+    return results
+
+
+if __name__ == '__main__':
+    arg_parse = ArgumentParser(description='measures the speed and the allocations per cycle of the pipeline')
+    add_program_arguments(arg_parse)
+    arg_parse.add_argument('--skip', action='store_true', help='skip over frozen memory stalls')
+    arg_parse.add_argument('--out-of-order', action='store_true', dest='out_of_order',
+                           help='run the out of order scoreboard pipeline instead of the in order one')
+    arg_parse.add_argument('--issue-width', type=int, default=None, dest='issue_width',
+                           help='run the superscalar pipeline, issuing up to this many instructions per cycle')
+    arg_parse.add_argument('--cache-policy', choices=CACHE_POLICIES, default=None, dest='cache_policy',
+                           help='use array backed caches with this replacement policy, rather than the default caches')
+    arg_parse.add_argument('--cache-ways', type=int, default=2, dest='cache_ways',
+                           help='the number of ways of each set of the array backed caches')
+
+    args = arg_parse.parse_args()
+
+    results = benchmark(args.program, args.array_size, not args.no_pipe, args.max_cycles, args.skip, args.forwarding, args.predictor,
+                        args.out_of_order, args.issue_width, args.cache_policy, args.cache_ways)
+
+    print(tabulate(results.items(), headers=['metric', 'value'], floatfmt='.3f'))
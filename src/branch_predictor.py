@@ -0,0 +1,287 @@
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import Dict, List, NamedTuple, Optional, Tuple, Type
+
+
+class BranchPredictor:
+    """base class for the direction predictors, which guess whether a conditional branch will be taken
+    """
+    name: str = ''
+
+    def predict(self, address: int) -> bool:
+        """guesses whether the branch at the passed address will be taken
+
+        Parameters
+        ----------
+        address : int
+            the address of the branch
+
+        Returns
+        -------
+        bool
+            True if the branch is predicted to be taken
+        """
+        raise NotImplementedError
+
+    def update(self, address: int, taken: bool) -> None:
+        """trains the predictor with the outcome of a branch, once it has been executed
+
+        Parameters
+        ----------
+        address : int
+            the address of the branch
+        taken : bool
+            whether the branch was taken
+        """
+        pass
+
+
+class NotTakenPredictor(BranchPredictor):
+    """static predictor, which assumes every conditional branch falls through
+    """
+    name = 'not-taken'
+
+    def predict(self, address: int) -> bool:
+        return False
+
+
+class BimodalPredictor(BranchPredictor):
+    """table of 2-bit saturating counters indexed by the branch's address,
+    a counter of 2 or 3 predicts taken
+    """
+    name = 'bimodal'
+
+    _counters: List[int]
+
+    def __init__(self, size: int = 256):
+        # start as weakly not taken
+        self._counters = [1 for i in range(size)]
+
+    def _index(self, address: int) -> int:
+        return address % len(self._counters)
+
+    def predict(self, address: int) -> bool:
+        return self._counters[self._index(address)] >= 2
+
+    def update(self, address: int, taken: bool) -> None:
+        index = self._index(address)
+        if taken:
+            self._counters[index] = min(self._counters[index] + 1, 3)
+        else:
+            self._counters[index] = max(self._counters[index] - 1, 0)
+
+
+class GSharePredictor(BimodalPredictor):
+    """2-bit saturating counters indexed by the branch's address xor'd with the outcomes of the most recent branches,
+    so that branches whose outcome depends on the path taken to them can be predicted.
+    the history is only updated once a branch is executed
+    """
+    name = 'gshare'
+
+    history_bits: int
+    _history: int
+
+    def __init__(self, size: int = 256, history_bits: int = 8):
+        super().__init__(size)
+        self.history_bits = history_bits
+        self._history = 0
+
+    def _index(self, address: int) -> int:
+        return (address ^ self._history) % len(self._counters)
+
+    def update(self, address: int, taken: bool) -> None:
+        super().update(address, taken)
+        self._history = ((self._history << 1) | taken) & ((1 << self.history_bits) - 1)
+
+
+class BranchTargetBuffer:
+    """direct mapped cache of the targets of taken branches, indexed by the address of the branch
+    """
+    _entries: List[Optional[Tuple[int, int]]]  # (address of the branch, target), None if the entry is empty
+
+    def __init__(self, size: int = 64):
+        self._entries = [None for i in range(size)]
+
+    def lookup(self, address: int) -> Optional[int]:
+        """gets the target of the branch at the passed address, None if it is not in the buffer
+        """
+        entry = self._entries[address % len(self._entries)]
+        if entry is not None and entry[0] == address:
+            return entry[1]
+        return None
+
+    def insert(self, address: int, target: int) -> None:
+        self._entries[address % len(self._entries)] = (address, target)
+
+
+class ReturnAddressStack:
+    """stack of the return addresses of the calls (BL) that have been fetched, used to predict the target of returns.
+    the oldest return address is dropped when the stack is full
+    """
+    depth: int
+    _stack: List[int]
+
+    def __init__(self, depth: int = 8):
+        self.depth = depth
+        self._stack = []
+
+    def push(self, address: int) -> None:
+        if len(self._stack) == self.depth:
+            del self._stack[0]
+        self._stack.append(address)
+
+    def pop(self) -> Optional[int]:
+        return self._stack.pop() if self._stack else None
+
+    def checkpoint(self) -> Tuple[int, ...]:
+        return tuple(self._stack)
+
+    def restore(self, checkpoint: Tuple[int, ...]) -> None:
+        self._stack = list(checkpoint)
+
+
+class Prediction(NamedTuple):
+    """what the fetch stage assumed about a branch, checked once the branch is executed
+    """
+    address: int  # the address of the branch
+    next_pc: int  # the address fetched after the branch
+    ras_checkpoint: Tuple[int, ...]  # the return address stack before the branch was fetched, restored on a misprediction
+
+
+@dataclass
+class BranchStats:
+    executed: int = 0
+    taken: int = 0
+    mispredicted: int = 0
+
+    @property
+    def accuracy(self) -> float:
+        return 1 - self.mispredicted / self.executed if self.executed else 1.0
+
+    def __str__(self) -> str:
+        return f'executed {self.executed}, taken {self.taken}, mispredicted {self.mispredicted}, accuracy {self.accuracy:.1%}'
+
+
+class BranchUnit:
+    """predicts the address to fetch after each branch, made up of a direction predictor,
+    a branch target buffer, and a return address stack.
+    the fetch stage only gets the target of a taken branch from the branch target buffer or the return address stack,
+    so a branch is always predicted as not taken the first time it is fetched
+    """
+    predictor: BranchPredictor
+    btb: BranchTargetBuffer
+    ras: ReturnAddressStack
+
+    stats: Dict[int, BranchStats]  # indexed by the address of the branch
+
+    def __init__(self, predictor: Optional[BranchPredictor] = None, btb_size: int = 64, ras_depth: int = 8):
+        """creates a branch unit
+
+        Parameters
+        ----------
+        predictor : Optional[BranchPredictor], optional
+            the direction predictor for conditional branches, by default a BimodalPredictor
+        btb_size : int, optional
+            the number of entries in the branch target buffer, by default 64
+        ras_depth : int, optional
+            the number of return addresses the return address stack can hold, by default 8
+        """
+        self.predictor = BimodalPredictor() if predictor is None else predictor
+        self.btb = BranchTargetBuffer(btb_size)
+        self.ras = ReturnAddressStack(ras_depth)
+        self.stats = {}
+
+    def predict(self, address: int, conditional: bool, call: bool, ret: bool) -> Prediction:
+        """predicts the address to fetch after a branch
+
+        Parameters
+        ----------
+        address : int
+            the address of the branch
+        conditional : bool
+            whether the branch has a condition, unconditional branches are always predicted taken
+        call : bool
+            whether the branch links (BL), its return address gets pushed to the return address stack if it is predicted taken
+        ret : bool
+            whether the branch is a return (ie. a branch to the link register),
+            its target gets popped from the return address stack if it is predicted taken
+
+        Returns
+        -------
+        Prediction
+            the prediction, to be passed to resolve once the branch has been executed
+        """
+        checkpoint = self.ras.checkpoint()
+        next_pc = address + 1
+
+        if not conditional or self.predictor.predict(address):
+            target = self.ras.pop() if ret else None
+            if target is None:
+                target = self.btb.lookup(address)
+
+            if target is not None:
+                next_pc = target
+                if call:
+                    self.ras.push(address + 1)
+
+        return Prediction(address, next_pc, checkpoint)
+
+    def resolve(self, prediction: Prediction, conditional: bool, call: bool, ret: bool, taken: bool, next_pc: int) -> bool:
+        """trains the branch unit with the outcome of a branch, and checks whether it was predicted correctly
+
+        Parameters
+        ----------
+        prediction : Prediction
+            the prediction made when the branch was fetched
+        conditional, call, ret : bool
+            the kind of branch, see predict
+        taken : bool
+            whether the branch was taken
+        next_pc : int
+            the address of the instruction that actually comes after the branch
+
+        Returns
+        -------
+        bool
+            True if the branch was mispredicted, and the instructions fetched after it have to be squashed
+        """
+        address = prediction.address
+
+        if conditional:
+            self.predictor.update(address, taken)
+        if taken:
+            self.btb.insert(address, next_pc)
+
+        stats = self.stats.get(address)
+        if stats is None:
+            stats = self.stats[address] = BranchStats()
+        stats.executed += 1
+        stats.taken += taken
+
+        if next_pc == prediction.next_pc:
+            return False
+
+        stats.mispredicted += 1
+
+        # undo anything done to the return address stack by the instructions fetched after the branch
+        self.ras.restore(prediction.ras_checkpoint)
+        if taken and call:
+            self.ras.push(address + 1)
+        elif taken and ret:
+            self.ras.pop()
+        return True
+
+    @property
+    def accuracy(self) -> float:
+        """the fraction of all the executed branches that were predicted correctly
+        """
+        executed = sum(stats.executed for stats in self.stats.values())
+        mispredicted = sum(stats.mispredicted for stats in self.stats.values())
+        return 1 - mispredicted / executed if executed else 1.0
+
+
+"""the direction predictors, indexed by name
+"""
+PREDICTORS: Dict[str, Type[BranchPredictor]] = {
+    predictor.name: predictor for predictor in (NotTakenPredictor, BimodalPredictor, GSharePredictor)
+}
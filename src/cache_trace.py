@@ -0,0 +1,478 @@
+from __future__ import annotations
+from argparse import ArgumentParser, Namespace
+from array import array
+from dataclasses import dataclass, field
+from itertools import product
+from typing import BinaryIO, Iterable, List, Optional, Union
+import enum
+import os
+import struct
+import sys
+import time
+
+from tabulate import tabulate  # pip install tabulate
+
+from benchmark import add_program_arguments, pipeline_from_args
+from eisa import EISA
+from memory_subsystem import HitLevel
+from pipeline import PipeLine
+
+
+class AccessKind(enum.IntEnum):
+    FETCH = 0
+    READ = 1
+    WRITE = 2
+
+
+"""trace file layout, all integers are little endian:
+    header    magic, format version, number of accesses
+    kinds     one byte per access, see AccessKind
+    levels    one byte per access, the HitLevel when the trace was recorded
+    addresses 8 bytes per access
+    pcs       8 bytes per access
+"""
+MAGIC = b'EISATRCE'
+VERSION = 1
+
+"""the replacement policies of TraceCache. round_robin is the one CacheBlock uses,
+where looking up an address which misses moves the pointer on as well as replacing a way
+"""
+POLICIES = ('round_robin', 'fifo', 'lru')
+
+
+class AccessTrace:
+    """the stream of reads and writes the memory subsystem was asked for while running a program,
+    in the order they were started, to replay through other cache configurations with replay.
+
+    attach it to a pipeline before running it to record the accesses, see record_trace
+    """
+    kinds: array  # AccessKind of each access
+    addresses: array
+    pcs: array  # the address of the instruction making each access, the address itself for fetches. -1 if it isn't known
+    levels: array  # the HitLevel of each access in the machine it was recorded from
+
+    _pipeline: Optional[PipeLine]
+
+    def __init__(self):
+        self.kinds = array('b')
+        self.addresses = array('q')
+        self.pcs = array('q')
+        self.levels = array('b')
+        self._pipeline = None
+
+    def attach(self, pipeline: PipeLine) -> None:
+        """starts recording the accesses made by the pipeline's memory subsystem.
+        data accesses are blamed on the instruction in the memory stage, which is only exact for the in order pipeline
+        """
+        self._pipeline = pipeline
+        pipeline._memory.on_access = self.record
+
+    def detach(self) -> None:
+        """stops recording
+        """
+        if self._pipeline is not None:
+            self._pipeline._memory.on_access = None
+            self._pipeline = None
+
+    def record(self, address: int, is_write: bool, fetch: bool) -> None:
+        """records an access, the signature of MemorySubsystem.on_access
+        """
+        pipeline = self._pipeline
+        self.kinds.append(AccessKind.WRITE if is_write else AccessKind.FETCH if fetch else AccessKind.READ)
+        self.addresses.append(address)
+        self.pcs.append(address if fetch else pipeline._pipeline[3].address)  # type: ignore
+        self.levels.append(pipeline._memory.hit_level(address))  # type: ignore
+
+    def append(self, kind: AccessKind, address: int, pc: int = -1, level: HitLevel = HitLevel.NONE) -> None:
+        """adds an access to the end of the trace, for building traces by hand
+        """
+        self.kinds.append(kind)
+        self.addresses.append(address)
+        self.pcs.append(pc)
+        self.levels.append(level)
+
+    def __len__(self) -> int:
+        return len(self.kinds)
+
+    def save(self, file: Union[str, os.PathLike, BinaryIO]) -> None:
+        """writes the trace to a file, or to a file object opened in binary mode
+        """
+        if isinstance(file, (str, os.PathLike)):
+            with open(file, 'wb') as f:
+                self.save(f)
+            return
+
+        file.write(MAGIC + struct.pack('<HQ', VERSION, len(self)))
+        for column in (self.kinds, self.levels, self.addresses, self.pcs):
+            if sys.byteorder == 'big':
+                column = array(column.typecode, column)
+                column.byteswap()
+            file.write(column.tobytes())
+
+    @classmethod
+    def load(cls, file: Union[str, os.PathLike, BinaryIO]) -> AccessTrace:
+        """reads a trace written by save
+
+        Raises
+        ------
+        ValueError
+            if the file isn't a trace, or was written by a newer version
+        """
+        if isinstance(file, (str, os.PathLike)):
+            with open(file, 'rb') as f:
+                return cls.load(f)
+
+        if file.read(len(MAGIC)) != MAGIC:
+            raise ValueError('not an access trace')
+        version, count = struct.unpack('<HQ', file.read(struct.calcsize('<HQ')))
+        if not 1 <= version <= VERSION:
+            raise ValueError(f'unsupported trace version {version}, expected {VERSION} or earlier')
+
+        trace = cls()
+        for column in (trace.kinds, trace.levels, trace.addresses, trace.pcs):
+            column.frombytes(file.read(column.itemsize * count))
+            if sys.byteorder == 'big':
+                column.byteswap()
+        return trace
+
+
+def record_trace(pipeline: PipeLine, max_cycles: Optional[int] = None) -> AccessTrace:
+    """runs the pipeline, recording every access it makes
+
+    Parameters
+    ----------
+    pipeline : PipeLine
+        the pipeline to run, with its program loaded
+    max_cycles : Optional[int], optional
+        the maximum number of cycles to run for, by default None for no limit
+
+    Returns
+    -------
+    AccessTrace
+        the accesses, in the order they were started
+    """
+    trace = AccessTrace()
+    trace.attach(pipeline)
+    try:
+        pipeline.run(max_cycles=max_cycles)
+    finally:
+        trace.detach()
+    return trace
+
+
+def add_trace_arguments(arg_parse: ArgumentParser) -> None:
+    """adds the arguments of the program to record, see benchmark.add_program_arguments, 
+    and -t to use a saved trace instead. see record_from_args
+    """
+    add_program_arguments(arg_parse, 'record')
+    arg_parse.add_argument('-t', type=str, default=None, dest='trace',
+                           help='use a trace saved by cache_trace.py -o instead of recording the program')
+
+
+def record_from_args(args: Namespace) -> AccessTrace:
+    """loads the trace passed with -t, or records the program described by the arguments added by add_trace_arguments
+    """
+    if args.trace is not None:
+        return AccessTrace.load(args.trace)
+    return record_trace(pipeline_from_args(args), args.max_cycles)
+
+
+@dataclass
+class CacheConfig:
+    """the geometry and timing of a single cache, defaults to the L1 cache of the MemorySubsystem
+    """
+    sets: int = EISA.CACHE_ADDR_SPACE
+    ways: int = 2  # CacheBlock always has 2 ways
+    line_words: int = 4  # the words in each way, Cache uses 2 offset bits
+    read_speed: int = EISA.CACHE_READ_SPEED
+    write_speed: int = EISA.CACHE_WRITE_SPEED
+    policy: str = 'round_robin'  # see POLICIES
+
+    def __post_init__(self):
+        if self.sets < 1 or self.ways < 1 or self.line_words < 1:
+            raise ValueError(f'a cache needs at least one set, way, and word per line, not {self}')
+        if self.policy not in POLICIES:
+            raise ValueError(f'unknown replacement policy {self.policy}, expected one of {", ".join(POLICIES)}')
+
+    @property
+    def size(self) -> int:
+        """the number of words the cache holds
+        """
+        return self.sets * self.ways * self.line_words
+
+    def __str__(self) -> str:
+        return f'{self.sets}x{self.ways}x{self.line_words} {self.policy}'
+
+
+def _default_l2() -> CacheConfig:
+    return CacheConfig(EISA.CACHE2_ADDR_SPACE, read_speed=EISA.CACHE2_READ_SPEED, write_speed=EISA.CACHE2_WRITE_SPEED)
+
+
+@dataclass
+class HierarchyConfig:
+    """the caches and RAM timing to replay a trace through, defaults to the MemorySubsystem
+    """
+    l1: CacheConfig = field(default_factory=CacheConfig)
+    l2: Optional[CacheConfig] = field(default_factory=_default_l2)  # None for only a single level of cache
+    ram_read_speed: int = EISA.RAM_READ_SPEED
+    ram_write_speed: int = EISA.RAM_WRITE_SPEED
+
+
+class TraceCache:
+    """a cache which only tracks which lines it holds, to replay traces through.
+    lookup and fill behave the same as Cache.check_hit and Cache.replace do for the round_robin policy
+    """
+    config: CacheConfig
+
+    _sets: int
+    _ways: int
+    _line_words: int
+    _lru: bool
+    _round_robin: bool
+
+    _tags: List[int]  # the line held by each way, indexed by set * ways + way, -1 if the way is empty
+    _pointers: List[int]  # the next way to replace in each set, for round_robin and fifo
+    _stamps: List[int]  # when each way was last used, for lru
+    _clock: int
+
+    def __init__(self, config: CacheConfig):
+        self.config = config
+        self._sets = config.sets
+        self._ways = config.ways
+        self._line_words = config.line_words
+        self._lru = config.policy == 'lru'
+        self._round_robin = config.policy == 'round_robin'
+
+        self._tags = [-1] * (config.sets * config.ways)
+        self._pointers = [0] * config.sets
+        self._stamps = [0] * (config.sets * config.ways)
+        self._clock = 0
+
+    def lookup(self, address: int) -> bool:
+        """checks whether the cache holds the address, counting as a use of the line for lru
+        """
+        line = address // self._line_words
+        base = (line % self._sets) * self._ways
+        try:
+            way = self._tags.index(line, base, base + self._ways)
+        except ValueError:
+            if self._round_robin:
+                index = base // self._ways
+                self._pointers[index] = (self._pointers[index] + 1) % self._ways
+            return False
+
+        if self._lru:
+            self._clock += 1
+            self._stamps[way] = self._clock
+        return True
+
+    def fill(self, address: int) -> None:
+        """loads the line holding the address, replacing a way if the cache doesn't hold it already
+        """
+        line = address // self._line_words
+        index = line % self._sets
+        base = index * self._ways
+        try:
+            way = self._tags.index(line, base, base + self._ways)
+        except ValueError:
+            if self._lru:
+                stamps = self._stamps
+                way = min(range(base, base + self._ways), key=stamps.__getitem__)
+            else:
+                way = base + self._pointers[index]
+                self._pointers[index] = (self._pointers[index] + 1) % self._ways
+            self._tags[way] = line
+
+        if self._lru:
+            self._clock += 1
+            self._stamps[way] = self._clock
+
+    def holds(self, address: int) -> bool:
+        """checks whether the cache holds the address, without counting as a use
+        """
+        line = address // self._line_words
+        base = (line % self._sets) * self._ways
+        return line in self._tags[base:base + self._ways]
+
+
+class TraceHierarchy:
+    """the caches of a HierarchyConfig, which a trace is sent through one access at a time
+    """
+    config: HierarchyConfig
+    l1: TraceCache
+    l2: Optional[TraceCache]
+
+    def __init__(self, config: HierarchyConfig):
+        self.config = config
+        self.l1 = TraceCache(config.l1)
+        self.l2 = TraceCache(config.l2) if config.l2 is not None else None
+
+    def access(self, kind: int, address: int) -> HitLevel:
+        """looks up and fills the caches in the same order as MemorySubsystem.read and write do,
+        reads fill both caches, and writes are write-through and no allocate
+
+        Parameters
+        ----------
+        kind : int
+            the AccessKind of the access
+        address : int
+            the address accessed
+
+        Returns
+        -------
+        HitLevel
+            the level the access was served from
+        """
+        l1, l2 = self.l1, self.l2
+
+        if kind != AccessKind.WRITE:
+            if l1.lookup(address):
+                # the memory subsystem looks in L2 as well to pick the read speed
+                if l2 is not None:
+                    l2.lookup(address)
+                level = HitLevel.L1
+            elif l2 is not None and l2.lookup(address):
+                level = HitLevel.L2
+            else:
+                level = HitLevel.RAM
+
+            if l2 is not None:
+                l2.fill(address)
+            l1.fill(address)
+            return level
+
+        if l1.lookup(address):
+            if l2 is not None:
+                l2.fill(address)
+            return HitLevel.L1
+        if l2 is not None and l2.lookup(address):
+            # the memory subsystem looks in L1 a second time before settling on L2
+            l1.lookup(address)
+            l1.fill(address)
+            return HitLevel.L2
+        return HitLevel.RAM
+
+
+@dataclass
+class ReplayResult:
+    """what happened to each access of a trace replayed through a configuration
+    """
+    config: HierarchyConfig
+    accesses: int = 0
+    l1_hits: int = 0
+    l2_hits: int = 0
+    ram_accesses: int = 0
+    stall_cycles: int = 0  # the cycles spent waiting on each access, the speed of the level it was served from, summed
+    levels: Optional[array] = None  # the HitLevel of each access, only if asked for
+
+    @property
+    def l1_hit_rate(self) -> float:
+        return self.l1_hits / self.accesses if self.accesses else 0.0
+
+    @property
+    def l2_hit_rate(self) -> float:
+        """the share of the accesses which missed the L1 cache that hit the L2 cache
+        """
+        misses = self.accesses - self.l1_hits
+        return self.l2_hits / misses if misses else 0.0
+
+
+def replay(trace: AccessTrace, config: Optional[HierarchyConfig] = None, keep_levels: bool = False) -> ReplayResult:
+    """runs a trace through a cache hierarchy, without the pipeline.
+
+    each access is looked up and filled in the same order as MemorySubsystem.read and write do, see TraceHierarchy.access.
+    the accesses are replayed one at a time in the order they were started, which matches the memory subsystem exactly
+    for a trace recorded with pipelining disabled. while pipelining, accesses overlap (the fetch and memory stages share the read channel,
+    and the caches are only filled once an access finishes), so a few accesses can see the caches differently
+
+    Parameters
+    ----------
+    trace : AccessTrace
+        the accesses to replay
+    config : Optional[HierarchyConfig], optional
+        the caches to replay the accesses through, by default None for the same caches as the MemorySubsystem
+    keep_levels : bool, optional
+        whether to keep the level each access was served from, by default False
+
+    Returns
+    -------
+    ReplayResult
+        the number of accesses served by each level, and the cycles spent waiting on them
+    """
+    if config is None:
+        config = HierarchyConfig()
+    access = TraceHierarchy(config).access
+
+    # the number of reads and writes served from each level, indexed by HitLevel then whether the access is a write
+    counts = [[0, 0] for level in HitLevel]
+    levels = array('b', bytes(len(trace))) if keep_levels else None
+
+    for i, (kind, address) in enumerate(zip(trace.kinds, trace.addresses)):
+        level = access(kind, address)
+        counts[level][kind == AccessKind.WRITE] += 1
+        if levels is not None:
+            levels[i] = level
+
+    l2_speeds = (config.l2.read_speed, config.l2.write_speed) if config.l2 is not None else (0, 0)
+    speeds = [(0, 0), (config.l1.read_speed, config.l1.write_speed), l2_speeds, (config.ram_read_speed, config.ram_write_speed)]
+    return ReplayResult(
+        config, len(trace), sum(counts[HitLevel.L1]), sum(counts[HitLevel.L2]), sum(counts[HitLevel.RAM]),
+        sum(reads * read_speed + writes * write_speed for (reads, writes), (read_speed, write_speed) in zip(counts, speeds)),
+        levels
+    )
+
+
+def sweep(trace: AccessTrace, configs: Iterable[HierarchyConfig]) -> List[ReplayResult]:
+    """replays a trace through each of the configurations, see replay
+    """
+    return [replay(trace, config) for config in configs]
+
+
+def format_results(results: List[ReplayResult]) -> str:
+    """the results of a sweep as a table
+    """
+    rows = [
+        [str(result.config.l1), str(result.config.l2) if result.config.l2 is not None else '-',
+         100 * result.l1_hit_rate, 100 * result.l2_hit_rate, result.ram_accesses, result.stall_cycles]
+        for result in results
+    ]
+    return tabulate(rows, headers=['L1', 'L2', 'L1 hit %', 'L2 hit %', 'RAM accesses', 'stall cycles'], floatfmt='.1f')
+
+
+if __name__ == '__main__':
+    arg_parse = ArgumentParser(description='records the memory accesses of a program once, then replays them through many cache configurations')
+    add_trace_arguments(arg_parse)
+    arg_parse.add_argument('-o', type=str, default=None, dest='output', help='save the recorded trace to a file')
+
+    defaults, l2_defaults = CacheConfig(), _default_l2()
+    arg_parse.add_argument('--l1-sets', type=int, nargs='+', default=[defaults.sets])
+    arg_parse.add_argument('--l1-ways', type=int, nargs='+', default=[defaults.ways])
+    arg_parse.add_argument('--l2-sets', type=int, nargs='+', default=[l2_defaults.sets], help='0 for no L2 cache')
+    arg_parse.add_argument('--l2-ways', type=int, nargs='+', default=[l2_defaults.ways])
+    arg_parse.add_argument('--line-words', type=int, nargs='+', default=[defaults.line_words],
+                           help='the words in each line, of both caches')
+    arg_parse.add_argument('--policy', choices=POLICIES, nargs='+', default=[defaults.policy],
+                           help='the replacement policy, of both caches')
+
+    args = arg_parse.parse_args()
+
+    start = time.perf_counter()
+    trace = record_from_args(args)
+    if args.trace is None:
+        print(f'recorded {len(trace)} accesses in {time.perf_counter() - start:.3f}s')
+        if args.output is not None:
+            trace.save(args.output)
+
+    configs = [
+        HierarchyConfig(
+            CacheConfig(l1_sets, l1_ways, line_words, policy=policy),
+            CacheConfig(l2_sets, l2_ways, line_words, l2_defaults.read_speed, l2_defaults.write_speed, policy) if l2_sets else None
+        )
+        for l1_sets, l1_ways, l2_sets, l2_ways, line_words, policy
+        in product(args.l1_sets, args.l1_ways, args.l2_sets, args.l2_ways, args.line_words, args.policy)
+    ]
+
+    start = time.perf_counter()
+    results = sweep(trace, configs)
+    print(f'replayed {len(configs)} configurations in {time.perf_counter() - start:.3f}s\n')
+    print(format_results(results))
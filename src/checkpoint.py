@@ -0,0 +1,478 @@
+from __future__ import annotations
+from array import array
+from typing import BinaryIO, Dict, List, Optional, Tuple, Union
+import os
+import struct
+import sys
+
+from eisa import EISA
+from memory_devices import Cache, CacheWay
+from memory_subsystem import MemorySubsystem, MemoryRequest
+from cpi_stack import CPIStack
+from pipeline import PipeLine, DecodedInstruction, Instruction, NOOP
+
+
+"""checkpoint file layout, all integers are little endian:
+    header       magic, format version
+    memory       RAM and cache configuration, the state of the read/write channels
+    RAM          the RAM as a raw block of uint32 words,
+                 followed by the words which don't fit in 32 bits (negative, or too large), stored as (address, int)
+    caches       L1 then L2, every way of every block
+    pipeline     registers, condition flags, counters, stall flags, register claims
+    instructions the instructions in flight, with the memory access they made (version 3 onwards),
+                 then the instruction in each slot of the pipeline and its latches
+    CPI stack    whether the pipeline has one, then its counts and the charges of the bubbles in flight (version 2 onwards)
+
+registers and word values are python ints which can go past 32 bits,
+so outside of the RAM block they are stored with a 1 byte length followed by that many bytes of two's complement
+"""
+MAGIC = b'EISACKPT'
+VERSION = 3
+
+# the array typecode for an unsigned 32 bit int, 'I' is only 16 bits on some platforms
+_WORD_TYPECODE = 'I' if array('I').itemsize == 4 else 'L'
+
+# the stall flags of the pipeline, in the order they are stored
+_PIPELINE_FLAGS: Tuple[str, ...] = (
+    'yes_pipe', 'skip_stalls', 'forwarding',
+    '_stalled_fetch', '_stalled_memory', '_dependency_stall', '_start_stall', '_stall_finished', '_fetch_isWaiting', '_is_finished'
+)
+
+# the flags of the memory subsystem, in the order they are stored
+_MEMORY_FLAGS: Tuple[str, ...] = (
+    'cache_enabled', 'cache2_enabled', '_is_reading', '_is_writing', '_write_miss', 'l1_hit', 'l2_hit', 'l1_hit_writing', 'l2_hit_writing',
+    '_read_is_fetch'  # added after version 3, older checkpoints read it as False
+)
+
+
+class CheckpointError(ValueError):
+    """raised when a checkpoint can't be read, or the machine can't be checkpointed
+    """
+    pass
+
+
+class _Writer:
+    _parts: List[bytes]
+
+    def __init__(self):
+        self._parts = []
+
+    def raw(self, data: bytes) -> None:
+        self._parts.append(data)
+
+    def pack(self, fmt: str, *values) -> None:
+        self._parts.append(struct.pack('<' + fmt, *values))
+
+    def int(self, value: int) -> None:
+        length = (value.bit_length() + 8) // 8
+        self._parts.append(struct.pack('<B', length) + value.to_bytes(length, 'little', signed=True))
+
+    def flags(self, values: List[bool]) -> None:
+        self.int(sum(bool(value) << i for i, value in enumerate(values)))
+
+    def getvalue(self) -> bytes:
+        return b''.join(self._parts)
+
+
+class _Reader:
+    _data: memoryview
+    _offset: int
+
+    def __init__(self, data: bytes):
+        self._data = memoryview(data)
+        self._offset = 0
+
+    def raw(self, size: int) -> bytes:
+        if self._offset + size > len(self._data):
+            raise CheckpointError('checkpoint is truncated')
+        data = self._data[self._offset:self._offset + size]
+        self._offset += size
+        return bytes(data)
+
+    def unpack(self, fmt: str) -> tuple:
+        fmt = '<' + fmt
+        return struct.unpack(fmt, self.raw(struct.calcsize(fmt)))
+
+    def int(self) -> int:
+        length, = self.unpack('B')
+        return int.from_bytes(self.raw(length), 'little', signed=True)
+
+    def flags(self, count: int) -> List[bool]:
+        value = self.int()
+        return [bool(value >> i & 1) for i in range(count)]
+
+
+# region memory
+def _write_memory(writer: _Writer, memory: MemorySubsystem) -> None:
+    ram = memory._RAM
+    for value in (ram._local_addr_size, ram._read_speed, ram._write_speed,
+                  memory.cache_size_original, memory.cache_read_speed, memory.cache_write_speed):
+        writer.int(value)
+
+    writer.flags([getattr(memory, flag, False) for flag in _MEMORY_FLAGS])
+    for value in (memory.waiting_on_reading, memory.waiting_on_writing, memory.stalls_remaining_reading, memory.stalls_remaining_writing):
+        writer.int(value)
+
+    for request in (memory._read_request, memory._write_request):
+        writer.pack('B', request is not None)
+        if request is not None:
+            writer.int(request.address)
+            writer.int(request.value if request.value is not None else 0)
+
+    # RAM, as a raw block of words with the ones that don't fit in a uint32 stored separately
+    words = ram._memory
+    mask = EISA.WORD_MASK
+    try:
+        block = array(_WORD_TYPECODE, words)
+        overflow = []
+    except OverflowError:
+        block = array(_WORD_TYPECODE, [word & mask for word in words])
+        overflow = [(address, word) for address, word in enumerate(words) if not 0 <= word <= mask]
+    if sys.byteorder == 'big':
+        block.byteswap()
+
+    writer.pack('I', len(words))
+    writer.raw(block.tobytes())
+    writer.pack('I', len(overflow))
+    for address, word in overflow:
+        writer.pack('I', address)
+        writer.int(word)
+
+    for cache in (memory._cache, memory._cache2):
+        _write_cache(writer, cache)
+
+
+def _write_cache(writer: _Writer, cache: Cache) -> None:
+    if not isinstance(cache, Cache):
+        raise CheckpointError(f'only the default caches can be checkpointed, not {type(cache).__name__}')
+    writer.pack('I', len(cache._cache))
+    for block in cache._cache:
+        writer.pack('BB', block.pointer, len(block.ways))
+        for way in block.ways:
+            writer.pack('BBBB', way._index_bits, way._offset_bits, bool(way._valid), bool(way._dirty))
+            writer.int(way._tag)
+            writer.int(way._index)
+            writer.pack('B', len(way._data))
+            for word in way._data:
+                writer.int(word)
+
+
+def _read_memory(reader: _Reader, memory: Optional[MemorySubsystem]) -> MemorySubsystem:
+    config = tuple(reader.int() for i in range(6))
+    ram_size, ram_read_speed, ram_write_speed, cache_size, cache_read_speed, cache_write_speed = config
+    if memory is None:
+        memory = MemorySubsystem(EISA.ADDRESS_SIZE, cache_size, cache_read_speed, cache_write_speed, ram_size, ram_read_speed, ram_write_speed)
+    elif config != (memory._RAM._local_addr_size, memory._RAM._read_speed, memory._RAM._write_speed,
+                    memory.cache_size_original, memory.cache_read_speed, memory.cache_write_speed):
+        raise CheckpointError('checkpoint was saved from a memory subsystem with a different configuration')
+
+    for flag, value in zip(_MEMORY_FLAGS, reader.flags(len(_MEMORY_FLAGS))):
+        setattr(memory, flag, value)
+    memory.waiting_on_reading, memory.waiting_on_writing, memory.stalls_remaining_reading, memory.stalls_remaining_writing = \
+        (reader.int() for i in range(4))
+
+    requests: List[Optional[MemoryRequest]] = []
+    for is_write in (False, True):
+        request = None
+        if reader.unpack('B')[0]:
+            address = reader.int()
+            request = MemoryRequest(memory, address, is_write, reader.int() if is_write else None)
+            if not is_write:
+                reader.int()
+        requests.append(request)
+    memory._read_request, memory._write_request = requests
+
+    size, = reader.unpack('I')
+    if size != len(memory._RAM._memory):
+        raise CheckpointError(f'checkpoint has {size} words of RAM, the RAM it was configured with has {len(memory._RAM._memory)}')
+
+    block = array(_WORD_TYPECODE)
+    block.frombytes(reader.raw(4 * size))
+    if sys.byteorder == 'big':
+        block.byteswap()
+    words = block.tolist()
+
+    count, = reader.unpack('I')
+    for i in range(count):
+        address, = reader.unpack('I')
+        words[address] = reader.int()
+    # updated in place, since the UI holds on to the RAM
+    memory._RAM._memory[:] = words
+
+    for cache in (memory._cache, memory._cache2):
+        _read_cache(reader, cache)
+
+    return memory
+
+
+def _read_cache(reader: _Reader, cache: Cache) -> None:
+    count, = reader.unpack('I')
+    if count != len(cache._cache):
+        raise CheckpointError(f'checkpoint has a cache with {count} blocks, the cache it was configured with has {len(cache._cache)}')
+
+    for block in cache._cache:
+        block.pointer, way_count = reader.unpack('BB')
+        ways = []
+        for i in range(way_count):
+            index_bits, offset_bits, valid, dirty = reader.unpack('BBBB')
+            way = CacheWay(index_bits, offset_bits)
+            way._valid, way._dirty = bool(valid), bool(dirty)
+            way._tag = reader.int()
+            way._index = reader.int()
+            way._data = [reader.int() for i in range(reader.unpack('B')[0])]
+            ways.append(way)
+        block.ways = ways
+
+# endregion memory
+
+
+# region pipeline
+def _pipeline_slots(pipeline: PipeLine) -> List[Instruction]:
+    return [*pipeline._pipeline, *pipeline._fd_reg, *pipeline._de_reg, *pipeline._em_reg, *pipeline._mw_reg]
+
+
+def _write_pipeline(writer: _Writer, pipeline: PipeLine) -> None:
+    registers = pipeline._registers
+    writer.pack('B', len(registers))
+    for value in registers:
+        writer.int(value)
+    writer.flags(pipeline._active_registers)
+    for value in pipeline._register_uses:
+        writer.int(value)
+
+    writer.pack('B', pipeline._nzcv)
+    writer.int(pipeline._cycles)
+    writer.int(pipeline._instructions_retired)
+    writer.flags([getattr(pipeline, flag) for flag in _PIPELINE_FLAGS])
+    for value in vars(pipeline.forwarding_stats).values():
+        writer.int(value)
+
+    # every instruction in flight is stored once, and referred to by its position in the table, -1 for the shared NOOP
+    slots = _pipeline_slots(pipeline)
+    table: Dict[int, int] = {}
+    instructions: List[Instruction] = []
+    for instruction in slots + [producer for producer in pipeline._producers if producer is not None]:
+        if instruction is not NOOP and id(instruction) not in table:
+            table[id(instruction)] = len(instructions)
+            instructions.append(instruction)
+
+    def ref(instruction: Optional[Instruction]) -> int:
+        return -1 if instruction is None or instruction is NOOP else table[id(instruction)]
+
+    writer.pack('H', len(instructions))
+    for instruction in instructions:
+        writer.int(instruction._encoded)
+        writer.int(instruction.address)
+        writer.int(instruction.mem_address)
+        writer.pack('B', instruction.hit_level)
+        writer.pack('BB', instruction._decoded is not None, instruction.computed is not None)
+        if instruction.computed is not None:
+            writer.int(instruction.computed)
+
+        sources = instruction._sources
+        writer.pack('b', -1 if sources is None else len(sources))
+        for reg, source in (sources or {}).items():
+            writer.pack('Bh', reg, ref(source))
+
+    writer.pack('B', len(slots))
+    for instruction in slots:
+        writer.pack('h', ref(instruction))
+    for producer in pipeline._producers:
+        writer.pack('h', ref(producer))
+
+
+def _read_pipeline(reader: _Reader, memory: MemorySubsystem, pipeline: Optional[PipeLine], version: int) -> PipeLine:
+    registers = [reader.int() for i in range(reader.unpack('B')[0])]
+    if pipeline is None:
+        pipeline = PipeLine(0, [0 for i in range(len(registers))], memory)
+    elif len(pipeline._registers) != len(registers):
+        raise CheckpointError(f'checkpoint has {len(registers)} registers, the pipeline has {len(pipeline._registers)}')
+
+    # the pc, lr, and sp live in the register file, which is updated in place since the UI holds on to it
+    pipeline._registers[:] = registers
+    pipeline._decode_cache = {}
+    pipeline._active_registers = reader.flags(len(registers))
+    pipeline._register_uses = [reader.int() for i in range(len(registers))]
+
+    pipeline._nzcv, = reader.unpack('B')
+    pipeline._cycles = reader.int()
+    pipeline._instructions_retired = reader.int()
+    for flag, value in zip(_PIPELINE_FLAGS, reader.flags(len(_PIPELINE_FLAGS))):
+        setattr(pipeline, flag, value)
+    for stat in vars(pipeline.forwarding_stats):
+        setattr(pipeline.forwarding_stats, stat, reader.int())
+
+    instructions: List[Instruction] = []
+    all_sources: List[Optional[List[Tuple[int, int]]]] = []
+    for i in range(reader.unpack('H')[0]):
+        encoded = reader.int()
+        instruction = Instruction.from_decoded(pipeline, DecodedInstruction(encoded), reader.int() if version >= 2 else -1)
+        if version >= 3:
+            instruction.mem_address = reader.int()
+            instruction.hit_level, = reader.unpack('B')
+        decoded, has_computed = reader.unpack('BB')
+        if decoded:
+            instruction.decode()
+        if has_computed:
+            instruction.computed = reader.int()
+
+        count, = reader.unpack('b')
+        all_sources.append(None if count < 0 else [reader.unpack('Bh') for i in range(count)])
+        instructions.append(instruction)
+
+    def deref(index: int) -> Optional[Instruction]:
+        return None if index < 0 else instructions[index]
+
+    for instruction, sources in zip(instructions, all_sources):
+        if sources is not None:
+            instruction._sources = {reg: deref(index) for reg, index in sources}
+
+    slots = [deref(reader.unpack('h')[0]) or NOOP for i in range(reader.unpack('B')[0])]
+    pipeline._pipeline = slots[0:5]
+    pipeline._fd_reg, pipeline._de_reg, pipeline._em_reg, pipeline._mw_reg = slots[5:7], slots[7:9], slots[9:11], slots[11:13]
+    pipeline._producers = [deref(reader.unpack('h')[0]) for i in range(len(registers))]
+
+    return pipeline
+
+
+def _write_cpi_stack(writer: _Writer, cpi_stack: Optional[CPIStack]) -> None:
+    writer.pack('B', cpi_stack is not None)
+    if cpi_stack is None:
+        return
+
+    charges = [cpi_stack._last, *cpi_stack._fd, *cpi_stack._de, *cpi_stack._em, *cpi_stack._mw]
+    for category, address in charges:
+        writer.pack('B', category)
+        writer.int(address)
+
+    writer.pack('I', len(cpi_stack._by_pc))
+    for address, counts in cpi_stack._by_pc.items():
+        writer.int(address)
+        writer.pack('B', len(counts))
+        for count in counts:
+            writer.int(count)
+
+    writer.pack('H', len(cpi_stack.retired))
+    for mnemonic, count in cpi_stack.retired.items():
+        name = mnemonic.encode()
+        writer.pack('B', len(name))
+        writer.raw(name)
+        writer.int(count)
+
+
+def _read_cpi_stack(reader: _Reader) -> Optional[CPIStack]:
+    if not reader.unpack('B')[0]:
+        return None
+
+    cpi_stack = CPIStack()
+    charges = [(reader.unpack('B')[0], reader.int()) for i in range(9)]
+    cpi_stack._last = charges[0]
+    cpi_stack._fd, cpi_stack._de, cpi_stack._em, cpi_stack._mw = charges[1:3], charges[3:5], charges[5:7], charges[7:9]
+
+    for i in range(reader.unpack('I')[0]):
+        address = reader.int()
+        counts = [reader.int() for i in range(reader.unpack('B')[0])]
+        if len(counts) != len(cpi_stack.cycles):
+            raise CheckpointError(f'checkpoint has {len(counts)} CPI stack categories, expected {len(cpi_stack.cycles)}')
+        cpi_stack._by_pc[address] = counts
+        for category, count in enumerate(counts):
+            cpi_stack.cycles[category] += count
+
+    for i in range(reader.unpack('H')[0]):
+        mnemonic = reader.raw(reader.unpack('B')[0]).decode()
+        cpi_stack.retired[mnemonic] = reader.int()
+
+    return cpi_stack
+
+# endregion pipeline
+
+
+def save_checkpoint(pipeline: PipeLine, file: Union[str, os.PathLike, BinaryIO]) -> int:
+    """saves the whole machine (registers, condition flags, the instructions in flight, the caches, RAM,
+    and any memory access in progress) so that it can be resumed later with load_checkpoint, from exactly the same cycle
+
+    Parameters
+    ----------
+    pipeline : PipeLine
+        the pipeline to save, along with its memory subsystem
+    file : Union[str, os.PathLike, BinaryIO]
+        the path to write the checkpoint to, or a binary file object
+
+    Returns
+    -------
+    int
+        the size of the checkpoint, in bytes
+
+    Raises
+    ------
+    CheckpointError
+        if the pipeline is one of the variants (ie. out of order or superscalar), or is using a branch unit,
+        which aren't covered by the checkpoint format
+    """
+    if type(pipeline) is not PipeLine:
+        raise CheckpointError(f'checkpoints only cover the in order PipeLine, not {type(pipeline).__name__}')
+    if pipeline.branch_unit is not None:
+        raise CheckpointError('checkpoints do not cover the branch unit, it has to be removed first')
+
+    writer = _Writer()
+    writer.raw(MAGIC)
+    writer.pack('H', VERSION)
+    _write_memory(writer, pipeline._memory)
+    _write_pipeline(writer, pipeline)
+    _write_cpi_stack(writer, pipeline.cpi_stack)
+    data = writer.getvalue()
+
+    if isinstance(file, (str, os.PathLike)):
+        with open(file, 'wb') as f:
+            f.write(data)
+    else:
+        file.write(data)
+
+    return len(data)
+
+
+def load_checkpoint(file: Union[str, os.PathLike, BinaryIO], pipeline: Optional[PipeLine] = None) -> PipeLine:
+    """creates a new pipeline and memory subsystem from a checkpoint written by save_checkpoint,
+    running it gives exactly the same results as the machine the checkpoint was saved from
+
+    Parameters
+    ----------
+    file : Union[str, os.PathLike, BinaryIO]
+        the path of the checkpoint, or a binary file object
+    pipeline : Optional[PipeLine], optional
+        if passed, the checkpoint is restored into this pipeline and its memory subsystem instead of new ones,
+        so that anything holding on to them (ie. the UI or the debug terminal) sees the restored state.
+        by default None to create a new pipeline
+
+    Returns
+    -------
+    PipeLine
+        the restored pipeline, its memory subsystem is in _memory
+
+    Raises
+    ------
+    CheckpointError
+        if the file isn't a checkpoint, was written by a newer version,
+        or doesn't match the configuration of the pipeline it is being restored into
+    """
+    if pipeline is not None and (type(pipeline) is not PipeLine or pipeline.branch_unit is not None):
+        raise CheckpointError('checkpoints can only be restored into the in order PipeLine without a branch unit')
+
+    if isinstance(file, (str, os.PathLike)):
+        with open(file, 'rb') as f:
+            data = f.read()
+    else:
+        data = file.read()
+
+    reader = _Reader(data)
+    if reader.raw(len(MAGIC)) != MAGIC:
+        raise CheckpointError('not a checkpoint file')
+
+    version, = reader.unpack('H')
+    if not 1 <= version <= VERSION:
+        raise CheckpointError(f'unsupported checkpoint version {version}, expected {VERSION} or earlier')
+
+    memory = _read_memory(reader, pipeline._memory if pipeline is not None else None)
+    pipeline = _read_pipeline(reader, memory, pipeline, version)
+    pipeline.cpi_stack = _read_cpi_stack(reader) if version >= 2 else None
+    return pipeline
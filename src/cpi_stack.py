@@ -0,0 +1,212 @@
+from __future__ import annotations
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+import enum
+
+from tabulate import tabulate  # pip install tabulate
+
+
+class CycleCategory(enum.IntEnum):
+    """what a cycle of the pipeline was spent on, judged by what reached the writeback stage
+    """
+    RETIRE = 0  # an instruction was retired
+    FETCH_MEMORY = 1  # a bubble from the fetch stage waiting on memory
+    DATA_MEMORY = 2  # a bubble from a load or store waiting on memory
+    DEPENDENCY = 3  # a bubble from the decode stage waiting on a register
+    BRANCH = 4  # a bubble from fetching stopping while a branch is executed, or from squashing after a taken branch
+    PIPELINE_DISABLED = 5  # a bubble from fetching stopping until the pipeline drains, while pipelining is disabled
+    OTHER = 6  # the bubbles the pipeline started with, and NOOPs in the program
+
+
+"""the category of a cycle, and the address of the instruction it is blamed on, -1 if there isn't one
+"""
+Charge = Tuple[int, int]
+
+_START: Charge = (CycleCategory.OTHER, -1)
+
+
+class CPIStack:
+    """attributes every cycle of the in order pipeline to what it was spent on, to break its cycles per instruction down into a stack.
+
+    every cycle the writeback stage either retires an instruction, or is handed a bubble.
+    each bubble is tagged with why it was created when it enters a latch, and the tag travels down the pipeline with it,
+    so a cycle is blamed on the stall which actually caused the gap at writeback, not on whatever was stalling at the time.
+    cycles are also blamed on an address (the instruction retired, the load waiting on memory, the instruction waiting on a register,
+    the branch, or the address being fetched), so that the stack can be broken down by PC range.
+
+    set PipeLine.cpi_stack to an instance to start counting, the bubbles already in flight when it is attached count as OTHER
+    """
+    cycles: List[int]  # the number of cycles in each category, indexed by CycleCategory
+    retired: Counter[str]  # the number of instructions retired, indexed by mnemonic
+
+    _by_pc: Dict[int, List[int]]  # the cycles in each category, indexed by the address they were blamed on
+
+    # the charge for the bubble in each slot of the pipeline's latches, only meaningful for the slots holding a bubble
+    _fd: List[Charge]
+    _de: List[Charge]
+    _em: List[Charge]
+    _mw: List[Charge]
+
+    _fetch_blocked: Optional[Charge]  # why fetching was stopped in the current cycle, None if the fetch stage ran
+    _last: Charge  # the charge for the last cycle, which is repeated for every cycle skipped over
+
+    def __init__(self):
+        self.cycles = [0 for category in CycleCategory]
+        self.retired = Counter()
+        self._by_pc = {}
+        self._fetch_blocked = None
+        self._last = _START
+        self.flush()
+
+    def flush(self) -> None:
+        """forgets the charges of the bubbles in flight, called when the pipeline is flushed
+        """
+        self._fd = [_START, _START]
+        self._de = [_START, _START]
+        self._em = [_START, _START]
+        self._mw = [_START, _START]
+
+    # region accounting
+    def squash(self, pipeline) -> None:
+        """marks the fetched and decoded instructions squashed by the branch in the execute stage as branch bubbles
+        """
+        charge = (CycleCategory.BRANCH, pipeline._pipeline[2].address)
+        self._fd = [charge, charge]
+        self._de = [charge, charge]
+
+    def before_fetch(self, pipeline) -> None:
+        """records whether the fetch stage is going to be stopped in the current cycle, called just before it runs,
+        the same checks as PipeLine.stage_fetch
+        """
+        if not pipeline.yes_pipe and not pipeline.check_empty_pipeline():
+            self._fetch_blocked = (CycleCategory.PIPELINE_DISABLED, pipeline._pc)
+        elif pipeline.branch_unit is None and pipeline._pipeline[2].opcode == 30:
+            self._fetch_blocked = (CycleCategory.BRANCH, pipeline._pipeline[2].address)
+        else:
+            self._fetch_blocked = None
+
+    def account(self, pipeline) -> None:
+        """charges the current cycle, and tags the bubbles which entered the latches in it,
+        called once every stage has run, just before the latches are shifted
+        """
+        fd, de, em, mw = self._fd, self._de, self._em, self._mw
+
+        instruction = pipeline._pipeline[4]
+        if instruction.opcode != 0:
+            charge = (CycleCategory.RETIRE, instruction.address)
+            self.retired[instruction.mnemonic] += 1
+        else:
+            charge = mw[1]
+        self.charge(charge)
+
+        # the memory stage hands a bubble forward while it is waiting on memory
+        if pipeline._mw_reg[0].opcode == 0:
+            if pipeline._start_stall or (pipeline._stalled_memory and not pipeline._stall_finished):
+                mw[0] = (CycleCategory.DATA_MEMORY, pipeline._pipeline[3].address)
+            else:
+                mw[0] = em[1]
+
+        # the earlier latches only move once the memory stage isn't stalled, same as PipeLine.cycle_stage_regs
+        if not pipeline._stalled_memory:
+            if pipeline._em_reg[0].opcode == 0:
+                em[0] = de[1]
+            if pipeline._de_reg[0].opcode == 0:
+                de[0] = (CycleCategory.DEPENDENCY, pipeline._pipeline[1].address) if pipeline._dependency_stall else fd[1]
+            if pipeline._fd_reg[0].opcode == 0:
+                if self._fetch_blocked is not None:
+                    fd[0] = self._fetch_blocked
+                elif pipeline._stalled_fetch:
+                    fd[0] = (CycleCategory.FETCH_MEMORY, pipeline._pc)
+                else:
+                    # a NOOP was fetched
+                    fd[0] = (CycleCategory.OTHER, pipeline._pc - 1)
+
+        mw[0], mw[1] = em[1], mw[0]
+        if not pipeline._stalled_memory:
+            em[0], em[1] = de[1], em[0]
+            de[0], de[1] = fd[1], de[0]
+            fd[0], fd[1] = _START, fd[0]
+
+    def charge(self, charge: Charge, cycles: int = 1) -> None:
+        """adds cycles to a category, blamed on an address
+
+        Parameters
+        ----------
+        charge : Charge
+            the category, and the address the cycles are blamed on
+        cycles : int, optional
+            the number of cycles, by default 1
+        """
+        category, address = charge
+        self.cycles[category] += cycles
+
+        counts = self._by_pc.get(address)
+        if counts is None:
+            counts = self._by_pc[address] = [0 for category in CycleCategory]
+        counts[category] += cycles
+
+        self._last = charge
+
+    def repeat(self, cycles: int) -> None:
+        """charges cycles skipped over while the pipeline was frozen, each of which is charged the same as the cycle before
+        """
+        if cycles > 0:
+            self.charge(self._last, cycles)
+
+    def frozen_state(self) -> tuple:
+        """the charges of the bubbles in flight, which have to stay the same for the pipeline to be frozen
+        """
+        return tuple(self._fd), tuple(self._de), tuple(self._em), tuple(self._mw)
+
+    # endregion accounting
+
+    # region results
+    def stack(self, start: Optional[int] = None, stop: Optional[int] = None) -> Dict[str, int]:
+        """the number of cycles in each category
+
+        Parameters
+        ----------
+        start : Optional[int], optional
+            only count the cycles blamed on addresses from start, by default None to start from the first address
+        stop : Optional[int], optional
+            only count the cycles blamed on addresses before stop, by default None to go up to the last address.
+            cycles which aren't blamed on an address (-1) are only counted when neither start nor stop is passed
+
+        Returns
+        -------
+        Dict[str, int]
+            the number of cycles, indexed by the lowercase name of the category
+        """
+        if start is None and stop is None:
+            totals = self.cycles
+        else:
+            totals = [0 for category in CycleCategory]
+            for address, counts in self._by_pc.items():
+                if address >= 0 and (start is None or address >= start) and (stop is None or address < stop):
+                    for category, count in enumerate(counts):
+                        totals[category] += count
+
+        return {category.name.lower(): totals[category] for category in CycleCategory}
+
+    def cpi(self, start: Optional[int] = None, stop: Optional[int] = None) -> Dict[str, float]:
+        """the cycles in each category per instruction retired, which add up to the cycles per instruction, see stack
+        """
+        stack = self.stack(start, stop)
+        instructions = stack['retire']
+        return {category: count / instructions if instructions else 0.0 for category, count in stack.items()}
+
+    def table(self, start: Optional[int] = None, stop: Optional[int] = None) -> str:
+        """the stack as a table, with the cycles and the share of the cycles per instruction in each category, see stack
+        """
+        stack = self.stack(start, stop)
+        cpi = self.cpi(start, stop)
+        rows: List[list] = [[category.replace('_', ' '), count, cpi[category]] for category, count in stack.items()]
+        rows.append(['total', sum(stack.values()), sum(cpi.values())])
+
+        return tabulate(rows, headers=['category', 'cycles', 'CPI'], floatfmt='.3f')
+
+    def __str__(self) -> str:
+        retired = ', '.join(f'{mnemonic} {count}' for mnemonic, count in self.retired.most_common())
+        return f'{self.table()}\nretired: {retired or "nothing"}'
+
+    # endregion results
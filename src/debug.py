@@ -6,14 +6,19 @@ from memory_subsystem import MemorySubsystem, PipelineStall
 # from clock import Clock
 from commandparse import CommandParser, commandparse_cb, InputError
 from pipeline import PipeLine, Instruction
+from history import History
+from cpi_stack import CPIStack
 from eisa import EISA
 from time import sleep
 from termcolor import cprint
 
-def init_commands(memory: MemorySubsystem, pipeline: PipeLine) -> List[Tuple[str, List, Callable[..., None]]]:
+def init_commands(memory: MemorySubsystem, pipeline: PipeLine, history: Optional[History] = None) -> List[Tuple[str, List, Callable[..., None]]]:
     if __name__ != 'debug':
         from debug import terminal_print
 
+    if history is None:
+        history = History(pipeline)
+
     @commandparse_cb
     def cache_read(addr: int) -> None:
 
@@ -26,6 +31,8 @@ def init_commands(memory: MemorySubsystem, pipeline: PipeLine) -> List[Tuple[str
             else: 
                 stalled = False
 
+        # the read goes through the caches, which replaying the pipeline's past wouldn't do
+        history.reset()
         terminal_print(f'Reading from address {addr}\n{addr:#0{4}x}: {ret}')
 
     @commandparse_cb
@@ -39,6 +46,7 @@ def init_commands(memory: MemorySubsystem, pipeline: PipeLine) -> List[Tuple[str
             else: 
                 stalled = False
 
+        history.reset()
         terminal_print(f'Wrote {val} to address {addr}')
 
     @commandparse_cb
@@ -112,13 +120,41 @@ def init_commands(memory: MemorySubsystem, pipeline: PipeLine) -> List[Tuple[str
                 else: 
                     stalled = False
 
+        history.reset()
         terminal_print()
 
     @commandparse_cb
     def run_pipeline(cycle_count: int) -> None:
-        pipeline.cycle(cycle_count)
+        history.cycle(cycle_count)
         terminal_print('pipeline ran')
 
+    @commandparse_cb
+    def step_back(cycle_count: int) -> None:
+        cycle = history.step_back(cycle_count)
+        terminal_print(f'pipeline stepped back to cycle {cycle}')
+
+    @commandparse_cb
+    def run_back_to_pc(address: int) -> None:
+        cycle = history.run_back(address)
+        if cycle is None:
+            terminal_print(f'PC has not reached {address} since cycle {history.oldest_cycle}')
+        else:
+            terminal_print(f'pipeline ran back to cycle {cycle}')
+
+    @commandparse_cb
+    def view_cpi_stack() -> None:
+        if pipeline.cpi_stack is None:
+            terminal_print('the pipeline is not counting its CPI stack')
+        else:
+            terminal_print(str(pipeline.cpi_stack))
+
+    @commandparse_cb
+    def view_cpi_range(start: int, stop: int) -> None:
+        if pipeline.cpi_stack is None:
+            terminal_print('the pipeline is not counting its CPI stack')
+        else:
+            terminal_print(pipeline.cpi_stack.table(start, stop))
+
     @commandparse_cb
     def view_piepline() -> None:
         terminal_print(str(pipeline))
@@ -138,8 +174,12 @@ def init_commands(memory: MemorySubsystem, pipeline: PipeLine) -> List[Tuple[str
       # , ('step', [int], step_clock)
       , ('load', [str, int], load_program)
       , ('cycle', [int], run_pipeline)
+      , ('step-back', [int], step_back)
+      , ('run-back-to-pc', [int], run_back_to_pc)
       , ('show-pipeline', [], view_piepline)
       , ('show-registers', [], view_registers)
+      , ('show-cpi', [], view_cpi_stack)
+      , ('show-cpi-range', [int, int], view_cpi_range)
     ] # type: List[Tuple[str, List, Callable[..., None]]]
 
     return commands
@@ -175,6 +215,8 @@ if __name__ == '__main__':
                             help='the size of the RAM, in words')  # arg to get memory size
     arg_parser.add_argument('-n', action='store', type=str,
                             help='the size of the RAM, in words')  # arg to get memory size
+    arg_parser.add_argument('-hb', action='store', type=int, default=16 * 1024,
+                            help='the memory budget for stepping backwards, in KiB')  # arg to get the history budget
 
     args = arg_parser.parse_args()
 
@@ -188,8 +230,9 @@ if __name__ == '__main__':
 
     memory = MemorySubsystem(EISA.ADDRESS_SIZE, args.cs, 1, 1, args.rs, 2, 2)
     pipeline = PipeLine(0, [0] * 32, memory)
+    pipeline.cpi_stack = CPIStack()
 
-    commands = init_commands(memory, pipeline)
+    commands = init_commands(memory, pipeline, History(pipeline, budget=args.hb * 1024))
 
     # with Clock() as c, CommandParser(name=args.n, commands=commands) as command_parser:
     command_parser = CommandParser(name=args.n, commands=commands)
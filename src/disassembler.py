@@ -0,0 +1,83 @@
+from __future__ import annotations
+from argparse import ArgumentParser
+from typing import Dict, Iterable, List
+
+from pipeline import DecodedInstruction, OpCode, ConditionCode, SpecialRegister, Instructions
+
+
+def _address(fields: Dict[str, int], immediate: str) -> str:
+    # the address operand of a branch, load, or store, in the same form as the assembler takes it
+    if fields['imm']:
+        return f'#{fields[immediate]}'
+    if fields['offset']:
+        return f'[r{fields["base"]}, #{fields["offset"]}]'
+    return f'[r{fields["base"]}]'
+
+
+def disassemble(encoded: int) -> str:
+    """turns an instruction word back into assembly, in the syntax read by the assembler
+
+    Parameters
+    ----------
+    encoded : int
+        the instruction word
+
+    Returns
+    -------
+    str
+        the instruction, or the word in hex if its opcode isn't an instruction
+    """
+    if encoded == 0:
+        return 'NOOP'
+
+    try:
+        decoded = DecodedInstruction(encoded)
+    except (IndexError, ValueError):
+        return f'.word {encoded:#010x}'
+
+    fields = decoded.fields
+    opcode = decoded.opcode
+    mnemonic = Instructions[opcode].mnemonic
+
+    if opcode in (OpCode.ADD.value, OpCode.SUB.value, OpCode.MULT.value, OpCode.DIV.value, OpCode.MOD.value, OpCode.LSL.value,
+                  OpCode.LSR.value, OpCode.ASR.value, OpCode.AND.value, OpCode.XOR.value, OpCode.ORR.value, OpCode.CMP.value):
+        op2 = str(fields['literal']) if fields['lit'] else f'r{fields["op2"]}'
+        if opcode == OpCode.CMP.value:
+            return f'CMP r{fields["op1"]}, {op2}'
+        if opcode == OpCode.ADD.value and fields['op1'] == SpecialRegister.zr:
+            return f'MOV r{fields["dest"]}, {op2}'
+        return f'{mnemonic} r{fields["dest"]}, r{fields["op1"]}, {op2}'
+
+    if opcode in (OpCode.B.value, OpCode.BL.value):
+        if fields['cond'] not in ConditionCode._value2member_map_:
+            return f'.word {encoded:#010x}'
+        cond = ConditionCode(fields['cond'])
+        suffix = '' if cond is ConditionCode.AL else cond.name
+        return f'{mnemonic}{suffix} {_address(fields, "offset")}'
+
+    if opcode == OpCode.LDR.value:
+        return f'LDR r{fields["dest"]}, {_address(fields, "immediate")}'
+    if opcode == OpCode.STR.value:
+        return f'STR r{fields["src"]}, {_address(fields, "immediate")}'
+    if opcode == OpCode.PUSH.value:
+        return f'PUSH r{fields["src"]}'
+    if opcode == OpCode.POP.value:
+        return f'POP r{fields["dest"]}'
+
+    return mnemonic
+
+
+def disassemble_program(words: Iterable[int], start: int = 0) -> List[str]:
+    """disassembles each word of a program image, prefixed with its address
+    """
+    return [f'{address:>5}: {disassemble(word)}' for address, word in enumerate(words, start)]
+
+
+if __name__ == '__main__':
+    arg_parse = ArgumentParser(description='disassembles an assembled program')
+    arg_parse.add_argument('program', type=str, help='the assembled program, one instruction per line in binary')
+
+    args = arg_parse.parse_args()
+
+    with open(args.program) as f:
+        print('\n'.join(disassemble_program(int(line, 2) for line in f if line.strip())))
@@ -0,0 +1,539 @@
+from __future__ import annotations
+from typing import Callable, Dict, List, Optional, Tuple, Type
+
+from eisa import EISA
+from memory_subsystem import MemorySubsystem
+from pipeline import (
+    PipeLine, DecodedInstruction, Instruction, SpecialRegister, CONDITION_TABLE,
+    ALU_Instruction, CMP_Instruction, B_Instruction, LDR_Instruction, STR_Instruction, POP_Instruction, PUSH_Instruction
+)
+
+
+def instruction_kind(instruction_type: Type[Instruction]) -> str:
+    """groups the entries of the Instructions table by how they behave
+
+    Parameters
+    ----------
+    instruction_type : Type[Instruction]
+        an entry from the Instructions table
+
+    Returns
+    -------
+    str
+        one of 'CMP', 'ALU', 'B', 'POP', 'LDR', 'PUSH', 'STR', or 'NOOP'
+    """
+    # subclasses have to be checked before their parents
+    for kind, base in (
+        ('CMP', CMP_Instruction), ('ALU', ALU_Instruction), ('B', B_Instruction),
+        ('POP', POP_Instruction), ('LDR', LDR_Instruction), ('PUSH', PUSH_Instruction), ('STR', STR_Instruction)
+    ):
+        if issubclass(instruction_type, base):
+            return kind
+
+    # NOOP, END, and the instructions which are not implemented yet
+    return 'NOOP'
+
+
+# python expressions equivalent to the ALU functions in the Instructions table, 
+# so translated code does not have to call a function for every ALU instruction
+_ALU_EXPRESSIONS: Dict[str, str] = {
+    'ADD': '{0} + {1}',
+    'SUB': '{0} - {1}',
+    'MULT': '{0} * {1}',
+    'DIV': '{0} // {1}',
+    'MOD': '{0} % {1}',
+    'LSL': '{0} << {1}',
+    'LSR': f'({{0}} & {EISA.WORD_MASK}) >> {{1}}',
+    'ASR': '{0} >> {1}',
+    'AND': '{0} & {1}',
+    'XOR': '{0} ^ {1}',
+    'ORR': '{0} | {1}',
+}
+
+
+class BasicBlock:
+    """a straight line run of instructions which has been translated into a python function
+    """
+    __slots__ = ('start', 'end', 'function')
+
+    start: int  # address of the first instruction
+    end: int  # address after the last instruction
+    # takes the registers, RAM, and pipeline, returns the next PC and the number of instructions executed
+    function: Callable[[List[int], List[int], PipeLine], Tuple[int, int]]
+
+    def __init__(self, start: int, end: int, function: Callable[[List[int], List[int], PipeLine], Tuple[int, int]]):
+        self.start = start
+        self.end = end
+        self.function = function
+
+
+class FunctionalCore:
+    """ISA level simulator which executes instructions directly, without modelling any pipeline or memory timing.
+
+    The core works directly on the architectural state of a pipeline (its registers, condition flags, and memory),
+    so after fast-forwarding through the uninteresting part of a program the pipeline can pick up exactly where
+    the core left off and continue cycle accurately.
+    """
+
+    _pipeline: PipeLine
+    _memory: MemorySubsystem
+
+    # cycles per instruction used to estimate how many cycles the pipeline would have taken
+    cpi: float
+
+    instructions: int  # number of instructions that have been executed
+    estimated_cycles: float
+    is_finished: bool  # True once an END instruction has been reached
+
+    _handlers: Dict[Type[Instruction], Callable[[DecodedInstruction], Optional[int]]]
+
+    # region translation cache
+    translate: bool  # whether hot basic blocks get translated
+    hot_threshold: int  # number of times a block has to be entered before it is translated
+    max_block_length: int
+
+    _blocks: Dict[int, BasicBlock]  # translated blocks, indexed by their starting address
+    _block_heat: Dict[int, int]  # number of times each untranslated block has been entered
+    _code_map: Dict[int, List[int]]  # maps each address covered by a translated block to the starting addresses of those blocks
+    _at_block_start: bool
+    # endregion translation cache
+
+    def __init__(self, pipeline: PipeLine, cpi: float = 1.0, translate: bool = True, hot_threshold: int = 2):
+        """creates a functional core which runs on the pipeline's architectural state
+
+        Parameters
+        ----------
+        pipeline : PipeLine
+            the pipeline to take the registers, flags, and memory from,
+            must not have any instructions in flight
+        cpi : float, optional
+            the average number of cycles per instruction, used for the cycle estimate, by default 1.0
+        translate : bool, optional
+            whether to translate hot basic blocks into python functions, by default True
+        hot_threshold : int, optional
+            the number of times a basic block has to be entered before it is translated, by default 2
+
+        Raises
+        ------
+        RuntimeError
+            if the pipeline still has instructions in flight, since their effects would be lost
+        """
+        if not pipeline.is_quiescent():
+            raise RuntimeError('Cannot start the functional core while the pipeline has instructions in flight')
+
+        self._pipeline = pipeline
+        self._memory = pipeline._memory
+        self.cpi = cpi
+
+        self.instructions = 0
+        self.estimated_cycles = 0
+        self.is_finished = False
+
+        self._handlers = {}
+
+        self.translate = translate
+        self.hot_threshold = hot_threshold
+        self.max_block_length = 64
+
+        self._blocks = {}
+        self._block_heat = {}
+        self._code_map = {}
+        self._at_block_start = True
+
+    @property
+    def pc(self) -> int:
+        return self._pipeline._pc
+
+    # region instruction semantics
+    def _handler(self, instruction_type: Type[Instruction]) -> Callable[[DecodedInstruction], Optional[int]]:
+        """finds the function which executes the passed instruction type,
+        mirroring the behavior the type has in the pipeline
+
+        Parameters
+        ----------
+        instruction_type : Type[Instruction]
+            an entry from the Instructions table
+
+        Returns
+        -------
+        Callable[[DecodedInstruction], Optional[int]]
+            function which executes the instruction and returns the address of the next instruction,
+            or None if execution should continue at the next sequential address
+        """
+        try:
+            return self._handlers[instruction_type]
+        except KeyError:
+            pass
+
+        handler = {
+            'CMP': self._execute_CMP,
+            'ALU': self._execute_ALU,
+            'B': self._execute_B,
+            'POP': self._execute_POP,
+            'LDR': self._execute_LDR,
+            'PUSH': self._execute_PUSH,
+            'STR': self._execute_STR,
+            'NOOP': lambda decoded: None
+        }[instruction_kind(instruction_type)]
+
+        self._handlers[instruction_type] = handler
+        return handler
+
+    def _execute_ALU(self, decoded: DecodedInstruction) -> None:
+        fields = decoded.fields
+        registers = self._pipeline._registers
+
+        val2 = fields['literal'] if fields['lit'] else registers[fields['op2']]
+        registers[fields['dest']] = decoded.instruction_type._ALU_func(registers[fields['op1']], val2)
+
+    def _execute_CMP(self, decoded: DecodedInstruction) -> None:
+        fields = decoded.fields
+        registers = self._pipeline._registers
+
+        res = decoded.instruction_type._CMP_func(registers[fields['op1']], registers[fields['op2']])
+        self._pipeline._nzcv = CMP_Instruction.compute_flags(res)
+
+    def _execute_B(self, decoded: DecodedInstruction) -> Optional[int]:
+        fields = decoded.fields
+
+        if not CONDITION_TABLE[fields['cond']][self._pipeline._nzcv]:
+            return None
+
+        decoded.instruction_type._on_branch(self._pipeline, self._pipeline._pc + 1)
+
+        if fields['imm']:
+            return fields['offset']
+        else:
+            return fields['offset'] + self._pipeline._registers[fields['base']]
+
+    def _address(self, fields: Dict[str, int]) -> int:
+        """calculates the address used by a load or store
+        """
+        if fields['imm'] == 1:
+            return fields['immediate']
+        else:
+            return self._pipeline._registers[fields['base']] + fields['offset']
+
+    def _store(self, address: int, value: int) -> bool:
+        """writes to memory on behalf of a store, 
+        dropping any decoded or translated instructions at the address
+
+        Returns
+        -------
+        bool
+            True if the store overwrote translated code
+        """
+        self._memory.poke(address, value)
+        self._pipeline.invalidate_decoded(address)
+
+        return self.invalidate_translations(address)
+
+    def _execute_LDR(self, decoded: DecodedInstruction) -> None:
+        fields = decoded.fields
+        self._pipeline._registers[fields['dest']] = self._memory.peek(self._address(fields))
+
+    def _execute_STR(self, decoded: DecodedInstruction) -> None:
+        fields = decoded.fields
+        dest_addr = self._address(fields)
+
+        self._store(dest_addr, self._pipeline._registers[fields['src']])
+
+    def _execute_POP(self, decoded: DecodedInstruction) -> None:
+        pipeline = self._pipeline
+        src_addr = pipeline.sp + 1
+
+        pipeline._registers[decoded.fields['dest']] = self._memory.peek(src_addr)
+        self._memory._RAM[src_addr] = 0
+        self.invalidate_translations(src_addr)
+
+        if pipeline.sp < int(SpecialRegister['bp']):
+            pipeline.sp += 1
+
+    def _execute_PUSH(self, decoded: DecodedInstruction) -> None:
+        pipeline = self._pipeline
+        src = decoded.fields['src']
+
+        self._store(pipeline.sp, pipeline._registers[src])
+
+        pipeline._registers[src] = 0
+        pipeline.sp -= 1
+    # endregion instruction semantics
+
+    def step(self) -> bool:
+        """executes a single instruction
+
+        Returns
+        -------
+        bool
+            True if an instruction was executed,
+            False if the program has reached an END instruction
+        """
+        pipeline = self._pipeline
+        pc = pipeline._pc % EISA.RAM_ADDR_SPACE
+
+        decoded = pipeline.predecode(pc, self._memory.peek(pc))
+
+        if decoded.opcode == 0b100000:  # END
+            self.is_finished = True
+            return False
+
+        pipeline._pc = pc
+        next_pc = self._handler(decoded.instruction_type)(decoded)
+        pipeline._pc = pc + 1 if next_pc is None else next_pc
+
+        # the instruction after a branch starts a new basic block, whether or not the branch was taken
+        self._at_block_start = issubclass(decoded.instruction_type, B_Instruction)
+
+        self.instructions += 1
+        self.estimated_cycles += self.cpi
+
+        return True
+
+    def run(
+        self,
+        until_pc: Optional[int] = None,
+        max_instructions: Optional[int] = None,
+        max_cycles: Optional[float] = None
+    ) -> int:
+        """executes instructions until one of the stop conditions is met, or the program reaches an END instruction
+
+        Parameters
+        ----------
+        until_pc : int, optional
+            stop before executing the instruction at this address
+        max_instructions : int, optional
+            the maximum number of instructions to execute
+        max_cycles : float, optional
+            stop once the estimated number of cycles reaches this value
+
+        Returns
+        -------
+        int
+            the number of instructions that were executed
+        """
+        start = self.instructions
+
+        instruction_limit = float('inf') if max_instructions is None else start + max_instructions
+        cycle_limit = float('inf') if max_cycles is None else max_cycles
+
+        pipeline = self._pipeline
+        registers = pipeline._registers
+        ram = self._memory._RAM._memory
+
+        while self.instructions < instruction_limit and self.estimated_cycles < cycle_limit:
+            pc = registers[SpecialRegister.pc] % EISA.RAM_ADDR_SPACE
+            if pc == until_pc:
+                break
+
+            if self._at_block_start and self.translate:
+                block = self._blocks.get(pc)
+
+                if block is None:
+                    heat = self._block_heat[pc] = self._block_heat.get(pc, 0) + 1
+                    if heat >= self.hot_threshold:
+                        block = self._translate(pc)
+
+                # only run the whole block if none of the stop conditions can be reached part way through it
+                if block is not None \
+                        and self.instructions + (block.end - block.start) <= instruction_limit \
+                        and self.estimated_cycles + (block.end - block.start - 1) * self.cpi < cycle_limit \
+                        and not (until_pc is not None and block.start < until_pc < block.end):
+                    next_pc, executed = block.function(registers, ram, pipeline)
+
+                    registers[SpecialRegister.pc] = next_pc
+                    self.instructions += executed
+                    self.estimated_cycles += executed * self.cpi
+                    continue
+
+            if not self.step():
+                break
+
+        return self.instructions - start
+
+    # region translation
+    def invalidate_translations(self, address: int) -> bool:
+        """drops every translated block containing the passed address,
+        needs to be called if memory holding code is changed by something other than the program itself
+
+        Parameters
+        ----------
+        address : int
+            the address that was written to
+
+        Returns
+        -------
+        bool
+            True if any translated blocks were dropped
+        """
+        starts = self._code_map.get(address)
+        if starts is None:
+            return False
+
+        for start in starts:
+            block = self._blocks.pop(start, None)
+            if block is None:
+                continue
+
+            for covered in range(block.start, block.end):
+                if (covered_starts := self._code_map.get(covered)) is not None and start in covered_starts:
+                    covered_starts.remove(start)
+                    if not covered_starts:
+                        del self._code_map[covered]
+
+        self._code_map.pop(address, None)
+        return True
+
+    def _translate(self, start: int) -> Optional[BasicBlock]:
+        """translates the basic block starting at the passed address into a python function, 
+        with the register numbers and literals baked in
+
+        Parameters
+        ----------
+        start : int
+            the address of the first instruction in the block
+
+        Returns
+        -------
+        BasicBlock
+            the translated block, which has been added to the translation cache
+        None
+            if the block is empty, ie. the block starts with an END instruction
+        """
+        pipeline = self._pipeline
+        ram = self._memory._RAM._memory
+
+        namespace: Dict[str, object] = {
+            'store': self._store,
+            'invalidate': self.invalidate_translations,
+            'code': self._code_map,
+            'compute_flags': CMP_Instruction.compute_flags,
+        }
+        lines = ['def block(R, M, P):']
+
+        pc = start
+        while pc - start < self.max_block_length and pc < EISA.RAM_ADDR_SPACE:
+            decoded = pipeline.predecode(pc, ram[pc])
+            if decoded.opcode == 0b100000:  # END
+                break
+
+            kind = instruction_kind(decoded.instruction_type)
+            fields = decoded.fields
+            executed = pc - start + 1  # number of instructions executed once this one is done
+
+            if kind == 'ALU':
+                op1 = f'R[{fields["op1"]}]'
+                op2 = f'{fields["literal"]}' if fields['lit'] else f'R[{fields["op2"]}]'
+
+                if (expression := _ALU_EXPRESSIONS.get(decoded.instruction_type.mnemonic)) is not None:
+                    lines.append(f'    R[{fields["dest"]}] = {expression.format(op1, op2)}')
+                else:
+                    namespace[f'alu_{pc}'] = decoded.instruction_type._ALU_func
+                    lines.append(f'    R[{fields["dest"]}] = alu_{pc}({op1}, {op2})')
+
+            elif kind == 'CMP':
+                namespace[f'cmp_{pc}'] = decoded.instruction_type._CMP_func
+                lines.append(f'    P._nzcv = compute_flags(cmp_{pc}(R[{fields["op1"]}], R[{fields["op2"]}]))')
+
+            elif kind == 'LDR' or kind == 'STR':
+                address = f'{fields["immediate"]}' if fields['imm'] == 1 else f'R[{fields["base"]}] + {fields["offset"]}'
+
+                if kind == 'LDR':
+                    lines.append(f'    R[{fields["dest"]}] = M[{address}]')
+                else:
+                    lines.append(f'    if store({address}, R[{fields["src"]}]):')
+                    lines.append(f'        return ({pc + 1}, {executed})')
+
+            elif kind == 'PUSH':
+                lines.append(f'    stored = store(R[{int(SpecialRegister.sp)}], R[{fields["src"]}])')
+                lines.append(f'    R[{fields["src"]}] = 0')
+                lines.append(f'    R[{int(SpecialRegister.sp)}] -= 1')
+                lines.append(f'    if stored:')
+                lines.append(f'        return ({pc + 1}, {executed})')
+
+            elif kind == 'POP':
+                lines.append(f'    address = R[{int(SpecialRegister.sp)}] + 1')
+                lines.append(f'    R[{fields["dest"]}] = M[address]')
+                lines.append(f'    M[address] = 0')
+                lines.append(f'    if R[{int(SpecialRegister.sp)}] < {int(SpecialRegister.bp)}:')
+                lines.append(f'        R[{int(SpecialRegister.sp)}] += 1')
+                lines.append(f'    if address in code:')
+                lines.append(f'        invalidate(address)')
+                lines.append(f'        return ({pc + 1}, {executed})')
+
+            elif kind == 'B':
+                namespace[f'taken_{pc}'] = CONDITION_TABLE[fields['cond']]
+                namespace[f'on_branch_{pc}'] = decoded.instruction_type._on_branch
+                target = f'{fields["offset"]}' if fields['imm'] else f'{fields["offset"]} + R[{fields["base"]}]'
+
+                lines.append(f'    if taken_{pc}[P._nzcv]:')
+                lines.append(f'        on_branch_{pc}(P, {pc + 1})')
+                lines.append(f'        return ({target}, {executed})')
+
+            pc += 1
+
+            if kind == 'B':
+                break
+
+        if pc == start:
+            return None
+
+        lines.append(f'    return ({pc}, {pc - start})')
+
+        exec(compile('\n'.join(lines), f'<block {start}>', 'exec'), namespace)
+
+        block = BasicBlock(start, pc, namespace['block'])  # type: ignore
+        self._blocks[start] = block
+        for address in range(block.start, block.end):
+            self._code_map.setdefault(address, []).append(start)
+
+        return block
+    # endregion translation
+
+    def switch_to_pipeline(self) -> PipeLine:
+        """hands the architectural state back to the pipeline so that it can continue cycle accurately
+        from the next instruction the functional core would have executed
+
+        Returns
+        -------
+        PipeLine
+            the pipeline, ready to be cycled
+        """
+        self._pipeline.flush(self._pipeline._pc)
+        return self._pipeline
+
+
+def fast_forward(
+    pipeline: PipeLine,
+    until_pc: Optional[int] = None,
+    max_instructions: Optional[int] = None,
+    max_cycles: Optional[float] = None,
+    cpi: float = 1.0,
+    translate: bool = True
+) -> FunctionalCore:
+    """runs a program functionally up to the region of interest, then switches back to the cycle accurate pipeline
+
+    Parameters
+    ----------
+    pipeline : PipeLine
+        the pipeline with the program loaded, must not have any instructions in flight
+    until_pc : int, optional
+        stop before executing the instruction at this address
+    max_instructions : int, optional
+        the maximum number of instructions to execute
+    max_cycles : float, optional
+        stop once the estimated number of cycles reaches this value
+    cpi : float, optional
+        the average number of cycles per instruction, used for the cycle estimate, by default 1.0
+    translate : bool, optional
+        whether to translate hot basic blocks into python functions, by default True
+
+    Returns
+    -------
+    FunctionalCore
+        the core that ran the program, with the instruction count and cycle estimate
+    """
+    core = FunctionalCore(pipeline, cpi, translate)
+    core.run(until_pc, max_instructions, max_cycles)
+    core.switch_to_pipeline()
+
+    return core
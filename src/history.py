@@ -0,0 +1,260 @@
+from __future__ import annotations
+from bisect import bisect_right
+from collections import deque
+from time import perf_counter
+from typing import Callable, Deque, Optional, Tuple
+import io
+import zlib
+
+from checkpoint import save_checkpoint, load_checkpoint
+from pipeline import PipeLine, RunResult, SpecialRegister, StopReason
+
+
+class History:
+    """a bounded log of the pipeline's past, so that it can be stepped backwards without re-running the program from the start.
+
+    while the pipeline is run through the history, a compressed checkpoint is taken every interval cycles.
+    going back to an earlier cycle restores the last checkpoint before it and replays forward from there,
+    which gives exactly the same state since the pipeline is deterministic.
+    once the checkpoints use more than budget bytes the oldest ones are dropped, which limits how far back the pipeline can go.
+
+    anything which changes the machine other than running it (ie. writing to memory from the debug terminal) has to call reset,
+    since replaying from a checkpoint taken before the change would undo it
+    """
+    pipeline: PipeLine
+    interval: int  # the number of cycles between checkpoints, and so the most cycles that have to be replayed to go back
+    budget: int  # the maximum number of bytes used by the checkpoints
+
+    _checkpoints: Deque[Tuple[int, bytes]]  # the cycle each checkpoint was taken at and the compressed checkpoint, oldest first
+    _size: int  # the number of bytes used by the checkpoints
+
+    def __init__(self, pipeline: PipeLine, interval: int = 1000, budget: int = 16 * 2**20):
+        """creates the history of a pipeline, starting from its current state
+
+        Parameters
+        ----------
+        pipeline : PipeLine
+            the pipeline to record, it has to be run through the history's cycle and run for its past to be recorded
+        interval : int, optional
+            the number of cycles between checkpoints, by default 1000
+        budget : int, optional
+            the maximum number of bytes the checkpoints can use, by default 16MiB
+        """
+        if interval < 1:
+            raise ValueError(f'checkpoint interval must be at least 1 cycle, got {interval}')
+
+        self.pipeline = pipeline
+        self.interval = interval
+        self.budget = budget
+
+        self.reset()
+
+    @property
+    def oldest_cycle(self) -> int:
+        """the earliest cycle that the pipeline can go back to
+        """
+        return self._checkpoints[0][0]
+
+    @property
+    def size(self) -> int:
+        """the number of bytes used by the checkpoints
+        """
+        return self._size
+
+    def reset(self) -> None:
+        """forgets the pipeline's past, the pipeline can only go back as far as its current state afterwards
+        """
+        self._checkpoints = deque()
+        self._size = 0
+        self._record()
+
+    # region checkpoints
+    def _record(self) -> None:
+        file = io.BytesIO()
+        save_checkpoint(self.pipeline, file)
+        data = zlib.compress(file.getvalue(), 1)
+
+        self._checkpoints.append((self.pipeline._cycles, data))
+        self._size += len(data)
+
+        # always keep the newest checkpoint, so that there is somewhere to replay from
+        while self._size > self.budget and len(self._checkpoints) > 1:
+            self._size -= len(self._checkpoints.popleft()[1])
+
+    def _restore(self, index: int) -> None:
+        load_checkpoint(io.BytesIO(zlib.decompress(self._checkpoints[index][1])), self.pipeline)
+
+    def _discard_after(self, index: int) -> None:
+        # the checkpoints after a restored one are from a future which is about to be run again
+        while len(self._checkpoints) > index + 1:
+            self._size -= len(self._checkpoints.pop()[1])
+
+    def _checkpoint_before(self, cycle: int) -> int:
+        # the index of the last checkpoint taken at or before the passed cycle
+        return bisect_right([checkpoint[0] for checkpoint in self._checkpoints], cycle) - 1
+
+    def _next_checkpoint(self) -> int:
+        return self._checkpoints[-1][0] + self.interval
+
+    # endregion checkpoints
+
+    # region forwards
+    def cycle(self, cycle_count: int) -> None:
+        """runs the pipeline for a number of cycles, recording checkpoints along the way, see PipeLine.cycle
+
+        Parameters
+        ----------
+        cycle_count : int
+            the number of cycles to run for
+        """
+        pipeline = self.pipeline
+
+        while cycle_count > 0:
+            if pipeline._cycles >= self._next_checkpoint():
+                self._record()
+
+            cycle_count -= pipeline.cycle_skipping(min(cycle_count, self._next_checkpoint() - pipeline._cycles))
+
+    def run(
+        self,
+        until_pc: Optional[int] = None,
+        max_cycles: Optional[int] = None,
+        max_instructions: Optional[int] = None,
+        predicate: Optional[Callable[[PipeLine], bool]] = None
+    ) -> RunResult:
+        """runs the pipeline until one of the stop conditions is met, recording checkpoints along the way, see PipeLine.run
+
+        Returns
+        -------
+        RunResult
+            why the pipeline stopped, and how much it ran
+        """
+        pipeline = self.pipeline
+
+        start_time = perf_counter()
+        start_cycles = pipeline._cycles
+        start_instructions = pipeline._instructions_retired
+
+        cycle_limit = start_cycles + int(max_cycles) if max_cycles is not None else None
+        instruction_limit = start_instructions + max_instructions if max_instructions is not None else None
+
+        # run in chunks that end at the next checkpoint
+        while True:
+            if pipeline._cycles >= self._next_checkpoint():
+                self._record()
+
+            chunk = self._next_checkpoint() - pipeline._cycles
+            if cycle_limit is not None:
+                chunk = min(chunk, cycle_limit - pipeline._cycles)
+
+            result = pipeline.run(
+                until_pc, chunk,
+                instruction_limit - pipeline._instructions_retired if instruction_limit is not None else None,
+                predicate
+            )
+
+            if result.stop_reason is not StopReason.CYCLES or (cycle_limit is not None and pipeline._cycles >= cycle_limit):
+                break
+
+        return RunResult(result.stop_reason, pipeline._cycles - start_cycles, pipeline._instructions_retired - start_instructions,
+                         perf_counter() - start_time)
+
+    # endregion forwards
+
+    # region backwards
+    def go_to(self, cycle: int) -> None:
+        """puts the pipeline in the state it was in at the start of the passed cycle
+
+        Parameters
+        ----------
+        cycle : int
+            the cycle to go to, which can be in the future
+
+        Raises
+        ------
+        ValueError
+            if the cycle is from before the oldest checkpoint
+        """
+        if cycle < self.oldest_cycle:
+            raise ValueError(f'can only go back as far as cycle {self.oldest_cycle}, the older history has been dropped to stay within budget')
+
+        # replay from the closest checkpoint, unless the pipeline is already between it and the cycle
+        index = self._checkpoint_before(cycle)
+        if not self._checkpoints[index][0] <= self.pipeline._cycles <= cycle:
+            self._restore(index)
+        self._discard_after(index)
+
+        self.cycle(cycle - self.pipeline._cycles)
+
+    def step_back(self, cycle_count: int) -> int:
+        """puts the pipeline back in the state it was in a number of cycles ago
+
+        Parameters
+        ----------
+        cycle_count : int
+            the number of cycles to go back, limited by how far back the history goes
+
+        Returns
+        -------
+        int
+            the cycle the pipeline went back to
+        """
+        cycle = max(self.pipeline._cycles - cycle_count, self.oldest_cycle)
+        self.go_to(cycle)
+        return cycle
+
+    def run_back(self, until_pc: int) -> Optional[int]:
+        """puts the pipeline back to the last time its program counter reached the passed address,
+        the reverse of PipeLine.run(until_pc=...)
+
+        Parameters
+        ----------
+        until_pc : int
+            the address to go back to
+
+        Returns
+        -------
+        Optional[int]
+            the cycle the pipeline went back to,
+            or None if the program counter didn't reach the address as far back as the history goes, which leaves the pipeline where it was
+        """
+        pipeline = self.pipeline
+        end = pipeline._cycles
+        found = None
+        # the start of the interval searched last, if the PC was already at the address there,
+        # which is only where it reached the address if it wasn't there the cycle before, at the end of the interval before
+        carried = None
+
+        # search each of the intervals between checkpoints, newest first, for the last cycle where the PC changed to the address
+        for index in reversed(range(self._checkpoint_before(end - 1) + 1)):
+            self._restore(index)
+            start = pipeline._cycles
+            stop = min(self._checkpoints[index + 1][0] if index + 1 < len(self._checkpoints) else end, end)
+
+            arrived = None
+            last_pc = None
+            while pipeline._cycles < stop:
+                pc = pipeline._registers[SpecialRegister.pc]
+                if pc == until_pc and last_pc != until_pc:
+                    arrived = pipeline._cycles
+
+                # the PC can't change while the pipeline is frozen, so skipping over stalls can't miss anything
+                last_pc = pc
+                pipeline.cycle_skipping(stop - pipeline._cycles)
+
+            if carried is not None and last_pc != until_pc:
+                found = carried
+                break
+            if arrived is not None and arrived > start:
+                found = arrived
+                break
+            carried = arrived
+
+        if found is None:
+            # the PC was at the address as far back as the history goes
+            found = carried
+
+        self.go_to(found if found is not None else end)
+        return found
+
+    # endregion backwards
@@ -2,7 +2,8 @@ from __future__ import annotations  # must be first import, allows type hinting
 
 from abc import ABC, abstractmethod  # Abstract Base Class
 from functools import reduce
-from typing import Union, Optional, Callable, Any
+from typing import Union, Optional, Callable, Any, List
+import random
 
 from tabulate import tabulate  # pip install tabulate
 
@@ -579,6 +580,46 @@ class Cache(MemoryDevice):
         except MemoryMissError:
             return False
 
+    def find_way(self, address: int) -> Optional[CacheWay]:
+        """looks up the cache way holding the passed address,
+        unlike get_cacheway this does not advance the block's replacement pointer on a miss
+
+        Parameters
+        ----------
+        address : int
+            the address to look up
+
+        Returns
+        -------
+        CacheWay
+            the way containing the address
+        None
+            if the address is not in the cache
+        """
+        for way in self._cache[((address >> 2) & ((len(self._cache))-1))].ways:
+            if way is not None and way.check_hit(address):
+                return way
+        return None
+
+    def holds(self, address: int) -> bool:
+        """checks if the address is in the cache, without advancing the block's replacement pointer
+        """
+        return self.find_way(address) is not None
+
+    def invalidate(self, address: int) -> bool:
+        """marks the way holding the address as invalid
+
+        Returns
+        -------
+        bool
+            True if the cache held the address
+        """
+        way = self.find_way(address)
+        if way is None:
+            return False
+        way._valid = False
+        return True
+
     def get_cacheway(self, address: int) -> CacheWay:
         """function to expose individual cache ways so that they can be viewed
 
@@ -608,6 +649,319 @@ class Cache(MemoryDevice):
         """
         return slice(address & ~(self._offset_space - 1), (address | (self._offset_space - 1)) + 1)
 
+"""the replacement policies of ArrayCache. round_robin is the one CacheBlock uses,
+where looking up an address which misses moves the pointer on as well as replacing a way.
+plru is tree pseudo LRU, which needs a power of 2 ways
+"""
+CACHE_POLICIES = ('round_robin', 'lru', 'plru', 'fifo', 'random')
+
+
+class ArrayCache(MemoryDevice):
+    """CPU cache with any number of sets, ways, and words per line,
+    held in flat lists rather than CacheBlock and CacheWay objects.
+    write-through
+    no allocate
+    has the same check_hit, replace, and offset_align as Cache, so it can be swapped in for it.
+    with the round_robin policy and 2 ways it behaves exactly like Cache
+
+    way w of set s is at index s * ways + w of the tag, valid, and dirty lists,
+    and its words start at index (s * ways + w) * line words of the data list
+    """
+
+    _sets: int
+    _ways: int
+    _line_words: int
+    _policy: str
+    _lru: bool
+    _plru: bool
+    _round_robin: bool
+
+    # worked out once, rather than on every access
+    _offset_size: int
+    _offset_mask: int
+    _index_mask: int
+    _tag_shift: int
+
+    _tags: List[int]
+    _valid: List[bool]
+    _dirty: List[bool]  # set by writes to a line, the cache is write-through so they are never written back
+    _data: List[int]
+
+    _pointers: List[int]  # the next way to replace in each set, for round_robin and fifo
+    _stamps: List[int]  # when each way was last used, for lru
+    _clock: int
+    _tree: List[int]  # the ways - 1 nodes of each set's tree, for plru. each node is 1 if the right half of its subtree is replaced next
+    _random: random.Random  # picks the way to replace, for random
+
+    _on_evict: Optional[Callable[[], Any]]
+
+    def __init__(
+        self,
+        local_addr_size: int,
+        offset_size: int,
+        next_device: MemoryDevice,
+        read_speed: int,
+        write_speed: int,
+        evict_cb: Optional[Callable[[], Any]]=None,
+        ways: int=2,
+        policy: str='lru',
+        seed: Optional[int]=0,
+    ):
+        """Constructor for a cache
+
+        Parameters
+        ----------
+        local_addr_size : int
+            the number of bits in each address's 'index' field
+            eg. 4 bits -> 16 sets
+        offset_size : int
+            the number of bits in each line's 'offset' field
+            eg. 2 bits -> 4 words per line
+        next_device : Memory Device
+            the next memory device in the memory subsystem hierarchy
+        read_speed : int
+            the number of cycles required to perform a read operation
+        write_speed : int
+            the number of cycles required to perform a write operation
+        evict_cb : Optional[Callable[[], Any]], optional
+            called every time a line is replaced, by default None
+        ways : int, optional
+            the number of ways in each set, by default 2
+        policy : str, optional
+            the replacement policy, one of CACHE_POLICIES, by default 'lru'
+        seed : Optional[int], optional
+            the seed of the random policy, by default 0
+
+        Raises
+        ------
+        ValueError
+            if the policy is unknown, or the geometry doesn't fit in an address
+        """
+        if policy not in CACHE_POLICIES:
+            raise ValueError(f'unknown replacement policy {policy}, expected one of {", ".join(CACHE_POLICIES)}')
+        if ways < 1:
+            raise ValueError(f'a cache needs at least one way, not {ways}')
+        if policy == 'plru' and ways & (ways - 1):
+            raise ValueError(f'the plru policy needs a power of 2 ways, not {ways}')
+        if local_addr_size + offset_size > EISA.ADDRESS_SIZE:
+            raise ValueError('index bits and offset bits are larger than the address size')
+
+        super().__init__(local_addr_size, next_device, read_speed, write_speed)
+        self._sets = 2**local_addr_size
+        self._ways = ways
+        self._line_words = 2**offset_size
+        self._policy = policy
+        self._lru = policy == 'lru'
+        self._plru = policy == 'plru'
+        self._round_robin = policy == 'round_robin'
+
+        self._offset_size = offset_size
+        self._offset_mask = self._line_words - 1
+        self._index_mask = self._sets - 1
+        self._tag_shift = offset_size + local_addr_size
+
+        lines = self._sets * ways
+        self._tags = [0] * lines
+        self._valid = [False] * lines
+        self._dirty = [False] * lines
+        self._data = [0] * (lines * self._line_words)
+
+        self._pointers = [0] * self._sets
+        self._stamps = [0] * lines
+        self._clock = 0
+        self._tree = [0] * (self._sets * (ways - 1))
+        self._random = random.Random(seed)
+
+        self._on_evict = evict_cb
+
+    def __str__(self, start: int=0, size: int=0) -> str:
+        """to string method, lists every way of the sets from start
+        """
+        if size == 0:
+            size = self._sets
+
+        stop = min(self._sets, start + size)
+
+        rows = []
+        for index in range(start, stop):
+            for line in range(index * self._ways, (index + 1) * self._ways):
+                rows.append([index, line - index * self._ways, int(self._valid[line]), f'{self._tags[line]:#x}',
+                             self._data[line * self._line_words:(line + 1) * self._line_words]])
+
+        s = tabulate(
+            rows,
+            headers=['Set', 'Way', 'Valid', 'Tag', 'Data'],
+            tablefmt='pretty',
+            stralign='left',
+            numalign='right'
+        )
+        return s
+
+    def _find(self, address: int) -> int:
+        # the line holding the address, -1 if it isn't cached
+        tag = address >> self._tag_shift
+        base = ((address >> self._offset_size) & self._index_mask) * self._ways
+        tags = self._tags
+        valid = self._valid
+        for line in range(base, base + self._ways):
+            if tags[line] == tag and valid[line]:
+                return line
+        return -1
+
+    def _missed(self, address: int) -> None:
+        # CacheBlock moves its pointer on every time it is asked for an address it doesn't hold
+        if self._round_robin:
+            index = (address >> self._offset_size) & self._index_mask
+            self._pointers[index] = (self._pointers[index] + 1) % self._ways
+
+    def _touch(self, line: int) -> None:
+        # records a use of the line for lru and plru
+        if self._lru:
+            self._clock += 1
+            self._stamps[line] = self._clock
+        elif self._plru:
+            ways = self._ways
+            index, way = divmod(line, ways)
+            tree = self._tree
+            base = index * (ways - 1)
+            node = 0
+            half = ways >> 1
+            # point every node on the way down at the other half
+            while half:
+                right = 1 if way & half else 0
+                tree[base + node] = 1 - right
+                node = 2 * node + 1 + right
+                half >>= 1
+
+    def _victim(self, index: int) -> int:
+        # the line of the set to replace
+        ways = self._ways
+        base = index * ways
+        if self._lru:
+            stamps = self._stamps
+            victim = base
+            for line in range(base + 1, base + ways):
+                if stamps[line] < stamps[victim]:
+                    victim = line
+            return victim
+        if self._plru:
+            tree = self._tree
+            tree_base = index * (ways - 1)
+            node = 0
+            way = 0
+            half = ways >> 1
+            while half:
+                right = tree[tree_base + node]
+                if right:
+                    way |= half
+                node = 2 * node + 1 + right
+                half >>= 1
+            return base + way
+        if self._policy == 'random':
+            valid = self._valid
+            for line in range(base, base + ways):
+                if not valid[line]:
+                    return line
+            return base + self._random.randrange(ways)
+
+        # round_robin and fifo
+        way = self._pointers[index]
+        self._pointers[index] = (way + 1) % ways
+        return base + way
+
+    # read
+    def __getitem__(self, address: int) -> int: # type: ignore
+        line = self._find(address)
+        if line < 0:
+            self._missed(address)
+            raise MemoryMissError('Read miss')
+
+        self._touch(line)
+        return self._data[line * self._line_words + (address & self._offset_mask)]
+
+    # write
+    def __setitem__(self, address: int, value: int) -> None:
+        line = self._find(address)
+        if line < 0:
+            self._missed(address)
+            raise MemoryMissError('Write miss')
+
+        self._touch(line)
+        self._data[line * self._line_words + (address & self._offset_mask)] = value
+        self._dirty[line] = True
+
+    # replace/evict
+    def replace(self, address_block: slice, data: int) -> None:
+        """loads a line into the cache, replacing a way of its set if the line isn't cached already
+
+        Parameters
+        ----------
+        address_block : slice
+            the addresses of the line, see offset_align
+        data : int
+            the words of the line, packed into a single integer with the first word in the lowest bits
+        """
+        address = address_block.start
+
+        if self._on_evict is not None:
+            self._on_evict()
+
+        line = self._find(address)
+        if line < 0:
+            line = self._victim((address >> self._offset_size) & self._index_mask)
+            self._tags[line] = address >> self._tag_shift
+
+        words = self._data
+        for i in range(line * self._line_words, (line + 1) * self._line_words):
+            words[i] = data & (EISA.WORD_SPACE - 1)
+            data >>= EISA.WORD_SIZE
+        self._valid[line] = True
+        self._dirty[line] = False
+        self._touch(line)
+
+    def check_hit(self, address: int) -> bool:
+        line = self._find(address)
+        if line < 0:
+            self._missed(address)
+            return False
+
+        self._touch(line)
+        return True
+
+    def holds(self, address: int) -> bool:
+        """checks if the address is in the cache, without counting as a use of the line
+        """
+        return self._find(address) >= 0
+
+    def invalidate(self, address: int) -> bool:
+        """marks the line holding the address as invalid
+
+        Returns
+        -------
+        bool
+            True if the cache held the address
+        """
+        line = self._find(address)
+        if line < 0:
+            return False
+        self._valid[line] = False
+        return True
+
+    def offset_align(self, address: int) -> slice:
+        """helper function that takes in an address and gives an offset-aligned slice
+
+        Parameters
+        ----------
+        address : int
+            the address to align
+
+        Returns
+        -------
+        int
+            a slice of addresses aligned to the cache's offset
+        """
+        return slice(address & ~self._offset_mask, (address | self._offset_mask) + 1)
+
 class RAM(MemoryDevice):
     def __getitem__(self, address: Union[int, slice]) -> int:
         """Reads the specified address/range of addresses from the memory and returns the stored value
@@ -1,6 +1,8 @@
 from __future__ import annotations  # must be first import
 from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Callable, List, Optional, Union
 from memory_devices import *
+import enum
 
 
 class PipelineStall(Exception):
@@ -12,9 +14,66 @@ class PipelineStall(Exception):
         return f'The pipeline has stalled due to \'{self.stage}\''
 
 
+class RequestStatus(enum.Enum):
+    PENDING = enum.auto()
+    DONE = enum.auto()
+
+
+class HitLevel(enum.IntEnum):
+    """the level of the memory hierarchy an access was served from
+    """
+    NONE = 0  # the instruction didn't access memory
+    L1 = 1
+    L2 = 2
+    RAM = 3
+
+
+class MemoryRequest:
+    """handle for a read or write that has been issued to the memory subsystem,
+    the memory subsystem only has a single read and a single write channel, 
+    so the same request is returned each time the channel is polled for the same address until it finishes.
+    the fetch stage and loads share the read channel: a read of another address waits for a load to finish,
+    but takes the channel from an instruction fetch, which starts again the next time it is polled, see MemorySubsystem.claim_read_channel
+    """
+    __slots__ = ('address', 'is_write', 'status', 'value', '_memory')
+
+    address: int  # the address that started the request
+    is_write: bool
+    status: RequestStatus
+    value: int  # the value read, or the value being written
+
+    _memory: MemorySubsystem
+
+    def __init__(self, memory: MemorySubsystem, address: int, is_write: bool, value: int = None): # type: ignore
+        self._memory = memory
+        self.address = address
+        self.is_write = is_write
+        self.status = RequestStatus.PENDING
+        self.value = value
+
+    @property
+    def ready(self) -> bool:
+        return self.status is RequestStatus.DONE
+
+    @property
+    def stalls_remaining(self) -> int:
+        """the number of times the request still has to be polled before it finishes, 
+        one poll happens for each stalled cycle
+        """
+        if self.status is RequestStatus.DONE:
+            return 0
+        elif self.is_write:
+            return self._memory.stalls_remaining_writing + 1
+        else:
+            return self._memory.stalls_remaining_reading + 1
+
+    def __repr__(self) -> str:
+        return f'MemoryRequest({"write" if self.is_write else "read"}, address={self.address}, status={self.status.name}, value={self.value})'
+
+
 class MemorySubsystem:
-    _cache: Cache
-    _cache2: Cache
+    _cache: Union[Cache, ArrayCache]
+    _cache2: Union[Cache, ArrayCache]
     _RAM: RAM
 
     _is_reading: bool
@@ -25,6 +84,11 @@ class MemorySubsystem:
     _future_read: Future
     _future_write: Future
 
+    # the requests currently using the read/write channels, None if the channel is free
+    _read_request: Optional[MemoryRequest]
+    _write_request: Optional[MemoryRequest]
+    _read_is_fetch: bool  # whether the read using the read channel is an instruction fetch
+
     # Int indicating what memory address is currently being read that is causing a stall
     # -> -1 if not waiting on any address currently
     waiting_on_reading: int
@@ -47,6 +111,10 @@ class MemorySubsystem:
     l2_hit: bool
     l2_hit_writing: bool
 
+    # called with the address, whether it is a write, and whether it is an instruction fetch, each time a read or write is started.
+    # it is called before the caches are looked up, so they still hold whatever they did before the access
+    on_access: Optional[Callable[[int, bool, bool], None]]
+
     def cache_evict_cb(self):
         return None
 
@@ -54,9 +122,12 @@ class MemorySubsystem:
             self,
             address_size: int,
             cache_size: int, cache_read_speed: int, cache_write_speed: int,
-            ram_size: int, ram_read_speed: int, ram_write_speed: int
+            ram_size: int, ram_read_speed: int, ram_write_speed: int,
+            ram: Optional[RAM] = None, cache2: Optional[Cache] = None
     ):
-        self._RAM = RAM(ram_size, None, ram_read_speed, ram_write_speed)
+        # ram and cache2 are shared with other memory subsystems when passed (ie. by each core of a MultiCore),
+        # rather than creating private ones, in which case the RAM parameters are ignored
+        self._RAM = RAM(ram_size, None, ram_read_speed, ram_write_speed) if ram is None else ram
         self._cache = Cache(cache_size, 2, self._RAM, cache_read_speed, cache_write_speed, self.cache_evict_cb)
 
         self._is_reading = False
@@ -66,8 +137,12 @@ class MemorySubsystem:
         self._future_write = None  # type: ignore
         self._io_executor = ThreadPoolExecutor(1, 'memory')
 
+        self._read_request = None
+        self._write_request = None
+
         self.waiting_on_reading = -1
         self.stalls_remaining_reading = 0
+        self._read_is_fetch = False
 
         self.waiting_on_writing = -1
         self.stalls_remaining_writing = 0
@@ -84,39 +159,99 @@ class MemorySubsystem:
         self.cache2_size_original = EISA.CACHE2_SIZE
         self.cache2_read_speed = EISA.CACHE2_READ_SPEED
         self.cache2_write_speed = EISA.CACHE2_WRITE_SPEED
-        self._cache2 = Cache(self.cache2_size_original, 2, self._RAM, self.cache2_read_speed, self.cache2_write_speed, self.cache_evict_cb, level=2)
+        if cache2 is None:
+            cache2 = Cache(self.cache2_size_original, 2, self._RAM, self.cache2_read_speed, self.cache2_write_speed, self.cache_evict_cb, level=2)
+        self._cache2 = cache2
         self.l1_hit = False
         self.l2_hit = False
         self.l2_hit_writing = False
         self.l1_hit_writing = False
 
-    # read
-    def __getitem__(self, address: int) -> int:
-        # run this section in a detached thread
-
-        '''
-        def get_func():
-            if not self._cache.check_hit(address):
-                # cache miss
-
-                # get a slice corresponding to the block of words stored in each cache way
-                address_block = self._cache.offset_align(address)
-                # load the value from RAM into cache
-                self._cache.replace(address_block, self._RAM[address_block]) # TODO: make the read from RAM use RAM's read policy rather than reading directly
+        self.on_access = None
+
+    def use_array_caches(self, ways: int = 2, policy: str = 'lru', cache_size: Optional[int] = None, cache2_size: Optional[int] = None) -> None:
+        """swaps both caches for empty ArrayCaches, with any associativity and replacement policy
+
+        Parameters
+        ----------
+        ways : int, optional
+            the number of ways in each set of both caches, by default 2
+        policy : str, optional
+            the replacement policy of both caches, see CACHE_POLICIES, by default 'lru'.
+            round_robin with 2 ways behaves the same as the default caches
+        cache_size : Optional[int], optional
+            the number of index bits of the L1 cache, by default None for the size the memory subsystem was created with
+        cache2_size : Optional[int], optional
+            the number of index bits of the L2 cache, by default None for the size the memory subsystem was created with
+        """
+        self._cache = ArrayCache(self.cache_size_original if cache_size is None else cache_size, 2, self._RAM,
+                                 self.cache_read_speed, self.cache_write_speed, self.cache_evict_cb, ways, policy)
+        self._cache2 = ArrayCache(self.cache2_size_original if cache2_size is None else cache2_size, 2, self._RAM,
+                                  self.cache2_read_speed, self.cache2_write_speed, self.cache_evict_cb, ways, policy)
 
-            return self._cache[address]
-        '''
+    # read
+    def claim_read_channel(self, address: int, fetch: bool = False) -> bool:
+        """makes way for a read of the passed address, when the read channel is being used to read another address.
+        loads go ahead of instruction fetches, and a fetch of another address means the fetch stage has moved on,
+        so an instruction fetch in progress is dropped, otherwise the caller has to wait for the read in progress to finish
+
+        Parameters
+        ----------
+        address : int
+            the address to read from
+        fetch : bool, optional
+            whether the read is an instruction fetch, by default False
+
+        Returns
+        -------
+        bool
+            False if the caller has to wait
+        """
+        request = self._read_request
+        if not self._is_reading or request is None or request.address == address:
+            return True
+        if not self._read_is_fetch:
+            return False
 
+        self._is_reading = False
+        self.waiting_on_reading = -1
+        self.stalls_remaining_reading = 0
+        self._read_request = None
+        return True
+
+    def read(self, address: int, fetch: bool = False) -> MemoryRequest:
+        """issues a read to the passed address, or polls the read that is already in progress.
+        each call corresponds to one cycle of the read, so this should be called once per cycle until the request is done
+
+        Parameters
+        ----------
+        address : int
+            the address to read from
+        fetch : bool, optional
+            whether the read is an instruction fetch, only passed on to on_access. by default False
+
+        Returns
+        -------
+        MemoryRequest
+            the request using the read channel, once its status is DONE the request's value holds the word at the passed address.
+            if a load of another address is using the channel, a pending request which isn't using it is returned instead,
+            see claim_read_channel
+        """
         # TODO - Should reads and writes be concurrent with one another? If not, check for both self._is_reading and
-        #   self._is_writing when either getitem or setitem is called
+        #   self._is_writing when either read or write is called
 
         # TODO - verify that cache hits require 1 extra cycle of read time (and thus send a single stall forward)
 
+        if not self.claim_read_channel(address, fetch):
+            return MemoryRequest(self, address, False)
+
         # only start a new read if there isnt one running already
         if not self._is_reading:
             self._is_reading = True
+            self._read_is_fetch = fetch
+            if self.on_access is not None:
+                self.on_access(address, False, fetch)
 
-            # self._future_read = self._io_executor.submit(get_func)
             if self.waiting_on_reading == -1:
                 if (not self.cache_enabled and not self.cache2_enabled) or (not self._cache.check_hit(address) and not self._cache2.check_hit(address)):
                     # cache miss
@@ -140,41 +275,76 @@ class MemorySubsystem:
             # set the address we are waiting on
             self.waiting_on_reading = address
 
-            # raise pipeline stall
-            raise PipelineStall('memory read')
+            self._read_request = MemoryRequest(self, address, False)
+            return self._read_request
 
-        if self._is_reading and self.stalls_remaining_reading > 0:  # TODO - optimize if-elif statement
+        request = self._read_request
+        if request is None:
+            # the read flags were set without going through read
+            request = self._read_request = MemoryRequest(self, address, False)
 
+        if self.stalls_remaining_reading > 0:
             # decrement the number of remaining number of stalled cycles
             self.stalls_remaining_reading -= 1
-            # return none if the read is still occurring
-            raise PipelineStall('memory read')
+            return request
+
+        # stall has finished
+
+        # TODO - Verify with Brendon that this is the correct way to evict
+        # get a slice corresponding to the block of words stored in each cache way
+        address_block = self._cache.offset_align(address)
+        # load the value from RAM into cache AND cache2
+        self._cache2.replace(address_block, self._RAM[address_block])
+        self._cache.replace(address_block, self._RAM[
+            address_block])  # TODO: make the read from RAM use RAM's read policy rather than reading directly
+        # reset reading flag
+        self._is_reading = False
+        # now there is no address we are waiting on
+        self.waiting_on_reading = -1
+        self._read_request = None
 
-        elif self._is_reading and self.stalls_remaining_reading == 0:
-            # stall has finished
+        request.status = RequestStatus.DONE
+        request.value = self._cache[address]
+        return request
 
-            # TODO - Verify with Brendon that this is the correct way to evict
-            # get a slice corresponding to the block of words stored in each cache way
-            address_block = self._cache.offset_align(address)
-            # load the value from RAM into cache AND cache2
-            self._cache2.replace(address_block, self._RAM[address_block])
-            self._cache.replace(address_block, self._RAM[
-                address_block])  # TODO: make the read from RAM use RAM's read policy rather than reading directly
-            # reset reading flag
-            self._is_reading = False
-            # now there is no address we are waiting on
-            self.waiting_on_reading = -1
+    def __getitem__(self, address: int) -> int:
+        """reads from the passed address, raising a PipelineStall until the read has finished, 
+        see read for the non-raising version
+
+        Raises
+        ------
+        PipelineStall
+            if the read has not finished yet
+        """
+        request = self.read(address)
+        if request.status is RequestStatus.PENDING:
+            raise PipelineStall('memory read')
 
-        # if no PipelineStall error is raised, return the value
-        return self._cache[address]
+        return request.value
 
     # write
-    def __setitem__(self, address: int, value: int) -> None:
+    def write(self, address: int, value: int) -> MemoryRequest:
+        """issues a write to the passed address, or polls the write that is already in progress.
+        each call corresponds to one cycle of the write, so this should be called once per cycle until the request is done
+
+        Parameters
+        ----------
+        address : int
+            the address to write to
+        value : int
+            the value to write
+
+        Returns
+        -------
+        MemoryRequest
+            the request using the write channel
+        """
         # only start a new write if there isn't one running already
         if not self._is_writing:
             self._is_writing = True
+            if self.on_access is not None:
+                self.on_access(address, True, False)
 
-            # self._future_write = self._io_executor.submit(set_func)
             if self.waiting_on_writing == -1:
                 if (not self.cache_enabled and not self.cache2_enabled) or not self._cache.check_hit(address) and not self._cache2.check_hit(address):
                     # cache miss
@@ -197,33 +367,132 @@ class MemorySubsystem:
             # set the address we are waiting on
             self.waiting_on_writing = address
 
-            # raise pipeline stall
-            raise PipelineStall('memory write')
+            self._write_request = MemoryRequest(self, address, True, value)
+            return self._write_request
 
-        if self._is_writing and self.stalls_remaining_writing > 0:
+        request = self._write_request
+        if request is None:
+            # the write flags were set without going through write
+            request = self._write_request = MemoryRequest(self, address, True, value)
 
+        if self.stalls_remaining_writing > 0:
             # decrement the number of remaining number of stalled cycles
             self.stalls_remaining_writing -= 1
-            # return none if the read is still occurring
+            return request
+
+        # set address in RAM to value, and if the write is a hit, write the value to cache as well
+        if not self._write_miss:
+            if self.l2_hit_writing:
+                self._cache2[address] = value
+                self._cache.replace(self._cache.offset_align(address), value)
+            else:
+                self._cache[address] = value
+                self._cache2.replace(self._cache.offset_align(address), value)
+        self._RAM[address] = value
+
+        # reset flags
+        self._is_writing = False
+        self.waiting_on_writing = -1
+        self._write_miss = False
+        self.l2_hit_writing = False
+        self._write_request = None
+
+        request.status = RequestStatus.DONE
+        request.value = value
+        return request
+
+    def __setitem__(self, address: int, value: int) -> None:
+        """writes to the passed address, raising a PipelineStall until the write has finished, 
+        see write for the non-raising version
+
+        Raises
+        ------
+        PipelineStall
+            if the write has not finished yet
+        """
+        if self.write(address, value).status is RequestStatus.PENDING:
             raise PipelineStall('memory write')
 
-        elif self._is_writing and self.stalls_remaining_writing == 0: # TODO - Optimize if-elif statements
+    # cache lookups
+    def l1_holds(self, address: int) -> bool:
+        """checks if the address is in the L1 cache, without touching the replacement pointers
+        """
+        return self.cache_enabled and self._cache.holds(address)
 
-            # set address in RAM to value, and if the write is a hit, write the value to cache as well
-            if not self._write_miss:
-                if self.l2_hit_writing:
-                    self._cache2[address] = value
-                    self._cache.replace(self._cache.offset_align(address), value)
-                else:
-                    self._cache[address] = value
-                    self._cache2.replace(self._cache.offset_align(address), value)
-            self._RAM[address] = value
-
-            # reset flags
-            self._is_writing = False
-            self.waiting_on_writing = -1
-            self._write_miss = False
-            self.l2_hit_writing = False
+    def goes_to_ram(self, address: int) -> bool:
+        """checks if an access to the address would miss in both caches, the same check read and write use
+        """
+        return (not self.cache_enabled and not self.cache2_enabled) \
+            or (not self._cache.holds(address) and not self._cache2.holds(address))
+
+    def hit_level(self, address: int) -> HitLevel:
+        """checks which level of the memory hierarchy holds the address, without touching the replacement pointers.
+        the caches are only filled once an access finishes, so this has to be checked before then
+        """
+        if self.l1_holds(address):
+            return HitLevel.L1
+        return HitLevel.RAM if self.goes_to_ram(address) else HitLevel.L2
+
+    # untimed accesses
+    def peek(self, address: int) -> int:
+        """reads a word without modelling any delays, used by the functional simulator.
+        the caches are write-through, so RAM always holds the up to date value
+
+        Parameters
+        ----------
+        address : int
+            the address to read
+
+        Returns
+        -------
+        int
+            the word stored at the address
+        """
+        return self._RAM[address]
+
+    def cached_line(self, address: int, count: int) -> List[int]:
+        """reads the words following the passed address from its L1 cache line without modelling any delays,
+        used for wide fetches once the read of the first word has brought the line into the cache.
+        stops at the end of the line, or at the first word that isn't in the L1 cache
+
+        Parameters
+        ----------
+        address : int
+            the address of the first word to read
+        count : int
+            the maximum number of words to read
+
+        Returns
+        -------
+        List[int]
+            the words that were read, which can be fewer than count
+        """
+        words = []
+        line = self._cache.offset_align(address)
+
+        for addr in range(address, min(address + count, line.stop)):
+            if not self.cache_enabled or not self._cache.holds(addr):
+                break
+            words.append(self._cache[addr])
+
+        return words
+
+    def poke(self, address: int, value: int) -> None:
+        """writes a word without modelling any delays, used by the functional simulator.
+        any cache line holding the address is updated so that the caches stay coherent with RAM
+
+        Parameters
+        ----------
+        address : int
+            the address to write to
+        value : int
+            the value to write
+        """
+        self._RAM[address] = value
+
+        for cache in (self._cache, self._cache2):
+            if cache.holds(address):
+                cache[address] = value
 
     def __enter__(self):
         pass
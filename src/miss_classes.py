@@ -0,0 +1,172 @@
+from __future__ import annotations
+from argparse import ArgumentParser
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Set
+import enum
+
+from tabulate import tabulate  # pip install tabulate
+
+from benchmark import pipeline_from_args
+from cache_trace import AccessTrace, CacheConfig, HierarchyConfig, TraceCache, TraceHierarchy, add_trace_arguments, record_trace
+from disassembler import disassemble
+from memory_subsystem import HitLevel
+
+
+class MissClass(enum.IntEnum):
+    """why an access missed a cache, the 3 Cs
+    """
+    COMPULSORY = 0  # the first access to the line at that level, which misses however big the cache is
+    CAPACITY = 1  # a fully associative LRU cache of the same size would have missed too
+    CONFLICT = 2  # a fully associative LRU cache of the same size would have hit, so the miss is down to the sets or the policy
+
+
+"""the levels misses are classified at, in the order their counts are stored
+"""
+LEVELS = ('L1', 'L2')
+
+
+class ShadowedCache(TraceCache):
+    """a cache which also sends every lookup and fill to a fully associative LRU cache of the same size,
+    and remembers every line it has been asked for
+    """
+    shadow: TraceCache
+    touched: Set[int]  # the lines which have been looked up or filled
+
+    def __init__(self, config: CacheConfig):
+        super().__init__(config)
+        self.shadow = TraceCache(CacheConfig(1, config.sets * config.ways, config.line_words, policy='lru'))
+        self.touched = set()
+
+    def lookup(self, address: int) -> bool:
+        self.shadow.lookup(address)
+        self.touched.add(address // self._line_words)
+        return super().lookup(address)
+
+    def fill(self, address: int) -> None:
+        self.shadow.fill(address)
+        self.touched.add(address // self._line_words)
+        super().fill(address)
+
+    def classify(self, address: int) -> MissClass:
+        """why an access to the address would miss, checked before the access is made
+        """
+        if address // self._line_words not in self.touched:
+            return MissClass.COMPULSORY
+        return MissClass.CONFLICT if self.shadow.holds(address) else MissClass.CAPACITY
+
+
+@dataclass
+class MissClassification:
+    """the misses of each level of a hierarchy, split into the 3 Cs
+    """
+    config: HierarchyConfig
+    accesses: int
+    misses: List[List[int]]  # the misses of each level, indexed by the position of the level in LEVELS then MissClass
+    by_pc: Dict[int, List[int]]  # the misses of each instruction, indexed by its address then by level * len(MissClass) + MissClass
+
+    def table(self) -> str:
+        """the misses of each level as a table
+        """
+        rows = [
+            [level, *counts, sum(counts), 100 * sum(counts) / self.accesses if self.accesses else 0.0]
+            for level, counts in zip(LEVELS, self.misses)
+        ]
+        return tabulate(rows, headers=['level', *(c.name.lower() for c in MissClass), 'total', '% of accesses'], floatfmt='.2f')
+
+    def pc_table(self, words: Optional[Sequence[int]] = None, top: Optional[int] = None) -> str:
+        """the misses of each instruction as a table, the instructions with the most misses first
+
+        Parameters
+        ----------
+        words : Optional[Sequence[int]], optional
+            the memory the program was run from, to disassemble the instructions, by default None to leave them out
+        top : Optional[int], optional
+            only list this many instructions, by default None to list all of them
+        """
+        pcs = sorted(self.by_pc, key=lambda pc: (-sum(self.by_pc[pc]), pc))
+        rows = [
+            [pc, disassemble(words[pc]) if words is not None and 0 <= pc < len(words) else '', *self.by_pc[pc]]
+            for pc in pcs[:top]
+        ]
+        headers = ['address', 'instruction'] + [f'{level} {c.name.lower()}' for level in LEVELS for c in MissClass]
+        return tabulate(rows, headers=headers)
+
+
+def classify_misses(trace: AccessTrace, config: Optional[HierarchyConfig] = None) -> MissClassification:
+    """replays a trace, classifying each L1 miss, and each L2 miss which went on to RAM, as compulsory, capacity, or conflict.
+
+    every cache is shadowed by a fully associative LRU cache of the same size which sees the same lookups and fills,
+    and a miss is a conflict miss if the shadow cache held the line. a miss is compulsory if it's the first time the level was asked for the line,
+    so a read after a write to a line which wasn't cached is a capacity miss, as writes which miss both levels don't allocate the line
+
+    Parameters
+    ----------
+    trace : AccessTrace
+        the accesses to classify, see cache_trace.replay
+    config : Optional[HierarchyConfig], optional
+        the caches to replay the trace through, by default None for the same caches as the MemorySubsystem
+
+    Returns
+    -------
+    MissClassification
+        the misses of each level, in total and by the address of the instruction making the access
+    """
+    if config is None:
+        config = HierarchyConfig()
+
+    hierarchy = TraceHierarchy(config)
+    l1 = hierarchy.l1 = ShadowedCache(config.l1)
+    l2 = hierarchy.l2 = ShadowedCache(config.l2) if config.l2 is not None else None
+
+    classes = len(MissClass)
+    misses = [[0 for c in MissClass] for level in LEVELS]
+    by_pc: Dict[int, List[int]] = {}
+
+    for kind, address, pc in zip(trace.kinds, trace.addresses, trace.pcs):
+        l1_class = l1.classify(address)
+        l2_class = l2.classify(address) if l2 is not None else None
+
+        level = hierarchy.access(kind, address)
+        if level == HitLevel.L1:
+            continue
+
+        counts = by_pc.get(pc)
+        if counts is None:
+            counts = by_pc[pc] = [0] * (len(LEVELS) * classes)
+
+        misses[0][l1_class] += 1
+        counts[l1_class] += 1
+        if level == HitLevel.RAM and l2_class is not None:
+            misses[1][l2_class] += 1
+            counts[classes + l2_class] += 1
+
+    return MissClassification(config, len(trace), misses, by_pc)
+
+
+if __name__ == '__main__':
+    arg_parse = ArgumentParser(description='splits the cache misses of a program into compulsory, capacity, and conflict misses')
+    add_trace_arguments(arg_parse)
+    arg_parse.add_argument('-n', type=int, default=20, dest='top',
+                           help='the number of instructions to list, which are left out when the trace is loaded with -t')
+    arg_parse.add_argument('--l1-ways', type=int, default=None,
+                           help='replay through an LRU L1 cache with this many ways and the same number of lines, rather than the default caches')
+
+    args = arg_parse.parse_args()
+
+    if args.trace is not None:
+        trace = AccessTrace.load(args.trace)
+        words = None
+    else:
+        pipeline = pipeline_from_args(args)
+        trace = record_trace(pipeline, args.max_cycles)
+        words = pipeline._memory._RAM._memory
+
+    config = HierarchyConfig()
+    if args.l1_ways is not None:
+        lines = config.l1.sets * config.l1.ways
+        config.l1 = CacheConfig(max(lines // args.l1_ways, 1), args.l1_ways, policy='lru')
+
+    result = classify_misses(trace, config)
+    print(f'{len(trace)} accesses through L1 {config.l1}, L2 {config.l2}\n')
+    print(result.table())
+    print(f'\nby instruction\n{result.pc_table(words, args.top)}')
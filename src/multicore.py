@@ -0,0 +1,376 @@
+from __future__ import annotations
+from argparse import ArgumentParser
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Set, Union
+import enum
+
+from tabulate import tabulate  # pip install tabulate
+
+from benchmark import add_program_arguments, make_pipeline, read_program, store_array
+from eisa import EISA
+from memory_devices import Cache, RAM
+from memory_subsystem import MemorySubsystem, MemoryRequest, RequestStatus
+from pipeline import PipeLine, OpCode, SpecialRegister
+
+
+class LineState(enum.Enum):
+    """the MSI state of a line in one core's L1 cache
+    """
+    MODIFIED = 'M'  # the only copy, which the core has written to
+    SHARED = 'S'  # possibly also in other cores' L1 caches
+    INVALID = 'I'  # not in the core's L1 cache
+
+
+@dataclass
+class CoherenceStats:
+    """the traffic on the bus shared by all the cores
+    """
+    bus_reads: int = 0  # reads which missed in the L1 cache
+    bus_upgrades: int = 0  # writes to a shared line, which invalidate the other copies
+    bus_writes: int = 0  # writes which missed in the L1 cache, which invalidate any copies in the other cores
+    invalidations: int = 0  # lines invalidated in another core's L1 cache
+    downgrades: int = 0  # modified lines made shared by another core reading them
+    ram_accesses: int = 0
+    ram_wait_cycles: int = 0  # cycles spent waiting for RAM to finish serving another core
+
+
+@dataclass
+class CoreStats:
+    reads: int = 0
+    read_misses: int = 0  # reads which had to go to the L2 cache or RAM
+    coherence_misses: int = 0  # read misses to a line that was invalidated by another core
+    writes: int = 0
+    finished_cycle: Optional[int] = None  # the cycle END reached the writeback stage, None if the core hasn't finished
+
+
+class CoreMemory(MemorySubsystem):
+    """a single core's view of the memory subsystem: a private L1 cache, in front of the L2 cache and RAM shared by every core.
+    timing is the same as the single core memory subsystem, apart from waiting for RAM while it serves another core
+    """
+    core: int
+    stats: CoreStats
+
+    _bus: CoherenceBus
+    _invalidated: Set[int]  # the lines invalidated by another core, which haven't been read since, see line
+
+    def __init__(self, bus: CoherenceBus, core: int, cache_size: int, cache_read_speed: int, cache_write_speed: int,
+                 cache2: Cache, ram: RAM):
+        super().__init__(EISA.ADDRESS_SIZE, cache_size, cache_read_speed, cache_write_speed,
+                         ram._local_addr_size, ram._read_speed, ram._write_speed, ram, cache2)
+
+        self.core = core
+        self.stats = CoreStats()
+
+        self._bus = bus
+        self._invalidated = set()
+
+    def line(self, address: int) -> int:
+        """gets the line holding the address in the L1 cache, as the address of the line's first word
+        """
+        return self._cache.offset_align(address).start
+
+    def read(self, address: int, fetch: bool = False) -> MemoryRequest:
+        if not self.claim_read_channel(address, fetch):
+            return MemoryRequest(self, address, False)
+
+        if self._is_reading:
+            request = super().read(address, fetch)
+            if request.status is RequestStatus.DONE:
+                self._bus.filled(self, address)
+            return request
+
+        wait = self._bus.read(self, address)
+        request = super().read(address, fetch)
+        self.stalls_remaining_reading += wait
+        return request
+
+    def write(self, address: int, value: int) -> MemoryRequest:
+        if self._is_writing:
+            request = super().write(address, value)
+            if request.status is RequestStatus.DONE:
+                self._bus.filled(self, address)
+            return request
+
+        wait = self._bus.write(self, address)
+        request = super().write(address, value)
+        self.stalls_remaining_writing += wait
+        return request
+
+
+class CoherenceBus:
+    """the snooping bus connecting the cores' L1 caches, which keeps them coherent with the MSI protocol.
+
+    the L1 caches are write-through and no allocate, the same as the single core memory subsystem,
+    so RAM always holds the latest value and a modified line doesn't have to be written back when it leaves the M state.
+    M instead means the core has the only copy, so further writes to the line don't have to go on the bus.
+    RAM serves one core at a time, but a core's own read and write can still overlap as they do on a single core
+    """
+    stats: CoherenceStats
+
+    _cores: List[CoreMemory]
+    _owners: Dict[int, CoreMemory]  # the core holding each modified line, see CoreMemory.line
+    _ram_busy: List[int]  # the cycle RAM finishes serving each core
+    _clock: Callable[[], int]  # gets the current cycle
+
+    def __init__(self, clock: Callable[[], int]):
+        self.stats = CoherenceStats()
+        self._cores = []
+        self._owners = {}
+        self._ram_busy = []
+        self._clock = clock
+
+    def attach(self, memory: CoreMemory) -> None:
+        self._cores.append(memory)
+        self._ram_busy.append(0)
+
+    def state(self, memory: CoreMemory, address: int) -> LineState:
+        """gets the MSI state of the line holding the address in a core's L1 cache
+        """
+        if not memory.l1_holds(address):
+            return LineState.INVALID
+        return LineState.MODIFIED if self._owners.get(memory.line(address)) is memory else LineState.SHARED
+
+    def read(self, memory: CoreMemory, address: int) -> int:
+        """snoops a read which is starting in one of the cores
+
+        Returns
+        -------
+        int
+            the number of cycles the read has to wait for RAM
+        """
+        line = memory.line(address)
+        memory.stats.reads += 1
+        if self.state(memory, address) is not LineState.INVALID:
+            return 0
+
+        self.stats.bus_reads += 1
+        memory.stats.read_misses += 1
+        if line in memory._invalidated:
+            memory._invalidated.discard(line)
+            memory.stats.coherence_misses += 1
+
+        owner = self._owners.get(line)
+        if owner is not None and owner is not memory:
+            # the owner's copy is already in RAM, since the caches are write-through
+            del self._owners[line]
+            self.stats.downgrades += 1
+
+        return self.reserve_ram(memory, memory._RAM._read_speed) if memory.goes_to_ram(address) else 0
+
+    def write(self, memory: CoreMemory, address: int) -> int:
+        """snoops a write which is starting in one of the cores
+
+        Returns
+        -------
+        int
+            the number of cycles the write has to wait for RAM
+        """
+        line = memory.line(address)
+        memory.stats.writes += 1
+
+        state = self.state(memory, address)
+        if state is LineState.SHARED:
+            self.stats.bus_upgrades += 1
+            self.invalidate(memory, address)
+            self._owners[line] = memory
+        elif state is LineState.INVALID:
+            # no allocate, so the line stays invalid in the writing core
+            self.stats.bus_writes += 1
+            self.invalidate(memory, address)
+            self._owners.pop(line, None)
+
+        return self.reserve_ram(memory, memory._RAM._write_speed) if memory.goes_to_ram(address) else 0
+
+    def filled(self, memory: CoreMemory, address: int) -> None:
+        """snoops an access finishing in one of the cores, which may have filled the line into its L1 cache.
+        the fill happens long after the access was snooped when it started, so another core can have upgraded the line to M in between,
+        in which case the line is downgraded to S, as it is now in both cores
+        """
+        line = memory.line(address)
+        owner = self._owners.get(line)
+        if owner is not None and owner is not memory and memory.l1_holds(address):
+            del self._owners[line]
+            self.stats.downgrades += 1
+
+    def invalidate(self, memory: CoreMemory, address: int) -> None:
+        """invalidates the line holding the address in every L1 cache other than the passed core's
+        """
+        for other in self._cores:
+            if other is memory or not other._cache.invalidate(address):
+                continue
+
+            other._invalidated.add(other.line(address))
+            self.stats.invalidations += 1
+
+    def reserve_ram(self, memory: CoreMemory, latency: int) -> int:
+        """reserves RAM for an access by one of the cores, once it finishes serving the other cores
+
+        Returns
+        -------
+        int
+            the number of cycles the access has to wait before RAM starts serving it
+        """
+        now = self._clock()
+        start = max([now] + [busy for other, busy in zip(self._cores, self._ram_busy) if other is not memory])
+        self._ram_busy[memory.core] = max(self._ram_busy[memory.core], start + latency)
+
+        self.stats.ram_accesses += 1
+        self.stats.ram_wait_cycles += start - now
+        return start - now
+
+
+class MultiCore:
+    """a machine with several cores, each with a private L1 cache, sharing an L2 cache and RAM kept coherent by a CoherenceBus.
+
+    every core starts at address 0 with its own stack, stack_size words apart, below the base pointer.
+    load a program into each core with load_program, cores can share a program by loading it once and pointing their PCs at it
+    """
+    cores: List[PipeLine]
+    bus: CoherenceBus
+    cycles: int
+
+    _RAM: RAM
+    _cache2: Cache
+
+    def __init__(
+        self,
+        num_cores: int,
+        pipeline_type: Callable[[int, List[int], MemorySubsystem], PipeLine] = PipeLine,
+        cache_size: int = EISA.CACHE_SIZE, cache_read_speed: int = EISA.CACHE_READ_SPEED, cache_write_speed: int = EISA.CACHE_WRITE_SPEED,
+        ram_read_speed: int = EISA.RAM_READ_SPEED, ram_write_speed: int = EISA.RAM_WRITE_SPEED,
+        stack_size: int = 256
+    ):
+        """creates a multi-core machine
+
+        Parameters
+        ----------
+        num_cores : int
+            the number of cores
+        pipeline_type : Callable[[int, List[int], MemorySubsystem], PipeLine], optional
+            creates each core's pipeline from the PC, registers, and memory subsystem, by default the in order PipeLine
+        cache_size, cache_read_speed, cache_write_speed : int, optional
+            the configuration of each core's L1 cache, by default the same as the single core machine
+        ram_read_speed, ram_write_speed : int, optional
+            the speed of the shared RAM, by default the same as the single core machine
+        stack_size : int, optional
+            the number of words between each core's stack, by default 256
+        """
+        if num_cores < 1:
+            raise ValueError(f'there has to be at least 1 core, got {num_cores}')
+
+        self.cycles = 0
+        self.bus = CoherenceBus(lambda: self.cycles)
+
+        self._RAM = RAM(EISA.RAM_SIZE, None, ram_read_speed, ram_write_speed)
+        self._cache2 = Cache(EISA.CACHE2_SIZE, 2, self._RAM, EISA.CACHE2_READ_SPEED, EISA.CACHE2_WRITE_SPEED, lambda: None, level=2)
+
+        self.cores = []
+        for core in range(num_cores):
+            memory = CoreMemory(self.bus, core, cache_size, cache_read_speed, cache_write_speed, self._cache2, self._RAM)
+            self.bus.attach(memory)
+
+            pipeline = pipeline_type(0, [0 for i in range(EISA.NUM_GP_REGS)], memory)
+            pipeline.sp = int(SpecialRegister.bp) - core * stack_size
+            self.cores.append(pipeline)
+
+    def load_program(self, core: int, program: Union[str, List[int]], address: int = 0) -> None:
+        """stores a program in RAM and points a core's PC at it
+
+        Parameters
+        ----------
+        core : int
+            the core to run the program
+        program : Union[str, List[int]]
+            the path to an assembled program, see benchmark.read_program, or the encoded instructions
+        address : int, optional
+            the address to store the program at, by default 0
+        """
+        if isinstance(program, str):
+            program = read_program(program)
+
+        for offset, word in enumerate(program):
+            self._RAM[address + offset] = word
+        self.cores[core]._pc = address
+
+    def is_finished(self, core: int) -> bool:
+        return self.cores[core]._pipeline[4].opcode == OpCode.END
+
+    def cycle(self) -> None:
+        """runs a single cycle of every core which hasn't finished, in order of their index
+        """
+        for core, pipeline in enumerate(self.cores):
+            if self.is_finished(core):
+                continue
+
+            pipeline.cycle_pipeline()
+            if self.is_finished(core):
+                pipeline._memory.stats.finished_cycle = self.cycles + 1
+
+        self.cycles += 1
+
+    def run(self, max_cycles: Optional[int] = None) -> int:
+        """runs every core until they have all finished
+
+        Parameters
+        ----------
+        max_cycles : Optional[int], optional
+            the maximum number of cycles to run for, by default None for no limit
+
+        Returns
+        -------
+        int
+            the number of cycles that were run
+        """
+        start = self.cycles
+        while not all(self.is_finished(core) for core in range(len(self.cores))):
+            if max_cycles is not None and self.cycles - start >= max_cycles:
+                break
+            self.cycle()
+
+        return self.cycles - start
+
+    def core_stats(self) -> List[Dict[str, float]]:
+        """gets the statistics of each core
+
+        Returns
+        -------
+        List[Dict[str, float]]
+            the statistics of each core, indexed by name
+        """
+        results = []
+        for pipeline in self.cores:
+            stats = pipeline._memory.stats
+            cycles = stats.finished_cycle if stats.finished_cycle is not None else self.cycles
+            results.append({
+                'cycles': cycles,
+                'instructions': pipeline._instructions_retired,
+                'instructions/cycle': pipeline._instructions_retired / max(cycles, 1),
+                'reads': stats.reads,
+                'read misses': stats.read_misses,
+                'coherence misses': stats.coherence_misses,
+                'writes': stats.writes,
+            })
+
+        return results
+
+
+if __name__ == '__main__':
+    arg_parse = ArgumentParser(description='runs the same program on every core of a multi-core machine, sharing RAM and the array after the program')
+    add_program_arguments(arg_parse)
+    arg_parse.add_argument('-n', type=int, default=2, dest='num_cores', help='the number of cores')
+
+    args = arg_parse.parse_args()
+
+    machine = MultiCore(args.num_cores,
+                        lambda pc, registers, memory: make_pipeline(memory, not args.no_pipe, args.forwarding, args.predictor))
+    program = read_program(args.program)
+    for core in range(args.num_cores):
+        machine.load_program(core, program)
+    if args.array_size > 0:
+        store_array(machine._RAM, len(program), args.array_size)
+    machine.run(args.max_cycles)
+
+    rows = machine.core_stats()
+    print(tabulate([[core] + list(stats.values()) for core, stats in enumerate(rows)], headers=['core'] + list(rows[0]), floatfmt='.3f'))
+    print()
+    print(tabulate(vars(machine.bus.stats).items(), headers=['bus', 'count']))
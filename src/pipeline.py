@@ -1,15 +1,20 @@
 from __future__ import annotations
 # from queue import *
 from collections import deque
-from typing import Dict, Type, Union, Callable, List, Optional, Any
+from collections.abc import Mapping, MutableMapping
+from dataclasses import dataclass
+from typing import Dict, Type, Union, Callable, List, Optional, Any, NamedTuple, Tuple
 from eisa import EISA
 from bit_vectors import BitVector
 from eisa import EISA
-from memory_subsystem import MemorySubsystem, PipelineStall
+from memory_subsystem import MemorySubsystem, RequestStatus
+from branch_predictor import BranchUnit, Prediction
+from cpi_stack import CPIStack
 # from clock import Clock
 # from clock import sleep
 from functools import reduce
 from threading import Lock
+from time import perf_counter
 import enum
 import aenum
 
@@ -45,6 +50,39 @@ class DecodeError(Exception):
         return self.message
 
 
+class StopReason(enum.Enum):
+    """why PipeLine.run stopped
+    """
+    END = enum.auto()  # an END instruction reached the writeback stage
+    PC = enum.auto()  # the program counter reached the target address
+    CYCLES = enum.auto()  # the cycle budget ran out
+    INSTRUCTIONS = enum.auto()  # the instruction budget ran out
+    PREDICATE = enum.auto()  # the user's predicate returned True
+
+
+@dataclass
+class RunResult:
+    stop_reason: StopReason
+    cycles: int  # number of cycles that were run
+    instructions: int  # number of instructions that were retired
+    elapsed: float  # host time taken, in seconds
+
+    @property
+    def cycles_per_second(self) -> float:
+        return self.cycles / self.elapsed if self.elapsed else float('inf')
+
+    def __str__(self) -> str:
+        return f'stopped on {self.stop_reason.name} after {self.cycles} cycles, {self.instructions} instructions, {self.elapsed:.3f}s'
+
+
+@dataclass
+class ForwardingStats:
+    dependency_stalls: int = 0  # cycles where the decode stage stalled waiting on a register
+    load_use_stalls: int = 0  # of those, cycles spent waiting on a result which had not been computed yet (ie. a load)
+    stalls_avoided: int = 0  # instructions that went through decode which would have stalled without forwarding
+    forwarded_operands: int = 0  # operands taken from an instruction which had not been written back yet
+
+
 class PipeLine(object):
     """The pipeline for the simulation
     """
@@ -64,15 +102,21 @@ class PipeLine(object):
     _fetch_isWaiting = False
 
     _cycles: int
+    _instructions_retired: int  # number of instructions, other than NOOPs, that have finished the writeback stage
 
-    # N, Z, C, V flags
-    condition_flags: Dict[str, bool]
+    # N, Z, C, V flags, packed into 4 bits with N as the most significant bit
+    _nzcv: int
 
     # region registers
     # general purpose registers
     _registers: list[int]  # TODO refactor '_registers' to 'registers'
     _active_registers: list[bool]
 
+    # the youngest instruction in flight that writes to each register, used instead of _active_registers when forwarding
+    _producers: list[Optional[Instruction]]
+    # the number of instructions in flight that would have claimed each register, only used for the forwarding stats
+    _register_uses: list[int]
+
     # AES registers
     # TODO
 
@@ -92,6 +136,20 @@ class PipeLine(object):
     '''
 
     yes_pipe: bool
+    skip_stalls: bool  # whether cycles where the pipeline is frozen waiting on memory are skipped over in one go
+    forwarding: bool  # whether results are forwarded to the instructions using them, should only be changed while the pipeline is empty
+    forwarding_stats: ForwardingStats
+    # predicts the address to fetch after each branch, if None fetching stops while a branch is executed instead. 
+    # should only be changed while the pipeline is empty
+    branch_unit: Optional[BranchUnit]
+    # attributes every cycle to what it was spent on, if None the cycles aren't attributed, see the cpi_stack property
+    _cpi_stack: Optional[CPIStack]
+    accounts_cycles: bool = True  # whether cycle_pipeline charges each cycle to the cpi_stack, subclasses with their own stages don't
+    # called with the pipeline and the instruction each time an instruction other than a NOOP is retired, after its writeback
+    on_retire: Optional[Callable[[PipeLine, Instruction], None]]
+
+    # decoded instructions, indexed by the address they were fetched from
+    _decode_cache: Dict[int, DecodedInstruction]
 
     # Has to be size 2
     _fd_reg: list[Instruction]  # Fetch/Decode reg
@@ -116,6 +174,8 @@ class PipeLine(object):
         # self._clock = Clock()
         self._registers = registers
         self._active_registers = [False for i in range(len(registers))]
+        self._producers = [None for i in range(len(registers))]
+        self._register_uses = [0 for i in range(len(registers))]
 
         self._pc = pc
         self.lr = 0
@@ -123,7 +183,7 @@ class PipeLine(object):
 
         self._memory = memory
 
-        self._pipeline = [Instruction(self) for i in range(5)]
+        self._pipeline = [NOOP for i in range(5)]
         self._pipeline_lock = Lock()
 
         self._stalled_fetch = False
@@ -135,18 +195,21 @@ class PipeLine(object):
 
         self._is_finished = False
 
-        self._fd_reg = [Instruction(self), Instruction(self)]
-        self._de_reg = [Instruction(self), Instruction(self)]
-        self._em_reg = [Instruction(self), Instruction(self)]
-        self._mw_reg = [Instruction(self), Instruction(self)]
+        self._fd_reg = [NOOP, NOOP]
+        self._de_reg = [NOOP, NOOP]
+        self._em_reg = [NOOP, NOOP]
+        self._mw_reg = [NOOP, NOOP]
+        self._decode_cache = {}
         self._cycles = 0
-        self.condition_flags = {
-            'n': False,
-            'z': False,
-            'c': False,
-            'v': False
-        }
+        self._instructions_retired = 0
+        self._nzcv = 0b0000
         self.yes_pipe = True
+        self.skip_stalls = True
+        self.forwarding = False
+        self.forwarding_stats = ForwardingStats()
+        self.branch_unit = None
+        self.cpi_stack = None
+        self.on_retire = None
 
     # region dependencies
     def check_active_dependency(self, reg_addr: Union[int, List[int]]) -> bool:
@@ -232,8 +295,122 @@ class PipeLine(object):
             for cur_reg_addr in reg_addr_list:
                 self._active_registers[cur_reg_addr] = False
 
+    def forwarding_sources(self, instruction: Instruction) -> Optional[Dict[int, Instruction]]:
+        """function that will tell the decode stage where each of the instruction's operands will come from when forwarding.
+        Results are forwarded from the execute and memory stages, so an instruction only has to stall if it uses a result 
+        in the execute stage that is not computed until the memory stage (ie. a load), or a result that is only known at writeback
+
+        Parameters
+        ----------
+        instruction : Instruction
+            the decoded instruction
+
+        Returns
+        -------
+        Optional[Dict[int, Instruction]]
+            the instructions in flight that produce the operands, indexed by register, 
+            operands which are not being produced by an instruction in flight are read from the registers.
+            None if the instruction has to stall
+        """
+        execute_reads, memory_reads, _ = instruction.register_usage()
+        producers = self._producers
+        sources = {}
+
+        for reg in execute_reads + memory_reads:
+            producer = producers[reg]
+            if producer is None:
+                continue
+
+            if not producer.forwardable:
+                return None
+
+            if producer.computed is None and reg in execute_reads:
+                # the result won't be ready in time for the execute stage, stall for a cycle
+                self.forwarding_stats.load_use_stalls += 1
+                return None
+
+            sources[reg] = producer
+
+        return sources
+
+    def claim_producer(self, instruction: Instruction) -> None:
+        """function that marks the instruction as the producer of the registers it writes to, 
+        so that the instructions after it take their operands from it
+
+        Parameters
+        ----------
+        instruction : Instruction
+            the instruction which has gone through decode
+        """
+        for reg in instruction.register_usage()[2]:
+            self._producers[reg] = instruction
+
+        register_uses = self._register_uses
+        dependencies = instruction.dependencies()
+        if any(register_uses[reg] for reg in dependencies):
+            self.forwarding_stats.stalls_avoided += 1
+        for reg in dependencies:
+            register_uses[reg] += 1
+
+    def free_producer(self, instruction: Instruction) -> None:
+        """function that clears the instruction as the producer of the registers it writes to, once they've been written back
+
+        Parameters
+        ----------
+        instruction : Instruction
+            the instruction which has gone through writeback
+        """
+        producers = self._producers
+        for reg in instruction.register_usage()[2]:
+            if producers[reg] is instruction:
+                producers[reg] = None
+
+        register_uses = self._register_uses
+        for reg in instruction.dependencies():
+            if register_uses[reg] > 0:
+                register_uses[reg] -= 1
+
     # endregion dependencies
 
+    # region decode cache
+    def predecode(self, address: int, encoded: int) -> DecodedInstruction:
+        """gets the decoded form of the instruction stored at the passed address,
+        only decoding the instruction if it is not already in the decode cache
+
+        Parameters
+        ----------
+        address : int
+            the address the instruction was fetched from
+        encoded : int
+            the encoded bits that were fetched,
+            used to catch instructions which were changed without going through a store (ie. loading a new program)
+
+        Returns
+        -------
+        DecodedInstruction
+            the cached decode result for the instruction
+        """
+        entry = self._decode_cache.get(address)
+
+        if entry is None or entry.encoded != encoded:
+            entry = DecodedInstruction(encoded)
+            self._decode_cache[address] = entry
+
+        return entry
+
+    def invalidate_decoded(self, address: int) -> None:
+        """removes the decoded instruction at the passed address from the decode cache,
+        called whenever a store writes to an address, since it may be overwriting an instruction
+
+        Parameters
+        ----------
+        address : int
+            the address that was written to
+        """
+        self._decode_cache.pop(address % EISA.RAM_ADDR_SPACE, None)
+
+    # endregion decode cache
+
     # Destination of new program counter
     def squash(self, newPC: int) -> None:
         """function that squashed the pipeline on a branch and updates the program counter
@@ -243,10 +420,12 @@ class PipeLine(object):
         newPC : int
             the new value of the program counter
         """
-        self._pipeline[0] = Instruction(self)
-        self._pipeline[1] = Instruction(self)
-        self._fd_reg = [Instruction(self), Instruction(self)]
-        self._de_reg = [Instruction(self), Instruction(self)]
+        self._pipeline[0] = NOOP
+        self._pipeline[1] = NOOP
+        self._fd_reg[0] = self._fd_reg[1] = NOOP
+        self._de_reg[0] = self._de_reg[1] = NOOP
+        if self.cpi_stack is not None:
+            self.cpi_stack.squash(self)
         self._pc = newPC #- 1  # NOTE - Max added -1 here because fetch increments the PC at the end of the cycle, so
                               #   so the -1 prevents ending up 1 word past where we're supposed to branch to
 
@@ -257,6 +436,52 @@ class PipeLine(object):
 
         self.free_dependency(active_regs)
 
+    def flush(self, pc: int) -> None:
+        """empties every stage of the pipeline and restarts fetching from the passed address,
+        the registers, condition flags, and memory are left untouched
+
+        Parameters
+        ----------
+        pc : int
+            the address of the next instruction to fetch
+        """
+        self._pipeline = [NOOP for i in range(5)]
+        self._fd_reg = [NOOP, NOOP]
+        self._de_reg = [NOOP, NOOP]
+        self._em_reg = [NOOP, NOOP]
+        self._mw_reg = [NOOP, NOOP]
+
+        self._stalled_fetch = False
+        self._stalled_memory = False
+        self._dependency_stall = False
+        self._start_stall = False
+        self._stall_finished = False
+        self._fetch_isWaiting = False
+        self._is_finished = False
+
+        self.free_dependency(list(range(len(self._active_registers))))
+        self._producers = [None for i in range(len(self._registers))]
+        self._register_uses = [0 for i in range(len(self._registers))]
+        self._pc = pc
+
+        if self.cpi_stack is not None:
+            self.cpi_stack.flush()
+
+    def is_quiescent(self) -> bool:
+        """checks if there are no instructions in flight, 
+        meaning the architectural state (registers, flags, memory, and PC) completely describes the machine
+
+        Returns
+        -------
+        bool
+            True if every stage and every stage register holds a NOOP, and no memory access is in progress
+        """
+        stage_regs = self._fd_reg + self._de_reg + self._em_reg + self._mw_reg
+
+        return self.check_empty_pipeline() \
+            and all(i.opcode == 0 for i in stage_regs) \
+            and not self._memory._is_reading and not self._memory._is_writing
+
     def check_empty_pipeline(self):
         for i in self._pipeline:
             if i.opcode != 0:
@@ -267,10 +492,10 @@ class PipeLine(object):
         """function to run the fetch stage
         """
 
-        instruction = Instruction(self)
+        instruction = NOOP
 
         # Send NOOP forward from fetch if the pipeline is disabled and the pipeline is not empty
-        if ((not self.yes_pipe) and (not self.check_empty_pipeline())) or (self._pipeline[2].opcode == 30): # TODO - figure out a way to check whether a branch was taken or not to reduce how much this happens.
+        if ((not self.yes_pipe) and (not self.check_empty_pipeline())) or (self.branch_unit is None and self._pipeline[2].opcode == 30):
             self._pipeline[0] = instruction
             self._fd_reg[0] = instruction
             return
@@ -281,12 +506,13 @@ class PipeLine(object):
 
         # Load instruction in MEMORY at the address the PC is pointing to
         if not self._is_finished and not self._fetch_isWaiting:
-            try:
-                instruction = Instruction(self, encoded=self._memory[self._pc % EISA.RAM_ADDR_SPACE])
-            except PipelineStall:
+            fetch_addr = self._pc % EISA.RAM_ADDR_SPACE
+            request = self._memory.read(fetch_addr, fetch=True)
+            if request.status is RequestStatus.PENDING:
                 # instruction = Instruction() # send noop forward on a pipeline stall
                 self._stalled_fetch = True
             else:
+                instruction = NOOP if request.value == 0 else Instruction.from_decoded(self, self.predecode(fetch_addr, request.value), fetch_addr)
                 self._stalled_fetch = False
                 self._fetch_isWaiting = True
 
@@ -294,7 +520,12 @@ class PipeLine(object):
 
         if not self._stalled_fetch and not self._stalled_memory and not self._dependency_stall and not self._is_finished:
             self._fd_reg[0] = instruction
-            self._pc += 1
+            if self.branch_unit is not None and isinstance(instruction, B_Instruction):
+                # keep fetching from wherever the branch is predicted to go
+                instruction.prediction = self.branch_unit.predict(self._pc % EISA.RAM_ADDR_SPACE, *instruction.branch_kind())
+                self._pc = instruction.prediction.next_pc
+            else:
+                self._pc += 1
             self._fetch_isWaiting = False
 
     def stage_decode(self) -> None:
@@ -308,22 +539,40 @@ class PipeLine(object):
 
         self._pipeline[1] = instruction
 
-        # Decode the instruction
-        instruction.__class__ = Instructions[instruction.opcode] # TODO, this is probably a violation of the Geneva convention
-        instruction.decode()
+        # Decode the instruction, the shared NOOP is already decoded
+        # instructions are created with the type matching their opcode when they are fetched
+        if instruction is not NOOP:
+            instruction.decode()
 
         # if the instruction is END, flag the pipeline to tell it to not load anymore instructions
-        if instruction['opcode'] == 0b100000:
+        if instruction.opcode == 0b100000:
             self._de_reg[0] = instruction
             self._is_finished = True
             return
 
         if not self._stalled_memory:
+            if self.forwarding:
+                sources = self.forwarding_sources(instruction)
+                if sources is None:
+                    self._de_reg[0] = NOOP  # stall, pass forward NoOp
+                    self._dependency_stall = True
+                    self.forwarding_stats.dependency_stalls += 1
+                else:
+                    # can proceed, taking the operands from the instructions in flight
+                    if instruction is not NOOP:
+                        instruction._sources = sources or None
+                        self.forwarding_stats.forwarded_operands += len(sources)
+                        self.claim_producer(instruction)
+                    self._de_reg[0] = instruction
+                    self._dependency_stall = False
+                return
+
             dependencies = instruction.dependencies()
             if self.check_active_dependency(dependencies):
                 # waiting for another instruction to release the dependency
-                self._de_reg[0] = Instruction(self)  # stall, pass forward NoOp
+                self._de_reg[0] = NOOP  # stall, pass forward NoOp
                 self._dependency_stall = True
+                self.forwarding_stats.dependency_stalls += 1
             else:
                 # can proceed
                 self.claim_dependency(dependencies)
@@ -345,7 +594,7 @@ class PipeLine(object):
         # https://en.wikipedia.org/wiki/Classic_RISC_pipeline
 
         # run the execute stage
-        instruction.execute_stage_func()
+        STAGE_HANDLERS[instruction.opcode].execute(instruction)
 
         # Push edited instruction into the adjacent queue
         self._em_reg[0] = instruction
@@ -362,9 +611,7 @@ class PipeLine(object):
         self._pipeline[3] = instruction
 
         # run the memory stage
-        try:
-            instruction.memory_stage_func()
-        except PipelineStall:
+        if not STAGE_HANDLERS[instruction.opcode].memory(instruction):
             if not self._stalled_memory:
                 self._start_stall = True
 
@@ -372,7 +619,7 @@ class PipeLine(object):
             #    self._fetch_isWaiting = True
 
             # instruction = Instruction() # send a NOOP forward
-            self._mw_reg[0] = Instruction(self)
+            self._mw_reg[0] = NOOP
         else:
             self._mw_reg[0] = instruction
             if self._stalled_memory:
@@ -392,21 +639,30 @@ class PipeLine(object):
 
         self._pipeline[4] = instruction
 
-        # run the memory stage
-        instruction.writeback_stage_func()
+        # run the writeback stage
+        STAGE_HANDLERS[instruction.opcode].writeback(instruction)
+        if instruction.opcode != 0:
+            self._instructions_retired += 1
+            if self.on_retire is not None:
+                self.on_retire(self, instruction)
 
         # free the dependencies
         self.free_dependency(instruction.dependencies())
+        if self.forwarding and instruction is not NOOP:
+            self.free_producer(instruction)
 
     def cycle_stage_regs(self):
         """function to advance the instructions within the dual registers between each pipeline stage
         """
-        self._mw_reg = [self._em_reg[1], self._mw_reg[0]]
+        # the registers are shifted in place, so nothing gets allocated each cycle
+        fd_reg, de_reg, em_reg, mw_reg = self._fd_reg, self._de_reg, self._em_reg, self._mw_reg
+
+        mw_reg[0], mw_reg[1] = em_reg[1], mw_reg[0]
         if not self._stalled_memory:
-            self._em_reg = [self._de_reg[1], self._em_reg[0]]
-            self._de_reg = [self._fd_reg[1], self._de_reg[0]]
+            em_reg[0], em_reg[1] = de_reg[1], em_reg[0]
+            de_reg[0], de_reg[1] = fd_reg[1], de_reg[0]
             # if not self._stalled_memory and not self._dependency_stall:
-            self._fd_reg = [Instruction(self), self._fd_reg[0]]
+            fd_reg[0], fd_reg[1] = NOOP, fd_reg[0]
 
     def cycle_pipeline(self):
         """function to run a single cycle of the pipeline - NOT THREADSAFE -> Call cycle(int cycles) instead
@@ -426,10 +682,17 @@ class PipeLine(object):
         self.stage_decode()
         # self._de_reg = [self._fd_reg[1], self._de_reg[0]]
 
+        cpi_stack = self.cpi_stack
+        if cpi_stack is not None:
+            cpi_stack.before_fetch(self)
+
         self.stage_fetch()
 
         # self._fd_reg = [Instruction(), self._fd_reg[0]]
 
+        if cpi_stack is not None:
+            cpi_stack.account(self)
+
         self.cycle_stage_regs()
 
         # Memory stall flags during cycles
@@ -447,6 +710,97 @@ class PipeLine(object):
         self._cycles += 1
         # self.cycle_stage_regs()
 
+    def _frozen_state(self) -> tuple:
+        """captures everything that decides how the next cycle will behave, 
+        apart from the values of the memory stall counters
+
+        Returns
+        -------
+        tuple
+            the state of the pipeline, which can be compared against the state from another cycle
+        """
+        memory = self._memory
+
+        # the same instruction can be in multiple slots, so which slots share an instance has to be recorded as well
+        slots = [*self._pipeline, *self._fd_reg, *self._de_reg, *self._em_reg, *self._mw_reg]
+        first_slot: Dict[int, int] = {}
+        instructions = tuple(
+            (first_slot.setdefault(id(instruction), i), type(instruction), instruction._encoded, instruction.computed, instruction._decoded is None)
+            for i, instruction in enumerate(slots)
+        )
+
+        return (
+            instructions,
+            tuple(self._registers),
+            tuple(self._active_registers),
+            self.forwarding, self.forwarding_stats.dependency_stalls,
+            self._nzcv,
+            self._instructions_retired,
+            self._stalled_fetch, self._stalled_memory, self._dependency_stall, self._start_stall, self._stall_finished,
+            self._fetch_isWaiting, self._is_finished,
+            memory._is_reading, memory._is_writing, memory.waiting_on_reading, memory.waiting_on_writing, memory._read_is_fetch,
+            memory._write_miss, memory.l2_hit, memory.l2_hit_writing,
+            self.cpi_stack.frozen_state() if self.cpi_stack is not None else None
+        )
+
+    def cycle_skipping(self, max_cycles: int = 1) -> int:
+        """runs a single cycle of the pipeline, 
+        and if the pipeline is frozen, skips ahead over all the following cycles where it would stay frozen.
+        the pipeline is frozen when the only thing changing between cycles are the memory stall counters, 
+        eg. while waiting on a read from RAM, or when only NOOPs are left after the program has finished
+
+        the memory subsystem only looks at whether the stall counters are 0, 
+        so each skipped cycle is exactly what cycle_pipeline would have done
+
+        Parameters
+        ----------
+        max_cycles : int, optional
+            the maximum number of cycles to run, by default 1
+
+        Returns
+        -------
+        int
+            the number of cycles that were run, between 1 and max_cycles
+        """
+        memory = self._memory
+
+        # only bother checking when there is something that could leave the pipeline frozen for a while
+        if not self.skip_stalls or max_cycles <= 1 or not (
+            (memory._is_reading and memory.stalls_remaining_reading > 1)
+            or (memory._is_writing and memory.stalls_remaining_writing > 1)
+            or self._is_finished
+        ):
+            self.cycle_pipeline()
+            return 1
+
+        state = self._frozen_state()
+        reads_remaining = memory.stalls_remaining_reading
+        writes_remaining = memory.stalls_remaining_writing
+
+        self.cycle_pipeline()
+
+        if self._frozen_state() != state:
+            return 1
+
+        # the fetch and memory stages share the read counter, so it can go down by 2 each cycle when both read the same address
+        read_step = reads_remaining - memory.stalls_remaining_reading
+        write_step = writes_remaining - memory.stalls_remaining_writing
+
+        # each skipped cycle needs to start with enough stalls remaining that none of the reads/writes finish
+        skipped = int(max_cycles) - 1
+        if read_step > 0:
+            skipped = min(skipped, memory.stalls_remaining_reading // read_step)
+        if write_step > 0:
+            skipped = min(skipped, memory.stalls_remaining_writing // write_step)
+
+        memory.stalls_remaining_reading -= skipped * read_step
+        memory.stalls_remaining_writing -= skipped * write_step
+        self._cycles += skipped
+        if self.cpi_stack is not None:
+            self.cpi_stack.repeat(skipped)
+
+        return 1 + skipped
+
     def cycle(self, cycle_count: int):
         """run the pipeline for a number of cycles
 
@@ -457,8 +811,94 @@ class PipeLine(object):
         """
 
         # only allow the pipeline to be run in a single thread
-        for i in range(cycle_count):
-            self.cycle_pipeline()
+        while cycle_count > 0:
+            cycle_count -= self.cycle_skipping(cycle_count)
+
+    def run(
+        self,
+        until_pc: Optional[int] = None,
+        max_cycles: Optional[int] = None,
+        max_instructions: Optional[int] = None,
+        predicate: Optional[Callable[[PipeLine], bool]] = None
+    ) -> RunResult:
+        """runs the pipeline until an END instruction reaches the writeback stage, or until one of the other stop conditions is met
+
+        Parameters
+        ----------
+        until_pc : int, optional
+            stop once the program counter reaches this address, before the instruction there is fetched
+        max_cycles : int, optional
+            the maximum number of cycles to run for
+        max_instructions : int, optional
+            the maximum number of instructions to retire
+        predicate : Callable[[PipeLine], bool], optional
+            checked before every cycle, stops the pipeline once it returns True. 
+            frozen stalls are not skipped over when a predicate is used, so it sees every cycle
+
+        Returns
+        -------
+        RunResult
+            why the pipeline stopped, and how much it ran
+        """
+        start_time = perf_counter()
+        start_cycles = self._cycles
+        start_instructions = self._instructions_retired
+
+        cycle_limit = start_cycles + int(max_cycles) if max_cycles is not None else None
+        instruction_limit = start_instructions + max_instructions if max_instructions is not None else None
+
+        # none of the stop conditions other than the cycle budget can change while the pipeline is frozen,
+        # so stalls can be skipped over unless there is a predicate which needs to see every cycle.
+        # the stall counters limit how far each skip goes, so without a budget any limit longer than a stall will do
+        skip = predicate is None
+        skip_limit = EISA.RAM_READ_SPEED + EISA.RAM_WRITE_SPEED
+
+        while True:
+            if self._pipeline[4].opcode == 0b100000:
+                stop_reason = StopReason.END
+            elif until_pc is not None and self._registers[SpecialRegister.pc] == until_pc:
+                stop_reason = StopReason.PC
+            elif cycle_limit is not None and self._cycles >= cycle_limit:
+                stop_reason = StopReason.CYCLES
+            elif instruction_limit is not None and self._instructions_retired >= instruction_limit:
+                stop_reason = StopReason.INSTRUCTIONS
+            elif predicate is not None and predicate(self):
+                stop_reason = StopReason.PREDICATE
+            else:
+                if not skip:
+                    self.cycle_pipeline()
+                elif cycle_limit is not None:
+                    self.cycle_skipping(cycle_limit - self._cycles)
+                else:
+                    self.cycle_skipping(skip_limit)
+                continue
+
+            break
+
+        return RunResult(stop_reason, self._cycles - start_cycles, self._instructions_retired - start_instructions, perf_counter() - start_time)
+
+    @property
+    def cpi_stack(self) -> Optional[CPIStack]:
+        """attributes every cycle to what it was spent on, if None the cycles aren't attributed.
+        only pipelines which account their cycles take one, setting it on any other raises a ValueError
+        """
+        return self._cpi_stack
+
+    @cpi_stack.setter
+    def cpi_stack(self, cpi_stack: Optional[CPIStack]) -> None:
+        if cpi_stack is not None and not self.accounts_cycles:
+            raise ValueError(f'{type(self).__name__} does not account its cycles to a CPI stack, only PipeLine does')
+        self._cpi_stack = cpi_stack
+
+    @property
+    def condition_flags(self) -> ConditionFlags:
+        """the N, Z, C, V flags as a dictionary, which reads and writes the packed flags
+        """
+        return ConditionFlags(self)
+
+    @condition_flags.setter
+    def condition_flags(self, condition_flags: Mapping[str, bool]) -> None:
+        self._nzcv = pack_flags(condition_flags)
 
     def __str__(self) -> str:
         """pipeline to string function
@@ -563,6 +1003,135 @@ class ConditionCode(enum.IntEnum):
     AL = 0b1110  # 14: AL meaning Always. If there is no conditional part in assembler this encoding is used.
     # NV = 0b1111 # NV meaning Never; this is historical and deprecated, but for ARMv3 it meant never. Ie a nop. For newer ARMs (ARMv5+), this extends the op-code range.
 
+# the bit for each of the condition flags when they are packed into an int
+FLAG_BITS: Dict[str, int] = {
+    'n': 0b1000,
+    'z': 0b0100,
+    'c': 0b0010,
+    'v': 0b0001
+}
+
+def pack_flags(condition_flags: Mapping[str, bool]) -> int:
+    """packs a dictionary of N, Z, C, V flags into a 4 bit int
+
+    Parameters
+    ----------
+    condition_flags : Mapping[str, bool]
+        the flags to pack
+
+    Returns
+    -------
+    int
+        the packed flags, with N as the most significant bit
+    """
+    packed = 0b0000
+    for flag, bit in FLAG_BITS.items():
+        if condition_flags[flag]:
+            packed |= bit
+
+    return packed
+
+class ConditionFlags(MutableMapping):
+    """dictionary view of a pipeline's packed N, Z, C, V flags
+    """
+    __slots__ = ('_pipeline',)
+
+    def __init__(self, pipeline: PipeLine):
+        self._pipeline = pipeline
+
+    def __getitem__(self, flag: str) -> bool:
+        return bool(self._pipeline._nzcv & FLAG_BITS[flag])
+
+    def __setitem__(self, flag: str, value: bool) -> None:
+        bit = FLAG_BITS[flag]
+        self._pipeline._nzcv = (self._pipeline._nzcv | bit) if value else (self._pipeline._nzcv & ~bit)
+
+    def __delitem__(self, flag: str) -> None:
+        raise TypeError('condition flags cannot be removed')
+
+    def __iter__(self):
+        return iter(FLAG_BITS)
+
+    def __len__(self) -> int:
+        return len(FLAG_BITS)
+
+    def __repr__(self) -> str:
+        return repr(dict(self))
+
+# defines all the different ways of evaluating the different condition codes, in terms of the N, Z, C, V flags
+_condition_funcs: Dict[ConditionCode, Callable[[bool, bool, bool, bool], bool]] = {
+    ConditionCode.EQ: lambda n, z, c, v: z,
+    ConditionCode.NE: lambda n, z, c, v: not z,
+    ConditionCode.CS: lambda n, z, c, v: c,
+    ConditionCode.CC: lambda n, z, c, v: not c,
+    ConditionCode.MI: lambda n, z, c, v: n,
+    ConditionCode.PL: lambda n, z, c, v: not n,
+    ConditionCode.VS: lambda n, z, c, v: v,
+    ConditionCode.VC: lambda n, z, c, v: not v,
+    ConditionCode.HI: lambda n, z, c, v: c and not z,
+    ConditionCode.LS: lambda n, z, c, v: not c or z,
+    ConditionCode.GE: lambda n, z, c, v: n == v,
+    ConditionCode.LT: lambda n, z, c, v: n != v,
+    ConditionCode.GT: lambda n, z, c, v: not z and n == v,
+    ConditionCode.LE: lambda n, z, c, v: z or n != v,
+    ConditionCode.AL: lambda n, z, c, v: True
+}
+
+"""whether each condition code passes, indexed by the condition code and then the packed flags
+"""
+CONDITION_TABLE: List[Tuple[bool, ...]] = [
+    tuple(
+        bool(_condition_funcs[cond](*(bool(nzcv & bit) for bit in FLAG_BITS.values())))
+        for nzcv in range(16)
+    )
+    for cond in ConditionCode
+]
+
+class DecodedInstruction:
+    """the immutable result of decoding an instruction word,
+    shared between every instance of an instruction fetched from the same address so that loops only have to be decoded once
+    """
+    __slots__ = ('encoded', 'opcode', 'instruction_type', 'decoded', 'fields', 'output_reg', 'input_regs', 'dependencies',
+                 'execute_reads', 'memory_reads', 'writes')
+
+    encoded: int
+    opcode: int
+    instruction_type: Type[Instruction]  # determines the instruction's behavior in each of the stages
+    decoded: BitVector
+    fields: Dict[str, int]
+    output_reg: Optional[int]
+    input_regs: tuple[int, ...]
+    dependencies: tuple[int, ...]
+
+    # the registers actually read in the execute and memory stages, and written in writeback, used for forwarding
+    execute_reads: tuple[int, ...]
+    memory_reads: tuple[int, ...]
+    writes: tuple[int, ...]
+
+    def __init__(self, encoded: int):
+        """decodes the passed instruction word
+
+        Parameters
+        ----------
+        encoded : int
+            the encoded bits corresponding to the instruction
+        """
+        self.encoded = encoded
+        self.opcode = Instruction.encoding(encoded)['opcode']
+        self.instruction_type = Instructions[self.opcode]
+        self.decoded = self.instruction_type.encoding(encoded)
+        self.fields = {field: self.decoded[field] for field in self.decoded._fields}
+
+        # same ordering as Instruction.decode
+        self.output_reg = self.fields.get('dest')
+        self.input_regs = tuple(self.fields[field] for field in ('src', 'op2', 'op1') if field in self.fields)
+
+        d_regs = list(self.input_regs)
+        d_regs.append(self.output_reg) if self.output_reg is not None else None
+        self.dependencies = tuple(set(d_regs))
+
+        self.execute_reads, self.memory_reads, self.writes = self.instruction_type.registers_used(self.fields)
+
 # TODO refactor InstructionType into the Instruction class
 class Instruction:
     """class for an instance of an instruction, 
@@ -580,11 +1149,25 @@ class Instruction:
 
     _encoded: int
     _decoded: BitVector  # will be none, until the instruction has been decoded
+    _predecoded: Optional[DecodedInstruction]  # cached decode result, if the instruction was fetched by the pipeline
 
     # values for dependencies, defaults to None if there are no dependencies
     output_reg: int  # register that the instruction writes to
     input_regs: List[int]  # list of registers that the instruction reads from
 
+    # the instructions in flight that operands are forwarded from, indexed by register, None if nothing is forwarded
+    _sources: Optional[Dict[int, Instruction]]
+
+    # what the fetch stage predicted about the branch, None unless the instruction is a branch fetched with a branch unit
+    prediction: Optional[Prediction]
+
+    address: int  # the address the instruction was fetched from, -1 if it wasn't fetched by the pipeline
+
+    # the address accessed in the memory stage, -1 if the instruction hasn't accessed memory,
+    # and the level of the memory hierarchy which held it when the access started, an int of HitLevel
+    mem_address: int
+    hit_level: int
+
     _pipeline: PipeLine
     # endregion instance vars
 
@@ -616,6 +1199,7 @@ class Instruction:
 
         self._encoded = 0b0 if encoded is None else encoded  # sets instruction to NOOP if encoded value is not specified
         self._decoded = None  # type: ignore
+        self._predecoded = None
 
         # calculate the opcode
         self.opcode = type(self).encoding(self._encoded)['opcode']
@@ -624,11 +1208,62 @@ class Instruction:
         self.output_reg = None  # type: ignore
         self.input_regs = []  # type: ignore
         self.computed = None  # type: ignore
+        self._sources = None
+        self.prediction = None
+        self.address = -1
+        self.mem_address = -1
+        self.hit_level = 0
+
+    @classmethod
+    def from_decoded(cls, pipeline: PipeLine, predecoded: DecodedInstruction, address: int = -1) -> Instruction:
+        """creates a new instance of an instruction from a cached decode result, 
+        skips building a bit vector just to get the opcode
+
+        Parameters
+        ----------
+        pipeline : PipeLine
+            a reference to the pipeline which the instruction will be handled by
+        predecoded : DecodedInstruction
+            the decode result for the instruction's encoded bits
+        address : int, optional
+            the address the instruction was fetched from, by default -1
+
+        Returns
+        -------
+        Instruction
+            the new instruction, which still needs to go through the decode stage
+        """
+        instruction_type = predecoded.instruction_type
+        instruction = instruction_type.__new__(instruction_type)
+
+        instruction._scoreboard_index = -1
+        instruction._pipeline = pipeline
+        instruction._encoded = predecoded.encoded
+        instruction._decoded = None  # type: ignore
+        instruction._predecoded = predecoded
+        instruction.opcode = predecoded.opcode
+        instruction.output_reg = None  # type: ignore
+        instruction.input_regs = []  # type: ignore
+        instruction.computed = None  # type: ignore
+        instruction._sources = None
+        instruction.prediction = None
+        instruction.address = address
+        instruction.mem_address = -1
+        instruction.hit_level = 0
+
+        return instruction
 
     def decode(self) -> None:
         """helper function which decodes the instruction
         """
 
+        # reuse the cached decode result if there is one
+        if (predecoded := self._predecoded) is not None:
+            self._decoded = predecoded.decoded
+            self.output_reg = predecoded.output_reg  # type: ignore
+            self.input_regs = list(predecoded.input_regs)
+            return
+
         # parse the rest of the encoded information according to the specific encoding pattern of the instruction type
         self._decoded = type(self).encoding(self._encoded)
 
@@ -652,12 +1287,45 @@ class Instruction:
         List[int]
             the list of registers that the instruction will read/write 
         """
+        if self._predecoded is not None and self._decoded is not None:
+            return list(self._predecoded.dependencies)
 
         d_regs = self.input_regs.copy()
         d_regs.append(self.output_reg) if self.output_reg is not None else None
 
         return list(set(d_regs))
 
+    def register_usage(self) -> Tuple[Tuple[int, ...], Tuple[int, ...], Tuple[int, ...]]:
+        """gets the registers the instruction reads in the execute and memory stages, and writes in the writeback stage, 
+        see registers_used
+        """
+        if (predecoded := self._predecoded) is not None:
+            return predecoded.execute_reads, predecoded.memory_reads, predecoded.writes
+
+        if self._decoded is None:
+            raise DecodeError()
+
+        return type(self).registers_used({field: self._decoded[field] for field in self._decoded._fields})
+
+    def read_register(self, reg: int) -> int:
+        """gets the value of one of the instruction's operands, 
+        either forwarded from the instruction producing it or read from the register
+
+        Parameters
+        ----------
+        reg : int
+            the register to read
+
+        Returns
+        -------
+        int
+            the value of the register as seen by this instruction
+        """
+        if (sources := self._sources) is not None and reg in sources:
+            return sources[reg].computed
+
+        return self._pipeline._registers[reg]
+
     def try_get(self, field: str) -> int:
         """tries to get the value from the specified field
 
@@ -710,6 +1378,8 @@ class Instruction:
         # Commented the error out for easier use with UI
         if self._decoded is None:
             raise DecodeError(f'{self._encoded} has not been decoded yet')
+        elif self._predecoded is not None and field in self._predecoded.fields:
+            return self._predecoded.fields[field]
         else:
             return self._decoded[field]
 
@@ -731,6 +1401,10 @@ class Instruction:
         if self._decoded is None:
             raise DecodeError
         else:
+            if self._predecoded is not None:
+                # the cached decode result is shared, so make a private copy before modifying it
+                self._decoded = type(self._decoded)(self._decoded._bits)
+                self._predecoded = None
             self._decoded[field] = value
 
     def execute_stage_func(self) -> None:
@@ -745,7 +1419,7 @@ class Instruction:
         """
         pass
 
-    def memory_stage_func(self) -> None:
+    def memory_stage_func(self) -> bool:
         """the defines the behavior of the instruction in the memory stage
 
         Parameters
@@ -754,8 +1428,13 @@ class Instruction:
             reference to the instruction's values
         pipeline : PipeLine
             reference to the pipeline that the instruction is from
+
+        Returns
+        -------
+        bool
+            True if the memory stage has finished, False if it is still waiting on memory
         """
-        pass
+        return True
 
     def writeback_stage_func(self) -> None:
         """the defines the behavior of the instruction in the writeback stage
@@ -772,6 +1451,10 @@ class Instruction:
     # region class vars
     mnemonic: str = ''
 
+    # whether the instruction's result can be forwarded from the computed field, 
+    # rather than only being available once it has been written back
+    forwardable: bool = True
+
     encoding: BitVector = BitVector.create_subtype('InstructionEncoding', 32)
     encoding.add_field('opcode', 26, 6)
     # endregion class vars
@@ -784,6 +1467,24 @@ class Instruction:
     @classmethod
     def fields(cls) -> List[str]:
         return cls.encoding.keys()
+
+    @classmethod
+    def registers_used(cls, fields: Dict[str, int]) -> Tuple[Tuple[int, ...], Tuple[int, ...], Tuple[int, ...]]:
+        """gets the registers which an instruction of this type actually reads and writes, 
+        unlike dependencies which has every register field
+
+        Parameters
+        ----------
+        fields : Dict[str, int]
+            the decoded fields of the instruction
+
+        Returns
+        -------
+        Tuple[Tuple[int, ...], Tuple[int, ...], Tuple[int, ...]]
+            the registers read in the execute stage, the registers read in the memory stage, 
+            and the registers written in the writeback stage
+        """
+        return (), (), ()
  #FIXME: change immediate field to a literal field
 class ALU_Instruction(Instruction):
     encoding = Instruction.encoding.create_subtype('InstructionEncoding', 32)
@@ -805,17 +1506,23 @@ class ALU_Instruction(Instruction):
             '_ALU_func': ALU_func
         })
 
+    @classmethod
+    def registers_used(cls, fields: Dict[str, int]) -> Tuple[Tuple[int, ...], Tuple[int, ...], Tuple[int, ...]]:
+        if fields['lit']:
+            return (fields['op1'],), (), (fields['dest'],)
+        return (fields['op1'], fields['op2']), (), (fields['dest'],)
+
     def execute_stage_func(self) -> None:
         """get's the two operands and performs the ALU operation
         """
-        val1 = self._pipeline.get_dependency(self['op1'])
+        val1 = self.read_register(self['op1'])
 
         if self['lit']:
             # immediate value used
             val2 = self['literal']
         else:
             # register direct
-            val2 = self._pipeline.get_dependency(self['op2'])
+            val2 = self.read_register(self['op2'])
 
         self.computed = type(self)._ALU_func(val1, val2)
 
@@ -839,23 +1546,61 @@ class CMP_Instruction(ALU_Instruction):
             '_CMP_func': CMP_func
         })
 
-    def execute_stage_func(self) -> None:
-        """performs the specified ALU operation, and uses the result to set the pipeline's condition flags
+    @classmethod
+    def registers_used(cls, fields: Dict[str, int]) -> Tuple[Tuple[int, ...], Tuple[int, ...], Tuple[int, ...]]:
+        # CMP always compares two registers
+        return (fields['op1'], fields['op2']), (), ()
+
+    @staticmethod
+    def compute_flags(res: int) -> int:
+        """calculates the N, Z, C, V condition flags for the result of a comparison
+
+        Parameters
+        ----------
+        res : int
+            the result of the comparison
+
+        Returns
+        -------
+        int
+            the packed flags, see FLAG_BITS
         """
-        res = type(self)._CMP_func(self._pipeline._registers[self['op1']], self._pipeline._registers[self['op2']])
+        nzcv = 0b0000
+
+        if res & (0b1 << (EISA.WORD_SIZE - 1)):  # gets the sign bit (bit 31)
+            nzcv |= FLAG_BITS['n']
+        if res == 0:
+            nzcv |= FLAG_BITS['z']
+        if res >= EISA.WORD_SPACE:
+            nzcv |= FLAG_BITS['c']
+
+        # signed overflow, either less than the minimum signed value or greater than the maximum signed value
+        if res <= -2 ** (EISA.WORD_SIZE - 1) or res >= 2 ** (EISA.WORD_SIZE - 1):
+            nzcv |= FLAG_BITS['v']
 
-        self._pipeline.condition_flags['n'] = bool(res & (0b1 << (EISA.WORD_SIZE - 1)))  # gets the sign bit (bit 31)
-        self._pipeline.condition_flags['z'] = res == 0
-        self._pipeline.condition_flags['c'] = res >= EISA.WORD_SPACE
+        return nzcv
 
-        # I know this isn't very ~boolean zen~ but it's more readable so stfu
-        signed_overflow = False
-        if res <= -2 ** (EISA.WORD_SIZE - 1):  # less than the minimum signed value
-            signed_overflow = True
-        elif res >= 2 ** (EISA.WORD_SIZE - 1):  # greater than the maximum signed value
-            signed_overflow = True
+    @staticmethod
+    def update_flags(condition_flags: MutableMapping[str, bool], res: int) -> None:
+        """sets the N, Z, C, V condition flags according to the result of a comparison
 
-        self._pipeline.condition_flags['v'] = signed_overflow
+        Parameters
+        ----------
+        condition_flags : MutableMapping[str, bool]
+            the condition flags to update
+        res : int
+            the result of the comparison
+        """
+        nzcv = CMP_Instruction.compute_flags(res)
+        for flag, bit in FLAG_BITS.items():
+            condition_flags[flag] = bool(nzcv & bit)
+
+    def execute_stage_func(self) -> None:
+        """performs the specified ALU operation, and uses the result to set the pipeline's condition flags
+        """
+        res = type(self)._CMP_func(self.read_register(self['op1']), self.read_register(self['op2']))
+
+        self._pipeline._nzcv = CMP_Instruction.compute_flags(res)
 
     # override inherited function because CMP does not writeback it's result
     def writeback_stage_func(self) -> None:
@@ -875,70 +1620,131 @@ class B_Instruction(Instruction):
         .add_field('cond', 22, 4)
 
     @staticmethod
-    def _on_branch(pipeline: PipeLine):
+    def _on_branch(pipeline: PipeLine, return_address: int):
         raise NotImplementedError
 
     @classmethod
-    def create_instruction(cls, mnemonic: str, on_branch: Callable[[PipeLine], None] = lambda x: None):
+    def create_instruction(cls, mnemonic: str, on_branch: Callable[[PipeLine, int], None] = lambda x, y: None):
         """creates a new branch instruction type
 
         Parameters
         ----------
         mnemonic : str
             the mnemonic corresponding to the opcode
-        on_branch : Callable[[], None]
+        on_branch : Callable[[PipeLine, int], None]
             callback determining what happens when a branch occurs,
-            i.e. whether the link register should be updated
+            i.e. whether the link register should be updated,
+            called with the address of the instruction after the branch
         """
         return type(f'{mnemonic}_Instruction', (cls,), {
             'mnemonic': mnemonic,
             '_on_branch': on_branch
         })
 
+    @classmethod
+    def registers_used(cls, fields: Dict[str, int]) -> Tuple[Tuple[int, ...], Tuple[int, ...], Tuple[int, ...]]:
+        if fields['imm']:
+            return (), (), ()
+        return (fields['base'],), (), ()
+
+    @staticmethod
+    def condition_passed(cond: int, condition_flags: Mapping[str, bool]) -> bool:
+        """evaluates a branch's condition code against a set of condition flags
+
+        Parameters
+        ----------
+        cond : int
+            the branch's condition code
+        condition_flags : Mapping[str, bool]
+            the N, Z, C, V flags to check the condition against
+
+        Returns
+        -------
+        bool
+            True if the branch should be taken
+        """
+        return CONDITION_TABLE[ConditionCode(cond)][pack_flags(condition_flags)]
+
+    def branch_kind(self) -> Tuple[bool, bool, bool]:
+        """gets what kind of branch the instruction is, can be used before the instruction has been decoded
+
+        Returns
+        -------
+        Tuple[bool, bool, bool]
+            whether the branch is conditional, whether it is a call (BL), 
+            and whether it is a return (a branch to the link register)
+        """
+        fields = self._predecoded.fields if self._decoded is None else self
+        return fields['cond'] != ConditionCode.AL, self.opcode == OpCode.BL, \
+            not fields['imm'] and fields['base'] == SpecialRegister.lr
+
+    def link(self) -> None:
+        """performs the other behavior of a taken branch (ie. BL updating the link register).
+        the PC has already moved past the branch by the time it executes, by how far depends on whether fetch was predicting or stalling,
+        so the return address comes from the branch's own address, so that BL always links to the instruction after the branch
+        """
+        if self.address < 0:
+            raise ValueError(f'{self.mnemonic} has no address to link from')
+        type(self)._on_branch(self._pipeline, self.address + 1)
+
+    def resolve_prediction(self, prediction: Prediction) -> None:
+        """executes a branch that the fetch stage has already predicted, 
+        and squashes the pipeline only if the branch went somewhere other than where it was predicted to
+
+        Parameters
+        ----------
+        prediction : Prediction
+            the prediction made when the branch was fetched
+        """
+        if self.computed is not None:
+            # the execute stage is re-run while memory is stalled, the branch has already been resolved
+            return
+
+        pipeline = self._pipeline
+        taken = CONDITION_TABLE[self['cond']][pipeline._nzcv]
+        next_pc = prediction.address + 1
+
+        if taken:
+            self.link()
+
+            if self['imm']:
+                next_pc = self['offset']
+            else:
+                next_pc = self['offset'] + self.read_register(self['base'])
+
+        # the branch's result is the address of the instruction after it
+        self.computed = next_pc
+
+        if pipeline.branch_unit.resolve(prediction, *self.branch_kind(), taken, next_pc):
+            pipeline.squash(next_pc)
+
     def execute_stage_func(self):
         """compares the branch's condition code to that of the pipeline to determine if the branch should be taken.
         Squashes the pipeline if the branch is taken
         """
+        if (prediction := self.prediction) is not None:
+            self.resolve_prediction(prediction)
+            return
 
-        # defines all the different ways of evaluating the different condition codes
-        # too bad python doesn't have switch statements
-        eval_branch: Dict[ConditionCode, Callable[[], bool]] = {
-            ConditionCode.EQ: lambda: self._pipeline.condition_flags['z'] == 1,
-            ConditionCode.NE: lambda: self._pipeline.condition_flags['z'] == 0,
-            ConditionCode.CS: lambda: self._pipeline.condition_flags['c'] == 1,
-            ConditionCode.CC: lambda: self._pipeline.condition_flags['c'] == 0,
-            ConditionCode.MI: lambda: self._pipeline.condition_flags['n'] == 1,
-            ConditionCode.PL: lambda: self._pipeline.condition_flags['n'] == 0,
-            ConditionCode.VS: lambda: self._pipeline.condition_flags['v'] == 1,
-            ConditionCode.VC: lambda: self._pipeline.condition_flags['v'] == 0,
-            ConditionCode.HI: lambda: self._pipeline.condition_flags['c'] == 1 and self._pipeline.condition_flags['z'] == 0,
-            ConditionCode.LS: lambda: self._pipeline.condition_flags['c'] == 0 or self._pipeline.condition_flags['z'] == 1,
-            ConditionCode.GE: lambda: self._pipeline.condition_flags['n'] == self._pipeline.condition_flags['v'],
-            ConditionCode.LT: lambda: self._pipeline.condition_flags['n'] != self._pipeline.condition_flags['v'],
-            ConditionCode.GT: lambda: self._pipeline.condition_flags['z'] == 0 and self._pipeline.condition_flags['n'] == self._pipeline.condition_flags['v'],
-            ConditionCode.LE: lambda: self._pipeline.condition_flags['z'] == 1 or self._pipeline.condition_flags['n'] != self._pipeline.condition_flags['v'],
-            ConditionCode.AL: lambda: True
-        }
-
-        if eval_branch[ConditionCode(self['cond'])]():
+        if CONDITION_TABLE[self['cond']][self._pipeline._nzcv]:
             # perform the other behavior (ie. update the link register)
-            type(self)._on_branch(self._pipeline)
+            self.link()
 
             # calculate the target address for the new program counter
             if self['imm']:  # immediate value used, PC relative
                 target_address = self['offset']  # + self._pipeline._pc
             else:  # no immediate, register indirect used
                 base_reg = self['base']
-                target_address = self['offset'] + self._pipeline.get_dependency(base_reg)
+                target_address = self['offset'] + self.read_register(base_reg)
 
             # squash the pipeline
             self._pipeline.squash(target_address)
 
-def BL_func(pipeline: PipeLine):
-    """function to save the PC location to the link register
+def BL_func(pipeline: PipeLine, return_address: int):
+    """function to save the return address to the link register
     for the BL instruction
     """
-    pipeline.lr = pipeline.pc + 1
+    pipeline.lr = return_address
 
 class MEM_Instruction(Instruction):
     # LDR, STR
@@ -960,7 +1766,13 @@ class LDR_Instruction(MEM_Instruction):
     encoding = MEM_Instruction.encoding.create_subtype('LDR_Encoding')
     encoding.add_field('dest', 21, 5)
 
-    def memory_stage_func(self) -> None:
+    @classmethod
+    def registers_used(cls, fields: Dict[str, int]) -> Tuple[Tuple[int, ...], Tuple[int, ...], Tuple[int, ...]]:
+        if fields['imm'] == 1:
+            return (), (), (fields['dest'],)
+        return (), (fields['base'],), (fields['dest'],)
+
+    def memory_stage_func(self) -> bool:
         """calculates the memory address from which a value should be loaded and
         gets that value from memory
         """
@@ -970,10 +1782,20 @@ class LDR_Instruction(MEM_Instruction):
         else:  # uses register direct + offset
             # calculate the address
             base_addr_reg = self['base']
-            src_addr = self._pipeline._registers[base_addr_reg] + self['offset']
+            src_addr = self.read_register(base_addr_reg) + self['offset']
+
+        memory = self._pipeline._memory
+        if not self.hit_level:
+            self.mem_address = src_addr
+            self.hit_level = memory.hit_level(src_addr)
 
         # read from that address
-        self.computed = self._pipeline._memory[src_addr]
+        request = memory.read(src_addr)
+        if request.status is RequestStatus.PENDING:
+            return False
+
+        self.computed = request.value
+        return True
 
     def writeback_stage_func(self) -> None:
         """writes the value we got from memory into the specified register
@@ -985,7 +1807,13 @@ class STR_Instruction(MEM_Instruction):
     encoding = MEM_Instruction.encoding.create_subtype('STR_Encoding')
     encoding.add_field('src', 21, 5)
 
-    def memory_stage_func(self) -> None:
+    @classmethod
+    def registers_used(cls, fields: Dict[str, int]) -> Tuple[Tuple[int, ...], Tuple[int, ...], Tuple[int, ...]]:
+        if fields['imm'] == 1:
+            return (), (fields['src'],), ()
+        return (), (fields['src'], fields['base']), ()
+
+    def memory_stage_func(self) -> bool:
         """calulates the memory address to which a value should be stored and
         loads that value into memory
         """
@@ -994,24 +1822,38 @@ class STR_Instruction(MEM_Instruction):
         else:  # uses register direct + offset
             # calculate the address
             base_addr_reg = self['base']
-            dest_addr = self._pipeline._registers[base_addr_reg] + self['offset']
+            dest_addr = self.read_register(base_addr_reg) + self['offset']
 
         # get the value to write
-        src_val = self._pipeline._registers[self['src']]
+        src_val = self.read_register(self['src'])
+
+        memory = self._pipeline._memory
+        if not self.hit_level:
+            self.mem_address = dest_addr
+            self.hit_level = memory.hit_level(dest_addr)
 
         # write to that address
-        self._pipeline._memory[dest_addr] = src_val
+        if memory.write(dest_addr, src_val).status is RequestStatus.PENDING:
+            return False
+
+        self._pipeline.invalidate_decoded(dest_addr)
+        return True
 
 class POP_Instruction(LDR_Instruction):
     encoding = LDR_Instruction.encoding.create_subtype('POP_Encoding')
 
+    @classmethod
+    def registers_used(cls, fields: Dict[str, int]) -> Tuple[Tuple[int, ...], Tuple[int, ...], Tuple[int, ...]]:
+        # the address comes from the stack pointer
+        return (), (), (fields['dest'],)
+
     def __init__(self):
         super(POP_Instruction, self).__init__()
         if self._pipeline.sp - 1 < 0:
             raise ValueError(f"Pop instruction created that pops from invalid address: {self['base']}")
 
 
-    def memory_stage_func(self) -> None:
+    def memory_stage_func(self) -> bool:
         """calulates the memory address to which a value should be stored and
         loads that value into memory
         """
@@ -1019,9 +1861,19 @@ class POP_Instruction(LDR_Instruction):
         # calculate the address
         src_addr = self._pipeline.sp + 1
 
+        memory = self._pipeline._memory
+        if not self.hit_level:
+            self.mem_address = src_addr
+            self.hit_level = memory.hit_level(src_addr)
+
         # read from that address
-        self.computed = self._pipeline._memory[src_addr]
+        request = memory.read(src_addr)
+        if request.status is RequestStatus.PENDING:
+            return False
+
+        self.computed = request.value
         self._pipeline._memory._RAM[src_addr] = 0
+        return True
 
     def writeback_stage_func(self) -> None:
         """writes the value we got from memory into the specified register
@@ -1034,7 +1886,14 @@ class PUSH_Instruction(STR_Instruction):
 
     encoding = STR_Instruction.encoding.create_subtype('PUSH_Encoding')
 
-    def memory_stage_func(self) -> None:
+    # the pushed register is cleared in writeback, so instructions reading it have to wait until then
+    forwardable = False
+
+    @classmethod
+    def registers_used(cls, fields: Dict[str, int]) -> Tuple[Tuple[int, ...], Tuple[int, ...], Tuple[int, ...]]:
+        return (), (fields['src'],), (fields['src'],)
+
+    def memory_stage_func(self) -> bool:
         """calulates the memory address to which a value should be stored and
         loads that value into memory
         """
@@ -1043,10 +1902,19 @@ class PUSH_Instruction(STR_Instruction):
         dest_addr = self._pipeline.sp
 
         # get the value to write
-        src_val = self._pipeline._registers[self['src']]
+        src_val = self.read_register(self['src'])
+
+        memory = self._pipeline._memory
+        if not self.hit_level:
+            self.mem_address = dest_addr
+            self.hit_level = memory.hit_level(dest_addr)
 
         # write to that address
-        self._pipeline._memory[dest_addr] = src_val
+        if memory.write(dest_addr, src_val).status is RequestStatus.PENDING:
+            return False
+
+        self._pipeline.invalidate_decoded(dest_addr)
+        return True
 
     def writeback_stage_func(self) -> None:
         """writes the value we got from memory into the specified register
@@ -1094,4 +1962,60 @@ Instructions: List[Type[Instruction]] = [
     B_Instruction.create_instruction('B'),
     B_Instruction.create_instruction('BL', BL_func),  # TODO implement
     NOOP_Instruction.create_instruction('END')
-]
\ No newline at end of file
+]
+
+
+class _SharedNOOP(Instructions[OpCode.NOOP.value]):
+    """a NOOP which cannot be modified, so that a single instance can be used for every bubble in the pipeline
+    """
+
+    def __setattr__(self, attr, val):
+        raise AttributeError('the shared NOOP cannot be modified')
+
+    def __setitem__(self, field: str, value: int) -> None:
+        raise AttributeError('the shared NOOP cannot be modified')
+
+
+def _create_shared_noop() -> Instruction:
+    noop = _SharedNOOP.__new__(_SharedNOOP)
+
+    # bypass the frozen __setattr__ while setting up the instance
+    for attr, val in {
+        '_scoreboard_index': -1,
+        '_pipeline': None,
+        '_encoded': 0b0,
+        '_predecoded': DecodedInstruction(0b0),
+        'opcode': OpCode.NOOP.value,
+        'output_reg': None,
+        'input_regs': (),
+        'computed': None,
+        '_sources': None,
+        'prediction': None,
+        'address': -1,
+        'mem_address': -1,
+        'hit_level': 0,
+    }.items():
+        object.__setattr__(noop, attr, val)
+    object.__setattr__(noop, '_decoded', noop._predecoded.decoded)
+
+    return noop
+
+"""the NOOP used for every bubble in the pipeline and every empty latch
+"""
+NOOP: Instruction = _create_shared_noop()
+
+
+class StageHandlers(NamedTuple):
+    """the functions that run an instruction in each of the pipeline stages
+    """
+    execute: Callable[[Instruction], None]
+    memory: Callable[[Instruction], bool]
+    writeback: Callable[[Instruction], None]
+
+"""the stage functions for each opcode, 
+so that each stage is a single indexed call no matter what type the instruction object is
+"""
+STAGE_HANDLERS: List[StageHandlers] = [
+    StageHandlers(instruction_type.execute_stage_func, instruction_type.memory_stage_func, instruction_type.writeback_stage_func)
+    for instruction_type in Instructions
+]
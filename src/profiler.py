@@ -0,0 +1,221 @@
+from __future__ import annotations
+from argparse import ArgumentParser
+from dataclasses import dataclass
+from typing import List, Optional, Sequence
+import time
+
+from tabulate import tabulate  # pip install tabulate
+
+from benchmark import add_program_arguments, pipeline_from_args
+from cpi_stack import CPIStack, CycleCategory
+from disassembler import disassemble
+from eisa import EISA
+from memory_subsystem import MemorySubsystem, MemoryRequest
+from pipeline import PipeLine
+
+
+"""the stages an instruction can be in, in the order of PipeLine._pipeline
+"""
+STAGES = ('fetch', 'decode', 'execute', 'memory', 'writeback')
+
+
+@dataclass
+class LineProfile:
+    """everything the profiler counted for the instruction at a single address
+    """
+    address: int
+    instruction: str  # the disassembled instruction
+    cycles: int  # the cycles charged to the instruction by the CPI stack, the ones where it retired and the stall cycles it caused
+    executions: int  # the number of times the instruction was retired
+    stall_cycles: int  # the cycles lost to stalls blamed on the instruction, see CPIStack
+    stage_cycles: List[int]  # the cycles the instruction spent in each stage, indexed the same as STAGES
+    l1_misses: int  # reads and writes of the instruction, or fetches of it, that missed the L1 cache
+    l2_misses: int  # of those, the ones that missed the L2 cache too and went to RAM
+
+
+class Profiler(CPIStack):
+    """a per address profile of a program running on the in order pipeline,
+    counting for each instruction how often it was executed, the cycles it spent in each stage,
+    the stall cycles it caused, and the cache misses it triggered.
+
+    the profiler is a CPI stack which also counts where each instruction is every cycle,
+    attach it by setting PipeLine.cpi_stack to it. it isn't covered by checkpoints, a restored pipeline has a plain CPIStack instead.
+    fetch misses are blamed on the instruction being fetched, and data misses on the load or store making the access
+    """
+    stage_cycles: List[List[int]]  # the cycles spent in each stage, indexed by stage then address
+    l1_misses: List[int]  # indexed by address
+    l2_misses: List[int]  # indexed by address
+
+    # the requests that were using the read/write channels the last time they were checked, to spot new requests
+    _read_request: Optional[MemoryRequest]
+    _write_request: Optional[MemoryRequest]
+    _slots: Sequence  # the pipeline's stages in the last cycle, repeated for skipped cycles
+
+    def __init__(self, address_space: int = EISA.RAM_ADDR_SPACE):
+        """creates an empty profile
+
+        Parameters
+        ----------
+        address_space : int, optional
+            the number of addresses instructions can be fetched from, by default EISA.RAM_ADDR_SPACE
+        """
+        super().__init__()
+
+        # with a spare slot on the end for the bubbles, which are at address -1
+        self.stage_cycles = [[0] * (address_space + 1) for stage in STAGES]
+        self.l1_misses = [0] * address_space
+        self.l2_misses = [0] * address_space
+
+        self._read_request = None
+        self._write_request = None
+        self._slots = ()
+
+    # region accounting
+    def _count_miss(self, memory: MemorySubsystem, address: int, blamed: int) -> None:
+        # the caches are only filled once a request finishes, so they still show whether it missed
+        if blamed < 0 or memory.l1_holds(address):
+            return
+
+        self.l1_misses[blamed] += 1
+        if memory.goes_to_ram(address):
+            self.l2_misses[blamed] += 1
+
+    def before_fetch(self, pipeline: PipeLine) -> None:
+        # any request started so far in the cycle came from the memory stage
+        memory = pipeline._memory
+        blamed = pipeline._pipeline[3].address
+
+        request = memory._read_request
+        if request is not None and request is not self._read_request:
+            self._count_miss(memory, request.address, blamed)
+        self._read_request = request
+
+        request = memory._write_request
+        if request is not None and request is not self._write_request:
+            self._count_miss(memory, request.address, blamed)
+        self._write_request = request
+
+        super().before_fetch(pipeline)
+
+    def account(self, pipeline: PipeLine) -> None:
+        # a read started since the memory stage came from the fetch stage
+        memory = pipeline._memory
+        request = memory._read_request
+        if request is not None and request is not self._read_request:
+            self._count_miss(memory, request.address, request.address)
+        self._read_request = request
+
+        super().account(pipeline)
+
+        # addresses are never negative other than for bubbles, which wrap around to the unused last slot
+        slots = self._slots = pipeline._pipeline
+        for cycles, instruction in zip(self.stage_cycles, slots):
+            cycles[instruction.address] += 1
+
+    def repeat(self, cycles: int) -> None:
+        super().repeat(cycles)
+
+        # nothing moves while the pipeline is frozen, so each stage holds the same instruction for every skipped cycle
+        for stage_cycles, instruction in zip(self.stage_cycles, self._slots):
+            stage_cycles[instruction.address] += cycles
+
+    # endregion accounting
+
+    # region results
+    def line(self, address: int, word: int) -> LineProfile:
+        """the profile of the instruction at the passed address
+
+        Parameters
+        ----------
+        address : int
+            the address of the instruction
+        word : int
+            the instruction word stored at the address, to disassemble
+
+        Returns
+        -------
+        LineProfile
+            the counts for the instruction
+        """
+        counts = self._by_pc.get(address, [0 for category in CycleCategory])
+        return LineProfile(
+            address, disassemble(word), sum(counts), counts[CycleCategory.RETIRE], sum(counts) - counts[CycleCategory.RETIRE],
+            [cycles[address] for cycles in self.stage_cycles], self.l1_misses[address], self.l2_misses[address]
+        )
+
+    def profiled_addresses(self) -> List[int]:
+        """the addresses of every instruction that was fetched while the profiler was attached, in order
+        """
+        return [address for address in range(len(self.l1_misses)) if self.stage_cycles[0][address] or address in self._by_pc]
+
+    def flat_profile(self, words: Sequence[int], top: Optional[int] = None) -> List[LineProfile]:
+        """the profile of every instruction which was fetched, the ones which were charged the most cycles first
+
+        Parameters
+        ----------
+        words : Sequence[int]
+            the memory the program was run from, to disassemble the instructions
+        top : Optional[int], optional
+            only return this many instructions, by default None to return all of them
+        """
+        lines = [self.line(address, words[address]) for address in self.profiled_addresses()]
+        lines.sort(key=lambda line: (-line.cycles, line.address))
+        return lines[:top] if top is not None else lines
+
+    def _table(self, lines: List[LineProfile]) -> str:
+        total = max(sum(self.cycles), 1)
+        rows = [
+            [line.address, line.instruction, line.cycles, 100 * line.cycles / total, line.executions, line.stall_cycles,
+             *line.stage_cycles, line.l1_misses, line.l2_misses]
+            for line in lines
+        ]
+        return tabulate(rows, headers=['address', 'instruction', 'cycles', '%', 'executions', 'stalls',
+                                       'F', 'D', 'E', 'M', 'W', 'L1 misses', 'L2 misses'], floatfmt='.1f')
+
+    def format_flat_profile(self, words: Sequence[int], top: Optional[int] = None) -> str:
+        """the flat profile as a table, see flat_profile
+        """
+        return self._table(self.flat_profile(words, top))
+
+    def annotate(self, words: Sequence[int], start: int = 0, stop: Optional[int] = None) -> str:
+        """a disassembly of the program image, with each instruction annotated with its counts
+
+        Parameters
+        ----------
+        words : Sequence[int]
+            the memory the program was run from
+        start : int, optional
+            the first address to disassemble, by default 0
+        stop : Optional[int], optional
+            the address to stop disassembling at, by default None to stop after the last instruction which was fetched
+        """
+        if stop is None:
+            stop = max(self.profiled_addresses(), default=start - 1) + 1
+        return self._table([self.line(address, words[address]) for address in range(start, stop)])
+
+    # endregion results
+
+
+if __name__ == '__main__':
+    arg_parse = ArgumentParser(description='runs a program on the in order pipeline, and profiles where its cycles go by instruction')
+    add_program_arguments(arg_parse)
+    arg_parse.add_argument('-n', type=int, default=20, dest='top',
+                           help='the number of instructions in the flat profile')
+
+    args = arg_parse.parse_args()
+
+    pipeline = pipeline_from_args(args)
+    profiler = pipeline.cpi_stack = Profiler()
+
+    start = time.perf_counter()
+    result = pipeline.run(max_cycles=args.max_cycles)
+    elapsed = time.perf_counter() - start
+
+    with open(args.program) as f:
+        program_size = len([line for line in f if line.strip()])
+    words = pipeline._memory._RAM._memory
+
+    print(f'{result}, CPI {pipeline._cycles / max(pipeline._instructions_retired, 1):.3f}\n')
+    print(profiler.table())
+    print(f'\nflat profile\n{profiler.format_flat_profile(words, args.top)}')
+    print(f'\nannotated disassembly\n{profiler.annotate(words, 0, program_size)}')
@@ -0,0 +1,189 @@
+from __future__ import annotations
+from argparse import ArgumentParser
+from typing import Callable, List, Optional
+import glob
+import os
+import time
+
+import numpy as np  # pip install numpy
+
+from benchmark import add_program_arguments, pipeline_from_args
+from pipeline import PipeLine, Instruction
+
+
+"""a single retired instruction, see RetireTrace
+"""
+TRACE_DTYPE = np.dtype([
+    ('cycle', np.int64),  # the cycle the instruction was retired in
+    ('pc', np.int32),  # the address it was fetched from, -1 if it wasn't fetched by the pipeline
+    ('word', np.int64),  # the encoded instruction
+    ('dest_value', np.int64),  # the result it computed, ie. the value written to its destination register, 0 if it didn't compute one
+    ('mem_address', np.int64),  # the address it accessed in the memory stage, -1 if it didn't access memory
+    ('hit_level', np.int8),  # the level of the memory hierarchy the access was served from, an int of HitLevel
+])
+
+_INT64_MIN = -2 ** 63
+
+
+class RetireTrace:
+    """records every instruction retired by a pipeline into a preallocated structured array, see TRACE_DTYPE.
+
+    each field is written through its own column of the buffer, so recording an instruction doesn't create any objects.
+    when the buffer fills up it is handed to the consumer, and/or saved to the directory as the next .npy chunk, and then reused.
+    without either, the buffer is a ring which keeps the last capacity instructions.
+
+    attach it with PipeLine.on_retire = trace.record, and call flush once the run is over to hand off the instructions still buffered
+    """
+    capacity: int
+    consumer: Optional[Callable[[np.ndarray], None]]  # called with each full chunk, which is only valid until it returns
+    directory: Optional[str]  # where to save the chunks, as <prefix>_<chunk number>.npy
+    prefix: str
+
+    recorded: int  # the number of instructions recorded in total
+    chunks: int  # the number of chunks handed off so far
+
+    buffer: np.ndarray
+    # the columns of the buffer, one per field
+    _cycle: np.ndarray
+    _pc: np.ndarray
+    _word: np.ndarray
+    _dest_value: np.ndarray
+    _mem_address: np.ndarray
+    _hit_level: np.ndarray
+    _index: int  # the slot to record the next instruction in
+    _wrapped: bool  # whether the ring has overwritten instructions, only when there isn't a consumer or directory
+
+    def __init__(self, capacity: int = 1 << 16, consumer: Optional[Callable[[np.ndarray], None]] = None,
+                 directory: Optional[str] = None, prefix: str = 'trace'):
+        """creates an empty trace
+
+        Parameters
+        ----------
+        capacity : int, optional
+            the number of instructions the buffer holds, by default 1 << 16
+        consumer : Optional[Callable[[np.ndarray], None]], optional
+            called with each chunk of the trace as it fills up, by default None.
+            the chunk is a view of the buffer, so it has to be copied to be kept after the consumer returns
+        directory : Optional[str], optional
+            a directory to save each chunk of the trace to as a .npy file, by default None to not save them
+        prefix : str, optional
+            the start of the name of the chunk files, by default 'trace'
+        """
+        if capacity < 1:
+            raise ValueError(f'the capacity of a trace has to be positive, not {capacity}')
+
+        self.capacity = capacity
+        self.consumer = consumer
+        self.directory = directory
+        self.prefix = prefix
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+        self.recorded = 0
+        self.chunks = 0
+
+        self.buffer = np.zeros(capacity, TRACE_DTYPE)
+        self._cycle = self.buffer['cycle']
+        self._pc = self.buffer['pc']
+        self._word = self.buffer['word']
+        self._dest_value = self.buffer['dest_value']
+        self._mem_address = self.buffer['mem_address']
+        self._hit_level = self.buffer['hit_level']
+        self._index = 0
+        self._wrapped = False
+
+    def record(self, pipeline: PipeLine, instruction: Instruction) -> None:
+        """records a retired instruction, the signature of PipeLine.on_retire
+        """
+        i = self._index
+        self._cycle[i] = pipeline._cycles
+        self._pc[i] = instruction.address
+        self._word[i] = instruction._encoded
+        self._mem_address[i] = instruction.mem_address
+        self._hit_level[i] = instruction.hit_level
+
+        value = instruction.computed
+        if value is not None:
+            try:
+                self._dest_value[i] = value
+            except OverflowError:
+                # registers are python ints which can grow past 64 bits, keep the low 64 bits
+                self._dest_value[i] = (value - _INT64_MIN) % (1 << 64) + _INT64_MIN
+        else:
+            self._dest_value[i] = 0
+
+        self.recorded += 1
+        i += 1
+        if i == self.capacity:
+            if self.consumer is not None or self.directory is not None:
+                self._hand_off(self.buffer)
+            else:
+                self._wrapped = True
+            i = 0
+        self._index = i
+
+    def _hand_off(self, chunk: np.ndarray) -> None:
+        if self.directory is not None:
+            np.save(os.path.join(self.directory, f'{self.prefix}_{self.chunks:06d}.npy'), chunk)
+        if self.consumer is not None:
+            self.consumer(chunk)
+        self.chunks += 1
+
+    def flush(self) -> None:
+        """hands the instructions recorded since the last chunk to the consumer and directory, and empties the buffer.
+        does nothing if there isn't a consumer or directory, or nothing has been recorded since
+        """
+        if self._index and (self.consumer is not None or self.directory is not None):
+            self._hand_off(self.buffer[:self._index])
+            self._index = 0
+
+    def entries(self) -> np.ndarray:
+        """the instructions still in the buffer, oldest first, as a copy
+        """
+        if self._wrapped:
+            return np.concatenate((self.buffer[self._index:], self.buffer[:self._index]))
+        return self.buffer[:self._index].copy()
+
+    def __len__(self) -> int:
+        return self.capacity if self._wrapped else self._index
+
+
+def load_trace(directory: str, prefix: str = 'trace') -> np.ndarray:
+    """reads back a trace saved to a directory by RetireTrace, joining its chunks in order
+
+    Parameters
+    ----------
+    directory : str
+        the directory the chunks were saved to
+    prefix : str, optional
+        the start of the name of the chunk files, by default 'trace'
+
+    Returns
+    -------
+    np.ndarray
+        every instruction in the trace, with the fields of TRACE_DTYPE
+    """
+    chunks: List[np.ndarray] = [np.load(path) for path in sorted(glob.glob(os.path.join(directory, f'{prefix}_*.npy')))]
+    return np.concatenate(chunks) if chunks else np.zeros(0, TRACE_DTYPE)
+
+
+if __name__ == '__main__':
+    arg_parse = ArgumentParser(description='runs a program on the pipeline, saving every instruction it retires to .npy chunks')
+    add_program_arguments(arg_parse)
+    arg_parse.add_argument('-o', type=str, default='trace', dest='directory',
+                           help='the directory to save the chunks to')
+    arg_parse.add_argument('-s', type=int, default=1 << 16, dest='capacity',
+                           help='the number of instructions in each chunk')
+
+    args = arg_parse.parse_args()
+
+    pipeline = pipeline_from_args(args)
+    trace = RetireTrace(args.capacity, directory=args.directory)
+    pipeline.on_retire = trace.record
+
+    start = time.perf_counter()
+    result = pipeline.run(max_cycles=args.max_cycles)
+    trace.flush()
+    elapsed = time.perf_counter() - start
+
+    print(f'{result}, {trace.recorded} instructions traced to {trace.chunks} chunks in {args.directory} in {elapsed:.3f}s')
@@ -0,0 +1,107 @@
+from __future__ import annotations
+from argparse import ArgumentParser
+from dataclasses import dataclass
+from typing import List, Optional
+import time
+
+import numpy as np  # pip install numpy
+from tabulate import tabulate  # pip install tabulate
+
+from cache_trace import AccessKind, CacheConfig, add_trace_arguments, record_from_args
+from vector_cache import stack_distances, trace_addresses
+
+
+@dataclass
+class MissRatioCurve:
+    """the misses of a fully associative LRU cache of every size, for a single trace
+    """
+    accesses: int
+    line_words: int
+    misses: np.ndarray  # the misses with each number of lines, from 0 up to the number of distinct lines, after which it stays flat
+
+    @property
+    def compulsory(self) -> int:
+        """the first accesses to each line, which miss whatever the size of the cache
+        """
+        return int(self.misses[-1])
+
+    @property
+    def lines(self) -> int:
+        """the number of distinct lines in the trace, the smallest cache which only has compulsory misses
+        """
+        return len(self.misses) - 1
+
+    def miss_count(self, lines: int) -> int:
+        """the misses of a cache with the passed number of lines
+        """
+        return int(self.misses[min(lines, len(self.misses) - 1)])
+
+    def miss_ratio(self, lines: int) -> float:
+        """the share of accesses which miss a cache with the passed number of lines
+        """
+        return self.miss_count(lines) / self.accesses if self.accesses else 0.0
+
+    def table(self, sizes: Optional[List[int]] = None) -> str:
+        """the curve as a table
+
+        Parameters
+        ----------
+        sizes : Optional[List[int]], optional
+            the numbers of lines to list, by default None for every power of two up to the number of distinct lines.
+            the size bits column is the CACHE_SIZE which gives that many lines, with the 2 ways of CacheBlock
+        """
+        if sizes is None:
+            sizes = [1 << bits for bits in range(max(self.lines, 1).bit_length() + 1)]
+
+        rows = []
+        for lines in sizes:
+            size_bits = (lines // 2).bit_length() - 1 if lines >= 2 and lines & (lines - 1) == 0 else None
+            rows.append([lines, lines * self.line_words, '' if size_bits is None else size_bits,
+                         self.miss_count(lines), 100 * self.miss_ratio(lines)])
+        return tabulate(rows, headers=['lines', 'words', 'size bits', 'misses', 'miss %'], floatfmt='.2f')
+
+
+def miss_ratio_curve(addresses: np.ndarray, line_words: int = CacheConfig.line_words) -> MissRatioCurve:
+    """works out the misses of a fully associative LRU cache of every size from a single pass over the trace.
+    an access misses a cache with fewer lines than its stack distance + 1, see vector_cache.stack_distances
+
+    Parameters
+    ----------
+    addresses : np.ndarray
+        the addresses accessed, in order
+    line_words : int, optional
+        the words in each line, by default the 4 words of the lines Cache.offset_align gives
+
+    Returns
+    -------
+    MissRatioCurve
+        the misses with each number of lines
+    """
+    distances = stack_distances(addresses, 1, line_words)
+    compulsory = int((distances < 0).sum())
+
+    # an access with stack distance d hits once there are more than d lines
+    hits = np.bincount(distances[distances >= 0] + 1, minlength=compulsory + 1)
+    misses = len(distances) - np.cumsum(hits)
+    return MissRatioCurve(len(distances), line_words, misses)
+
+
+if __name__ == '__main__':
+    arg_parse = ArgumentParser(description='works out the miss ratio of a fully associative LRU cache of every size, from one run of a program')
+    add_trace_arguments(arg_parse)
+    arg_parse.add_argument('-l', type=int, default=CacheConfig.line_words, dest='line_words', help='the words in each line')
+    arg_parse.add_argument('--kind', choices=[kind.name.lower() for kind in AccessKind], nargs='+', default=None,
+                           help='only count these kinds of access, defaults to all of them')
+
+    args = arg_parse.parse_args()
+
+    trace = record_from_args(args)
+    kinds = [AccessKind[kind.upper()] for kind in args.kind] if args.kind is not None else None
+    addresses = trace_addresses(trace, kinds)
+
+    start = time.perf_counter()
+    curve = miss_ratio_curve(addresses, args.line_words)
+    elapsed = time.perf_counter() - start
+
+    print(f'{curve.accesses} accesses to {curve.lines} lines, {curve.compulsory} compulsory misses, in {elapsed:.3f}s\n')
+    print(curve.table())
@@ -0,0 +1,509 @@
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+import enum
+
+from eisa import EISA
+from memory_subsystem import MemorySubsystem, RequestStatus
+from pipeline import *
+
+
+class EntryStatus(enum.Enum):
+    WAITING = enum.auto()  # in the instruction queue, waiting to be dispatched to a functional unit
+    EXECUTING = enum.auto()  # occupying a row of the scoreboard
+    DONE = enum.auto()  # finished executing, waiting to be committed
+
+
+class QueueEntry:
+    """an instruction in the instruction queue,
+    holds the instruction's results until it is committed so that the instructions after it can use them
+    """
+    __slots__ = ('instruction', 'address', 'unit', 'status', 'sources', 'flags_source', 'writes',
+                 'results', 'nzcv', 'mem_address', 'mem_value', 'next_pc')
+
+    instruction: Instruction
+    address: int  # the address the instruction was fetched from
+    unit: Optional[str]  # the functional unit the instruction executes on, None if it doesn't need one
+    status: EntryStatus
+
+    # the entry producing each of the registers read, None if the value is already in the registers
+    sources: Dict[int, Optional[QueueEntry]]
+    flags_source: Optional[QueueEntry]  # the entry producing the condition flags, for branches
+    writes: Tuple[int, ...]  # the registers written when the instruction commits
+
+    results: Dict[int, int]  # the values of the registers written
+    nzcv: Optional[int]  # the condition flags set, for comparisons
+    mem_address: Optional[int]  # the address loaded from/stored to
+    mem_value: Optional[int]  # the value stored
+    next_pc: Optional[int]  # the address of the instruction after a branch
+
+    def __init__(self, instruction: Instruction, address: int, unit: Optional[str], writes: Tuple[int, ...]):
+        self.instruction = instruction
+        self.address = address
+        self.unit = unit
+        self.status = EntryStatus.WAITING if unit is not None else EntryStatus.DONE
+        self.sources = {}
+        self.flags_source = None
+        self.writes = writes
+        self.results = {}
+        self.nzcv = None
+        self.mem_address = None
+        self.mem_value = None
+        self.next_pc = None
+
+    def __repr__(self) -> str:
+        return f'QueueEntry({type(self.instruction).mnemonic} @ {self.address}, {self.status.name})'
+
+
+@dataclass
+class ScoreboardRow:
+    unit: str  # the functional unit the row tracks
+    entry: Optional[QueueEntry] = None  # the instruction using the unit, None if the unit is free
+
+    @property
+    def busy(self) -> bool:
+        return self.entry is not None
+
+
+@dataclass
+class ScoreboardStats:
+    out_of_order_dispatches: int = 0  # instructions dispatched ahead of an older instruction still waiting in the queue
+    dispatches_under_miss: int = 0  # instructions dispatched while a load was waiting on memory
+    queue_full_cycles: int = 0  # cycles where decode stalled because the instruction queue was full
+    commit_stall_cycles: int = 0  # cycles where nothing was committed because the oldest instruction wasn't done
+    store_forwards: int = 0  # loads which got their value from an older store instead of memory
+
+
+"""the functional unit for each row of the scoreboard, any rows left over after the memory and branch units are ALUs
+"""
+FUNCTIONAL_UNITS: Tuple[str, ...] = ('memory', 'branch') + ('alu',) * (EISA.NUM_SCOREBOARD_ROWS - 2)
+
+
+def functional_unit(instruction: Instruction) -> Optional[str]:
+    """gets the functional unit which executes the passed instruction, None if the instruction doesn't do anything
+    """
+    if isinstance(instruction, ALU_Instruction):
+        return 'alu'
+    elif isinstance(instruction, MEM_Instruction):
+        return 'memory'
+    elif isinstance(instruction, B_Instruction):
+        return 'branch'
+    return None
+
+
+class ScoreboardPipeLine(PipeLine):
+    """an out of order version of the pipeline, built around the scoreboard and instruction queue from EISA.
+
+    each cycle:
+     - store: the store in the write buffer carries on writing to memory
+     - commit: the oldest instruction in the queue is committed once it is done, writing its results to the registers.
+       stores are moved into the write buffer, so they don't hold up the instructions behind them while memory is written
+     - complete: instructions in the scoreboard finish executing, loads finish once memory returns their value
+     - dispatch: the oldest instruction in the queue whose operands are ready and whose functional unit is free
+       starts executing, even if older instructions are still waiting on their operands
+     - decode: the fetched instruction is added to the instruction queue
+     - fetch: the next instruction is read from memory
+
+    results are kept in the queue until they are committed, and later instructions take their operands from there.
+    loads take their value from an older store to the same address, in the queue or the write buffer, if there is one.
+    fetching stops after a branch until the branch has executed, so nothing is ever executed speculatively.
+    the fetch stage and loads share the read channel, see MemoryRequest.
+    reads of the cache block being written by the write buffer wait for the write to finish, 
+    so that a cache miss doesn't fill the block with the value from before the write
+
+    _pipeline holds the instruction handled by each of fetch, decode, dispatch, complete, and commit in the last cycle,
+    so an END instruction is in _pipeline[4] once it has been committed, like the in-order pipeline.
+    yes_pipe, forwarding, and branch_unit are ignored, so benchmark.make_pipeline refuses them, and it can't take a cpi_stack
+    """
+    instruction_queue: List[QueueEntry]
+    scoreboard: List[ScoreboardRow]
+    stats: ScoreboardStats
+
+    # the entry that will write to each register, None if the register holds the latest value
+    _register_status: List[Optional[QueueEntry]]
+    _flags_status: Optional[QueueEntry]
+
+    _fetched: Optional[Tuple[Instruction, int]]  # the fetched instruction and its address, waiting to be decoded
+    _fetch_stopped: bool  # fetched a branch, waiting for it to be executed
+    _fetch_reading: bool  # the fetch stage is using the read channel
+    _read_owner: Optional[QueueEntry]  # the load using the read channel
+    _store_buffer: Optional[QueueEntry]  # the committed store (STR/PUSH) that is writing to memory
+
+    accounts_cycles = False  # the stages are its own, so there is nothing charging the cycles to a cpi_stack
+
+    def __init__(self, pc: int, registers: list[int], memory: MemorySubsystem):
+        super().__init__(pc, registers, memory)
+
+        self.instruction_queue = []
+        self.scoreboard = [ScoreboardRow(unit) for unit in FUNCTIONAL_UNITS]
+        self.stats = ScoreboardStats()
+
+        self._register_status = [None for i in range(len(registers))]
+        self._flags_status = None
+
+        self._fetched = None
+        self._fetch_stopped = False
+        self._fetch_reading = False
+        self._read_owner = None
+        self._store_buffer = None
+
+    # region operands
+    def operand(self, entry: QueueEntry, reg: int) -> int:
+        """gets the value of a register as seen by the passed entry
+        """
+        producer = entry.sources.get(reg)
+        if producer is not None:
+            return producer.results[reg]
+        return self._registers[reg]
+
+    def operands_ready(self, entry: QueueEntry) -> bool:
+        """checks if every instruction the entry takes its operands from has finished executing
+        """
+        for producer in entry.sources.values():
+            if producer is not None and producer.status is not EntryStatus.DONE:
+                return False
+
+        return entry.flags_source is None or entry.flags_source.status is EntryStatus.DONE
+
+    def memory_ready(self, entry: QueueEntry, position: int) -> bool:
+        """checks if a memory instruction can be dispatched without getting ahead of an older instruction writing to memory
+
+        Parameters
+        ----------
+        entry : QueueEntry
+            the entry to check
+        position : int
+            the entry's position in the instruction queue
+        """
+        if isinstance(entry.instruction, (PUSH_Instruction, POP_Instruction)):
+            # they use the stack pointer and both write to memory, so wait until everything before them has been committed
+            return position == 0
+
+        if isinstance(entry.instruction, LDR_Instruction):
+            for older in self.instruction_queue[:position]:
+                if isinstance(older.instruction, (PUSH_Instruction, POP_Instruction)):
+                    return False
+                if isinstance(older.instruction, STR_Instruction) and older.status is not EntryStatus.DONE:
+                    # the address the store writes to isn't known yet
+                    return False
+
+        return True
+
+    def write_conflict(self, address: int) -> bool:
+        """checks if the passed address is in the same cache block as the store in the write buffer
+        """
+        store = self._store_buffer
+        return store is not None and self._memory._cache.offset_align(store.mem_address) == self._memory._cache.offset_align(address)
+
+    def read_conflict(self, address: int) -> bool:
+        """checks if the passed address is in the same cache block as the read in progress
+        """
+        memory = self._memory
+        return memory._is_reading and memory._cache.offset_align(memory.waiting_on_reading) == memory._cache.offset_align(address)
+
+    # endregion operands
+
+    # region stages
+    def stage_store(self) -> None:
+        """carries on writing the store in the write buffer to memory
+        """
+        store = self._store_buffer
+        if store is None or self._memory.write(store.mem_address, store.mem_value).status is RequestStatus.PENDING:
+            return
+
+        self.invalidate_decoded(store.mem_address)
+        self._store_buffer = None
+
+    def stage_commit(self) -> None:
+        """commits the oldest instruction in the instruction queue if it is done
+        """
+        queue = self.instruction_queue
+        if not queue or queue[0].status is not EntryStatus.DONE:
+            if queue:
+                self.stats.commit_stall_cycles += 1
+            return
+
+        entry = queue[0]
+        instruction = entry.instruction
+
+        if isinstance(instruction, STR_Instruction):
+            # stores only write to memory once they are committed, there is only room for one store in the write buffer
+            if self._store_buffer is not None or self.read_conflict(entry.mem_address):
+                self.stats.commit_stall_cycles += 1
+                return
+
+            self._memory.write(entry.mem_address, entry.mem_value)
+            self._store_buffer = entry
+        elif (isinstance(instruction, POP_Instruction) or instruction.opcode == OpCode.END) and self._store_buffer is not None:
+            # POP clears the word it popped in RAM directly, which the write buffer could overwrite afterwards,
+            # and the program isn't finished until its last store has been written
+            self.stats.commit_stall_cycles += 1
+            return
+
+        if isinstance(instruction, POP_Instruction):
+            self._memory._RAM[entry.mem_address] = 0
+
+        for reg in entry.writes:
+            self._registers[reg] = entry.results[reg]
+            if self._register_status[reg] is entry:
+                self._register_status[reg] = None
+
+        if entry.nzcv is not None:
+            self._nzcv = entry.nzcv
+            if self._flags_status is entry:
+                self._flags_status = None
+
+        del queue[0]
+        self._pipeline[4] = instruction
+        if instruction.opcode != 0:
+            self._instructions_retired += 1
+            if self.on_retire is not None:
+                self.on_retire(self, instruction)
+
+    def stage_complete(self) -> None:
+        """finishes the instructions in the scoreboard, each takes a cycle apart from loads, which wait on memory
+        """
+        for row in self.scoreboard:
+            entry = row.entry
+            if entry is None:
+                continue
+
+            if isinstance(entry.instruction, LDR_Instruction) and entry.mem_value is None:
+                store = self._store_buffer
+                if store is not None and store.mem_address == entry.mem_address and self._read_owner is not entry:
+                    entry.mem_value = store.mem_value
+                    self.stats.store_forwards += 1
+
+            if isinstance(entry.instruction, LDR_Instruction) and entry.mem_value is None:
+                # the load isn't being forwarded from a store, so it has to read memory
+                if self._memory._is_reading and self._read_owner is not entry:
+                    continue
+                if self._read_owner is not entry and self.write_conflict(entry.mem_address):
+                    continue
+
+                self._read_owner = entry
+                request = self._memory.read(entry.mem_address)
+                if request.status is RequestStatus.PENDING:
+                    continue
+
+                self._read_owner = None
+                entry.results[entry.instruction['dest']] = request.value
+            elif isinstance(entry.instruction, LDR_Instruction):
+                entry.results[entry.instruction['dest']] = entry.mem_value
+
+            if entry.next_pc is not None:
+                # the branch has been resolved, so fetching can carry on
+                self._pc = entry.next_pc
+                self._fetch_stopped = False
+
+            entry.status = EntryStatus.DONE
+            entry.instruction._scoreboard_index = -1
+            row.entry = None
+            self._pipeline[3] = entry.instruction
+
+    def stage_dispatch(self) -> None:
+        """starts executing the oldest instruction in the instruction queue which is ready
+        """
+        waiting_older = False
+        for position, entry in enumerate(self.instruction_queue):
+            if entry.status is not EntryStatus.WAITING:
+                continue
+
+            row_index = next((i for i, row in enumerate(self.scoreboard) if row.unit == entry.unit and not row.busy), None)
+            if row_index is None or not self.operands_ready(entry) or not self.memory_ready(entry, position):
+                waiting_older = True
+                continue
+
+            if waiting_older:
+                self.stats.out_of_order_dispatches += 1
+            if self._read_owner is not None:
+                self.stats.dispatches_under_miss += 1
+
+            self.execute(entry)
+            entry.status = EntryStatus.EXECUTING
+            entry.instruction._scoreboard_index = row_index
+            self.scoreboard[row_index].entry = entry
+            self._pipeline[2] = entry.instruction
+            return
+
+    def stage_decode(self) -> None:
+        """adds the fetched instruction to the instruction queue,
+        recording which entries it will take its operands from
+        """
+        if self._fetched is None:
+            return
+
+        if len(self.instruction_queue) >= EISA.NUM_INSTR_Q_ROWS:
+            self.stats.queue_full_cycles += 1
+            return
+
+        instruction, address = self._fetched
+        self._fetched = None
+        if instruction is not NOOP:
+            instruction.decode()
+
+        execute_reads, memory_reads, writes = instruction.register_usage()
+        reads = execute_reads + memory_reads
+
+        # registers that are used without being named in the instruction
+        if isinstance(instruction, (PUSH_Instruction, POP_Instruction)):
+            reads += (int(SpecialRegister.sp),)
+            writes += (int(SpecialRegister.sp),)
+        elif instruction.opcode == OpCode.BL:
+            # the link register is only written if the branch is taken, otherwise it keeps its value
+            reads += (int(SpecialRegister.lr),)
+            writes += (int(SpecialRegister.lr),)
+
+        entry = QueueEntry(instruction, address, functional_unit(instruction), writes)
+        for reg in reads:
+            entry.sources[reg] = self._register_status[reg]
+        if isinstance(instruction, B_Instruction):
+            entry.flags_source = self._flags_status
+
+        for reg in writes:
+            self._register_status[reg] = entry
+        if isinstance(instruction, CMP_Instruction):
+            self._flags_status = entry
+
+        self.instruction_queue.append(entry)
+        self._pipeline[1] = instruction
+
+    def stage_fetch(self) -> None:
+        """reads the next instruction from memory, unless waiting on a branch or the queue is backed up
+        """
+        if self._fetch_stopped or self._is_finished or self._fetched is not None:
+            return
+
+        if self._memory._is_reading and not self._fetch_reading:
+            # a load is using the read channel
+            return
+
+        address = self._pc % EISA.RAM_ADDR_SPACE
+        if not self._fetch_reading and self.write_conflict(address):
+            return
+
+        self._fetch_reading = True
+        request = self._memory.read(address, fetch=True)
+        if request.status is RequestStatus.PENDING:
+            return
+
+        self._fetch_reading = False
+        instruction = NOOP if request.value == 0 else Instruction.from_decoded(self, self.predecode(address, request.value), address)
+        self._fetched = (instruction, address)
+        self._pipeline[0] = instruction
+        self._pc += 1
+
+        if isinstance(instruction, B_Instruction):
+            self._fetch_stopped = True
+        elif instruction.opcode == OpCode.END:
+            self._is_finished = True
+
+    # endregion stages
+
+    def execute(self, entry: QueueEntry) -> None:
+        """calculates the results of an instruction as it is dispatched,
+        loads only calculate their address here, and get their value from memory once they've been dispatched
+        """
+        instruction = entry.instruction
+
+        if isinstance(instruction, CMP_Instruction):
+            res = type(instruction)._CMP_func(self.operand(entry, instruction['op1']), self.operand(entry, instruction['op2']))
+            entry.nzcv = CMP_Instruction.compute_flags(res)
+
+        elif isinstance(instruction, ALU_Instruction):
+            val2 = instruction['literal'] if instruction['lit'] else self.operand(entry, instruction['op2'])
+            entry.results[instruction['dest']] = type(instruction)._ALU_func(self.operand(entry, instruction['op1']), val2)
+
+        elif isinstance(instruction, B_Instruction):
+            nzcv = entry.flags_source.nzcv if entry.flags_source is not None else self._nzcv
+            entry.next_pc = entry.address + 1
+
+            if CONDITION_TABLE[instruction['cond']][nzcv]:
+                if instruction['imm']:
+                    entry.next_pc = instruction['offset']
+                else:
+                    entry.next_pc = instruction['offset'] + self.operand(entry, instruction['base'])
+
+                if instruction.opcode == OpCode.BL:
+                    entry.results[SpecialRegister.lr] = entry.address + 1
+            elif instruction.opcode == OpCode.BL:
+                entry.results[SpecialRegister.lr] = self.operand(entry, SpecialRegister.lr)
+
+        elif isinstance(instruction, PUSH_Instruction):
+            # only dispatched once everything before it has been committed, so the registers are up to date
+            sp = self._registers[SpecialRegister.sp]
+            entry.mem_address = sp
+            entry.mem_value = self._registers[instruction['src']]
+            entry.results[instruction['src']] = 0
+            entry.results[SpecialRegister.sp] = sp - 1
+
+        elif isinstance(instruction, POP_Instruction):
+            sp = self._registers[SpecialRegister.sp]
+            entry.mem_address = sp + 1
+            entry.results[SpecialRegister.sp] = sp + 1 if sp < int(SpecialRegister.bp) else sp
+
+        elif isinstance(instruction, MEM_Instruction):
+            if instruction['imm'] == 1:
+                entry.mem_address = instruction['immediate']
+            else:
+                entry.mem_address = self.operand(entry, instruction['base']) + instruction['offset']
+
+            if isinstance(instruction, STR_Instruction):
+                entry.mem_value = self.operand(entry, instruction['src'])
+            else:
+                # forward the value from the youngest older store to the same address, if there is one
+                for older in reversed(self.instruction_queue[:self.instruction_queue.index(entry)]):
+                    if isinstance(older.instruction, STR_Instruction) and older.mem_address == entry.mem_address:
+                        entry.mem_value = older.mem_value
+                        self.stats.store_forwards += 1
+                        break
+
+    def cycle_pipeline(self):
+        """runs a single cycle of the pipeline
+        """
+        self._pipeline[0] = self._pipeline[1] = self._pipeline[2] = self._pipeline[3] = self._pipeline[4] = NOOP
+
+        self.stage_store()
+        self.stage_commit()
+        self.stage_complete()
+        self.stage_dispatch()
+        self.stage_decode()
+        self.stage_fetch()
+
+        self._cycles += 1
+
+    def _frozen_state(self) -> tuple:
+        return super()._frozen_state() + (
+            tuple((id(entry), entry.status) for entry in self.instruction_queue),
+            tuple(id(row.entry) for row in self.scoreboard),
+            id(self._fetched), self._fetch_stopped, self._fetch_reading, id(self._read_owner), id(self._store_buffer),
+        )
+
+    def cycle_skipping(self, max_cycles: int = 1) -> int:
+        # the stall counters go up every cycle while the pipeline is frozen, so they're left out of the frozen state,
+        # and whatever they went up by in the cycle that was run is added for each skipped cycle
+        queue_full_cycles, commit_stall_cycles = self.stats.queue_full_cycles, self.stats.commit_stall_cycles
+        cycles = super().cycle_skipping(max_cycles)
+
+        self.stats.queue_full_cycles += (cycles - 1) * (self.stats.queue_full_cycles - queue_full_cycles)
+        self.stats.commit_stall_cycles += (cycles - 1) * (self.stats.commit_stall_cycles - commit_stall_cycles)
+        return cycles
+
+    def flush(self, pc: int) -> None:
+        super().flush(pc)
+
+        self.instruction_queue = []
+        for row in self.scoreboard:
+            row.entry = None
+
+        self._register_status = [None for i in range(len(self._registers))]
+        self._flags_status = None
+
+        self._fetched = None
+        self._fetch_stopped = False
+        self._fetch_reading = False
+        self._read_owner = None
+        self._store_buffer = None
+
+    def is_quiescent(self) -> bool:
+        return super().is_quiescent() and not self.instruction_queue and self._fetched is None and self._store_buffer is None
@@ -0,0 +1,345 @@
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import List, Set, Tuple
+
+from eisa import EISA
+from memory_subsystem import MemorySubsystem, RequestStatus
+from pipeline import *
+
+
+"""an instruction in one of the superscalar pipeline's latches, with the address it was fetched from
+"""
+Slot = Tuple[int, Instruction]
+
+
+@dataclass
+class IssueStats:
+    slot_issued: List[int]  # the number of instructions issued from each slot
+    groups: int = 0  # the number of cycles where at least one instruction was issued
+    dependency_splits: int = 0  # groups cut short because an instruction used a result that hadn't been written back yet
+    pairing_splits: int = 0  # groups cut short by the pairing rules
+    fetch_splits: int = 0  # groups cut short because fewer instructions were fetched than could be issued
+    dependency_stalls: int = 0  # cycles where nothing was issued because of an instruction still in flight
+
+    def fill_rate(self, slot: int) -> float:
+        """the fraction of the groups which had an instruction in the passed slot
+        """
+        return self.slot_issued[slot] / self.groups if self.groups else 0.0
+
+    def __str__(self) -> str:
+        rates = ', '.join(f'slot {slot} {self.fill_rate(slot):.1%}' for slot in range(len(self.slot_issued)))
+        return f'groups {self.groups}, {rates}, split by dependency {self.dependency_splits}, ' \
+            f'pairing {self.pairing_splits}, fetch {self.fetch_splits}'
+
+
+class SuperscalarPipeLine(PipeLine):
+    """an in order pipeline which can fetch, issue, and retire several instructions per cycle.
+
+    each latch holds a group of up to issue_width instructions, which go through the stages together:
+     - fetch: reads the instruction at the PC, and then the instructions after it which are in the same L1 cache line.
+       a fetch group ends at a branch or END
+     - decode: issues the longest prefix of the fetched group which follows the pairing rules
+       and doesn't use a result that hasn't been written back yet, the rest of the group is issued in later cycles
+     - execute, memory, writeback: run each instruction in the group in program order
+
+    pairing rules:
+     - at most one memory instruction (LDR, STR, PUSH, POP) per group, since there is a single memory port
+     - a branch is always the last instruction in its group
+    the instructions in a group can use the condition flags set by a CMP earlier in the group,
+    but not the registers written by an earlier instruction.
+
+    unlike the scalar pipeline, only the registers an instruction actually reads and writes are tracked, see Instruction.register_usage,
+    and an instruction only waits for the instructions in flight which write to the registers it reads.
+    the fetch stage and loads share the read channel, see MemoryRequest.
+    yes_pipe, forwarding, and branch_unit are ignored, so benchmark.make_pipeline refuses them, and it can't take a cpi_stack
+
+    with an issue width of 1 it still doesn't take the same number of cycles as the scalar pipeline,
+    as it only waits on the registers an instruction uses, and fetches past a branch rather than waiting for it to execute
+    (exchange sort takes 4951 cycles against 5223, matrix multiply 10874 against 10879).
+    so speedups are measured against PipeLine rather than against an issue width of 1, see benchmark.benchmark
+    """
+    issue_width: int
+    stats: IssueStats
+
+    # the instructions in flight, with the address each was fetched from.
+    # the groups waiting to be decoded, executed, go through the memory stage, and be written back
+    _fd_group: List[Slot]
+    _de_group: List[Slot]
+    _em_group: List[Slot]
+    _mw_group: List[Slot]
+
+    # the number of instructions in flight which write to each register
+    _pending_writes: List[int]
+
+    _fetch_reading: bool  # the fetch stage is using the read channel
+    _squashed: bool  # a branch was taken in the current cycle
+
+    accounts_cycles = False  # the stages are its own, so there is nothing charging the cycles to a cpi_stack
+
+    def __init__(self, pc: int, registers: list[int], memory: MemorySubsystem, issue_width: int = 2):
+        """creates an instance of a superscalar pipeline
+
+        Parameters
+        ----------
+        pc : int
+            the initial value of the program counter
+        registers : list[int]
+            the initial values of all the registers
+        memory : MemorySubsystem
+            a reference to the memory subsystem that the pipeline will read from/write to
+        issue_width : int, optional
+            the maximum number of instructions in each group, by default 2
+        """
+        if issue_width < 1:
+            raise ValueError(f'issue width must be at least 1, got {issue_width}')
+
+        super().__init__(pc, registers, memory)
+
+        self.issue_width = issue_width
+        self.stats = IssueStats([0 for i in range(issue_width)])
+
+        self._fd_group = []
+        self._de_group = []
+        self._em_group = []
+        self._mw_group = []
+
+        self._pending_writes = [0 for i in range(len(registers))]
+
+        self._fetch_reading = False
+        self._squashed = False
+
+    # region dependencies
+    @staticmethod
+    def hazard_registers(instruction: Instruction) -> Tuple[Tuple[int, ...], Tuple[int, ...]]:
+        """gets the registers an instruction reads and writes, including the ones which aren't named in the instruction
+
+        Returns
+        -------
+        Tuple[Tuple[int, ...], Tuple[int, ...]]
+            the registers read in the execute and memory stages, and the registers written in the writeback stage
+        """
+        execute_reads, memory_reads, writes = instruction.register_usage()
+        reads = execute_reads + memory_reads
+
+        if isinstance(instruction, (PUSH_Instruction, POP_Instruction)):
+            reads += (int(SpecialRegister.sp),)
+            writes += (int(SpecialRegister.sp),)
+        elif instruction.opcode == OpCode.BL:
+            writes += (int(SpecialRegister.lr),)
+
+        return reads, writes
+
+    def pairing_conflict(self, instruction: Instruction, group: List[Slot]) -> bool:
+        """checks if the pairing rules stop the instruction from being issued in the same group as the passed instructions
+        """
+        if len(group) >= self.issue_width:
+            return True
+
+        if isinstance(instruction, MEM_Instruction) and any(isinstance(other, MEM_Instruction) for _, other in group):
+            return True
+
+        return any(isinstance(other, B_Instruction) for _, other in group)
+
+    # endregion dependencies
+
+    def squash(self, newPC: int) -> None:
+        """function that squashes the instructions fetched after a taken branch, and updates the program counter
+
+        Parameters
+        ----------
+        newPC : int
+            the new value of the program counter
+        """
+        self._fd_group = []
+        self._pc = newPC
+        self._is_finished = False
+        self._squashed = True
+
+    # region stages
+    def stage_writeback(self):
+        group = self._mw_group
+        self._mw_group = []
+
+        for address, instruction in group:
+            STAGE_HANDLERS[instruction.opcode].writeback(instruction)
+            if instruction.opcode != 0:
+                self._instructions_retired += 1
+                if self.on_retire is not None:
+                    self.on_retire(self, instruction)
+
+            for reg in self.hazard_registers(instruction)[1]:
+                self._pending_writes[reg] -= 1
+
+        self._pipeline[4] = group[-1][1] if group else NOOP
+
+    def stage_memory(self):
+        group = self._em_group
+        self._pipeline[3] = group[-1][1] if group else NOOP
+
+        for address, instruction in group:
+            if isinstance(instruction, LDR_Instruction) and self._fetch_reading:
+                # the fetch stage is using the read channel
+                self._stalled_memory = True
+                return
+
+            if not STAGE_HANDLERS[instruction.opcode].memory(instruction):
+                self._stalled_memory = True
+                return
+
+        self._stalled_memory = False
+        self._mw_group = group
+        self._em_group = []
+
+    def stage_execute(self) -> None:
+        group = self._de_group
+        self._de_group = []
+        self._pipeline[2] = group[-1][1] if group else NOOP
+
+        for address, instruction in group:
+            if not isinstance(instruction, B_Instruction):
+                STAGE_HANDLERS[instruction.opcode].execute(instruction)
+                continue
+
+            # point the PC at the branch while it is executed so that BL links to the instruction after it,
+            # it is moved to the branch's target if the branch is taken
+            pc = self._pc
+            self._pc = address
+            self._squashed = False
+            STAGE_HANDLERS[instruction.opcode].execute(instruction)
+            if not self._squashed:
+                self._pc = pc
+
+        self._em_group = group
+
+    def stage_decode(self) -> None:
+        fetched = self._fd_group
+        self._pipeline[1] = NOOP
+        if not fetched:
+            return
+
+        group: List[Slot] = []
+        written: Set[int] = set()
+        split = None
+
+        for address, instruction in fetched:
+            if instruction is not NOOP and instruction._decoded is None:
+                instruction.decode()
+
+            reads, writes = self.hazard_registers(instruction)
+
+            if self.pairing_conflict(instruction, group):
+                split = 'pairing'
+                break
+            if any(reg in written for reg in reads):
+                split = 'dependency'
+                break
+            if any(self._pending_writes[reg] for reg in reads):
+                # waiting for an instruction in flight to write back
+                split = 'stall'
+                break
+
+            group.append((address, instruction))
+            written.update(writes)
+
+        if not group:
+            self.stats.dependency_stalls += 1
+            return
+
+        for address, instruction in group:
+            for reg in self.hazard_registers(instruction)[1]:
+                self._pending_writes[reg] += 1
+
+        stats = self.stats
+        stats.groups += 1
+        for slot in range(len(group)):
+            stats.slot_issued[slot] += 1
+
+        if len(group) < self.issue_width:
+            if split == 'pairing':
+                stats.pairing_splits += 1
+            elif split is not None:
+                stats.dependency_splits += 1
+            else:
+                stats.fetch_splits += 1
+
+        self._de_group = group
+        self._fd_group = fetched[len(group):]
+        self._pipeline[1] = group[-1][1]
+
+    def stage_fetch(self) -> None:
+        self._pipeline[0] = NOOP
+        if self._fd_group or self._is_finished:
+            return
+
+        if self._memory._is_reading and not self._fetch_reading:
+            # a load is using the read channel
+            return
+
+        address = self._pc % EISA.RAM_ADDR_SPACE
+        self._fetch_reading = True
+        request = self._memory.read(address, fetch=True)
+        if request.status is RequestStatus.PENDING:
+            return
+
+        self._fetch_reading = False
+
+        # the rest of the cache line is in the L1 cache now that the first word has been read
+        words = [request.value] + self._memory.cached_line(address + 1, self.issue_width - 1)
+
+        group: List[Slot] = []
+        for offset, word in enumerate(words):
+            addr = (address + offset) % EISA.RAM_ADDR_SPACE
+            instruction = NOOP if word == 0 else Instruction.from_decoded(self, self.predecode(addr, word), addr)
+            group.append((addr, instruction))
+
+            if isinstance(instruction, B_Instruction):
+                break
+            if instruction.opcode == OpCode.END:
+                self._is_finished = True
+                break
+
+        self._fd_group = group
+        self._pipeline[0] = group[-1][1]
+        self._pc += len(group)
+
+    # endregion stages
+
+    def cycle_pipeline(self):
+        """runs a single cycle of the pipeline, the stages are run from writeback to fetch so that each stage sees
+        the state the later stages have left behind, the same as the scalar pipeline
+        """
+        self.stage_writeback()
+        self.stage_memory()
+
+        if not self._stalled_memory:
+            self.stage_execute()
+            self.stage_decode()
+        else:
+            self._pipeline[1] = self._pipeline[2] = NOOP
+
+        self.stage_fetch()
+
+        self._cycles += 1
+
+    def _frozen_state(self) -> tuple:
+        groups = (self._fd_group, self._de_group, self._em_group, self._mw_group)
+        return super()._frozen_state() + (
+            tuple(tuple((address, id(instruction), instruction.computed) for address, instruction in group) for group in groups),
+            tuple(self._pending_writes), self._fetch_reading,
+        )
+
+    def flush(self, pc: int) -> None:
+        super().flush(pc)
+
+        self._fd_group = []
+        self._de_group = []
+        self._em_group = []
+        self._mw_group = []
+        self._pending_writes = [0 for i in range(len(self._registers))]
+
+        self._fetch_reading = False
+        self._squashed = False
+
+    def is_quiescent(self) -> bool:
+        return super().is_quiescent() \
+            and not (self._fd_group or self._de_group or self._em_group or self._mw_group)
@@ -10,7 +10,9 @@ from PyQt6.uic.properties import QtCore, QtGui
 
 import memory_devices
 from memory_subsystem import MemorySubsystem
-from pipeline import PipeLine, Instruction, DecodeError, Instructions, OpCode, ConditionCode
+from pipeline import PipeLine, Instruction, DecodeError, Instructions, OpCode, ConditionCode, StopReason
+from history import History
+from cpi_stack import CPIStack
 
 from eisa import EISA
 
@@ -322,6 +324,7 @@ class EISADialog(QMainWindow):
 
     _memory: MemorySubsystem
     _pipeline: PipeLine
+    _history: History
     _hex: bool
 
     already_max: bool
@@ -334,6 +337,9 @@ class EISADialog(QMainWindow):
         super().__init__(parent)
         self._memory = memory
         self._pipeline = pipeline
+        if pipeline.cpi_stack is None:
+            pipeline.cpi_stack = CPIStack()
+        self._history = History(pipeline)
         self._hex = True
         self.run_to_completion = False
 
@@ -391,6 +397,8 @@ class EISADialog(QMainWindow):
         self.SP.setText(f"Stack Pointer: {str(self._pipeline.sp)}")
         self.cycle_counter.setText(f"Cycles: {self._pipeline._cycles}")
         self.flags.setText(f"Flags: {str(self._pipeline.condition_flags)}")
+        retired = self._pipeline._instructions_retired
+        self.cpi_counter.setText(f"CPI: {self._pipeline._cycles / retired:.3f}" if retired else "CPI: -")
 
     def cycle_ui(self, event):
         try:
@@ -401,18 +409,51 @@ class EISADialog(QMainWindow):
             return
 
         if self.run_to_completion:
-            while self._pipeline._pipeline[4].opcode != 32:
-                self._pipeline.cycle_pipeline()
-                if self._pipeline._cycles >= EISA.PROGRAM_MAX_CYCLE_LIMIT:
-                    self.error_dialog = QMessageBox().critical(self, "Cycle Limit Reached",
-                                                               "Maximum number of cycles reached.")
-                    break
-            self._pipeline.cycle_pipeline()
+            result = self._history.run(max_cycles=int(EISA.PROGRAM_MAX_CYCLE_LIMIT) - self._pipeline._cycles)
+            if result.stop_reason is StopReason.CYCLES:
+                self.error_dialog = QMessageBox().critical(self, "Cycle Limit Reached",
+                                                           "Maximum number of cycles reached.")
+            self._history.cycle(1)
         else:
-            self._pipeline.cycle(cycles)
+            self._history.cycle(cycles)
 
         self.update_ui()
 
+    def step_back_ui(self, event):
+        try:
+            cycles = int(self.cycles_editor.text())
+        except ValueError:
+            self.error_dialog = QMessageBox().critical(self, "Invalid Cycle Number",
+                                                       "Please enter a valid number of cycles.")
+            return
+
+        self._history.step_back(cycles)
+        self.update_ui()
+
+    def run_back_ui(self, event):
+        try:
+            address = int(self.run_back_editor.text(), 0)
+        except ValueError:
+            self.error_dialog = QMessageBox().critical(self, "Invalid Address",
+                                                       "Please enter a valid address to run back to.")
+            return
+
+        if self._history.run_back(address) is None:
+            self.error_dialog = QMessageBox().critical(self, "Address Not Reached",
+                                                       f"The PC has not reached {address} since cycle {self._history.oldest_cycle}.")
+        self.update_ui()
+
+    def show_cpi_stack(self, event):
+        cpi_stack = self._pipeline.cpi_stack
+        if cpi_stack is None:
+            return
+
+        dialog = QMessageBox(self)
+        dialog.setWindowTitle("CPI Stack")
+        dialog.setTextFormat(Qt.TextFormat.RichText)
+        dialog.setText(f"<pre>{cpi_stack}</pre>")
+        dialog.exec()
+
     def build_stages(self):
         self.stage_fetch = StageGroup("Fetch")  # self.create_stage_group("Fetch")
         self.stage_decode = StageGroup("Decode")  # self.create_stage_group("Decode")
@@ -446,6 +487,12 @@ class EISADialog(QMainWindow):
         self.matrix_button.clicked.connect(self.load_matrix_demo)
         self.cycle_button = QPushButton("Cycle")
         self.cycle_button.clicked.connect(self.cycle_ui)
+        self.step_back_button = QPushButton("Step Back")
+        self.step_back_button.clicked.connect(self.step_back_ui)
+        self.run_back_button = QPushButton("Run Back To PC")
+        self.run_back_button.clicked.connect(self.run_back_ui)
+        self.cpi_button = QPushButton("CPI Stack")
+        self.cpi_button.clicked.connect(self.show_cpi_stack)
 
         button_layout = QHBoxLayout()
         button_layout.addWidget(self.reload_button)
@@ -453,6 +500,9 @@ class EISADialog(QMainWindow):
         button_layout.addWidget(self.exch_button)
         button_layout.addWidget(self.matrix_button)
         button_layout.addWidget(self.cycle_button)
+        button_layout.addWidget(self.step_back_button)
+        button_layout.addWidget(self.run_back_button)
+        button_layout.addWidget(self.cpi_button)
 
         counters_group = QGroupBox()
         counters_layout = QHBoxLayout()
@@ -461,10 +511,12 @@ class EISADialog(QMainWindow):
         self.SP = QLabel(f"Stack Pointer: {self._pipeline.sp}")
         self.flags = QLabel(f"Flags: {str(self._pipeline.condition_flags)}")
         self.cycle_counter = QLabel(f"Cycle: {self._pipeline._cycles}")
+        self.cpi_counter = QLabel("CPI: -")
 
         counters_layout.addWidget(self.pc_counter, alignment=Qt.AlignmentFlag.AlignLeft)
         counters_layout.addWidget(self.SP, alignment=Qt.AlignmentFlag.AlignLeft)
         counters_layout.addWidget(self.cycle_counter, alignment=Qt.AlignmentFlag.AlignLeft)
+        counters_layout.addWidget(self.cpi_counter, alignment=Qt.AlignmentFlag.AlignLeft)
         counters_layout.addWidget(self.flags, alignment=Qt.AlignmentFlag.AlignLeft)
         counters_group.setLayout(counters_layout)
 
@@ -488,6 +540,11 @@ class EISADialog(QMainWindow):
         minor_cycle_layout.addWidget(self.cycles_editor)
         cycle_layout.addLayout(minor_cycle_layout)
         self.cycles_editor.setDisabled(True)
+        run_back_layout = QHBoxLayout()
+        self.run_back_editor = QLineEdit("0")
+        run_back_layout.addWidget(QLabel("Run Back To PC: "))
+        run_back_layout.addWidget(self.run_back_editor)
+        cycle_layout.addLayout(run_back_layout)
 
         self.run_to_completion_enabled_box = QCheckBox("Enable Run-To-Completion")
         self.run_to_completion_enabled_box.toggled.connect(self.toggle_run_to_completion)
@@ -557,10 +614,12 @@ class EISADialog(QMainWindow):
             self._memory._cache2 = memory_devices.Cache(0, 0, self._memory._RAM, self._memory.cache2_read_speed,
                                                        self._memory.cache2_write_speed, self._memory.cache_evict_cb, level=2)
 
+        self._history.reset()
         self.update_ui()
 
     def toggle_pipeline(self):
         self._pipeline.yes_pipe = not self._pipeline.yes_pipe
+        self._history.reset()
 
     def resize_tables(self):
 
@@ -647,11 +706,13 @@ class EISADialog(QMainWindow):
     def reset_ram(self):
         for i in range(EISA.RAM_ADDR_SPACE):
             self._memory._RAM[i] = 0
+        self._history.reset()
         self.update_ui()
 
     def reset_regs(self):
         for i in range(len(self._pipeline._registers)):
             self._pipeline._registers[i] = 0
+        self._history.reset()
         self.update_ui()
 
     def reset_cache(self):
@@ -662,6 +723,7 @@ class EISADialog(QMainWindow):
                                                     self._memory.cache2_read_speed, self._memory.cache2_write_speed,
                                                     self._memory.cache_evict_cb, level=2)
         self.cache_enabled_box.setChecked(False)
+        self._history.reset()
         self.update_ui()
 
     def reset_cache2(self):
@@ -672,6 +734,7 @@ class EISADialog(QMainWindow):
                                                    self._memory.cache_read_speed, self._memory.cache_write_speed,
                                                    self._memory.cache_evict_cb)
         self.cache_enabled_box.setChecked(False)
+        self._history.reset()
         self.update_ui()
 
     def destroy_stage_fields(self):
@@ -808,6 +871,8 @@ class EISADialog(QMainWindow):
         self._memory = MemorySubsystem(EISA.ADDRESS_SIZE, EISA.CACHE_SIZE, EISA.CACHE_READ_SPEED,
                                        EISA.CACHE_WRITE_SPEED, EISA.RAM_SIZE, EISA.RAM_READ_SPEED, EISA.RAM_WRITE_SPEED)
         self._pipeline = PipeLine(0, [0] * 32, self._memory)
+        self._pipeline.cpi_stack = CPIStack()
+        self._history = History(self._pipeline)
 
         self.cache_enabled_box.setChecked(False)
         self.pipeline_enabled.setChecked(False)
@@ -839,6 +904,7 @@ class EISADialog(QMainWindow):
         for i in range(len(self.program_lines)):
             self._memory._RAM[i] = int(self.program_lines[i], 2)
 
+        self._history.reset()
         self.update_ui()
 
     def reload_program(self):
@@ -847,6 +913,7 @@ class EISADialog(QMainWindow):
         try:
             for i in range(len(self.program_lines)):
                 self._memory._RAM[i] = int(self.program_lines[i], 2)
+            self._history.reset()
             self.update_ui()
         except AttributeError:
             self.error_dialog = QMessageBox().critical(self, "No Program Loaded",
@@ -880,6 +947,7 @@ class EISADialog(QMainWindow):
             for i, j in zip(range(i, i + ARRAY_SIZE), range(ARRAY_SIZE, 0, -1)):
                 self._memory._RAM[i] = j
 
+        self._history.reset()
         self.update_ui()
 
 
@@ -916,6 +984,7 @@ class EISADialog(QMainWindow):
                 value_counter += 1
                 address_counter += 1
 
+        self._history.reset()
         self.update_ui()
 
 
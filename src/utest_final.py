@@ -4,17 +4,64 @@ from numpy.random import default_rng
 
 from clock import *
 from eisa import EISA
-from memory_subsystem import MemorySubsystem
+from memory_subsystem import MemorySubsystem, RequestStatus, HitLevel
 from ui import EISADialog
 import aenum
 from pipeline import *
+from functional import FunctionalCore, fast_forward
+from benchmark import benchmark, count_allocations, default_program, load_pipeline
+from branch_predictor import *
+from scoreboard import *
+from superscalar import *
+from checkpoint import save_checkpoint, load_checkpoint, CheckpointError
+from history import History
+from batch import Job, MachineConfig, build_pipeline, run_batch, run_job
+from multicore import MultiCore, LineState
+from cpi_stack import CPIStack, CycleCategory
+from profiler import Profiler
+from disassembler import disassemble
+from retire_trace import RetireTrace, load_trace
+from cache_trace import AccessTrace, AccessKind, CacheConfig, HierarchyConfig, TraceCache, record_trace, replay, sweep, format_results
+from vector_cache import cache_hits, stack_distances, trace_addresses
+from reuse_distance import miss_ratio_curve
+from miss_classes import MissClass, classify_misses
+from belady import compare_to_opt, format_comparisons, opt_hits
+from memory_devices import ArrayCache, Cache, MemoryMissError, RAM
+import numpy as np
+import io
 import os
 import subprocess, shlex
+import tempfile
 
 dir_name = os.path.dirname(__file__)
 assembler_path = os.path.join(dir_name, 'assembler.py')
 
 
+def load_exchange_sort() -> PipeLine:
+    """the exchange sort demo with a 16 element array, on a pipeline with the default settings
+    """
+    return load_pipeline(default_program, 16, True)
+
+
+def encode(program: List[Dict[str, int]]) -> List[int]:
+    """assembles the fields of each instruction into its word
+    """
+    return [Instructions[fields['opcode']].encoding(val=fields)._bits for fields in program]
+
+
+def load_program(program: List[Dict[str, int]], forwarding: bool) -> PipeLine:
+    """a pipeline with the program at address 0, and a small cache so the tests don't wait on memory for long
+    """
+    memory = MemorySubsystem(EISA.ADDRESS_SIZE, 4, 1, 1, EISA.ADDRESS_SIZE, 2, 2)
+    pipeline = PipeLine(0, [0 for i in range(EISA.NUM_GP_REGS)], memory)
+    pipeline.forwarding = forwarding
+
+    for addr, word in enumerate(encode(program)):
+        memory._RAM[addr] = word
+
+    return pipeline
+
+
 class pipeline_stress_test(unittest.TestCase):
     memory = MemorySubsystem(EISA.ADDRESS_SIZE, 4, 1, 1, EISA.ADDRESS_SIZE, 2, 2)
     pipeline = PipeLine(0, [0 for i in range(EISA.NUM_GP_REGS)], memory)
@@ -40,12 +87,8 @@ class pipeline_stress_test(unittest.TestCase):
         # Cycle until an END instruction is found in writeback
         #   If no END instruction is encounter within 20k cycles,
         #   report a failure.
-        cycle_counter = 0
-        while self.pipeline._pipeline[4].opcode != OpCode.END and cycle_counter <= self.max_instructions:
-            self.pipeline.cycle_pipeline()
-            cycle_counter += 1
-
-        self.assertLessEqual(cycle_counter, self.max_instructions)
+        result = self.pipeline.run(max_cycles=self.max_instructions)
+        self.assertEqual(result.stop_reason, StopReason.END)
 
         # Verify arithmetic
         self.assertEqual(20, self.pipeline._registers[1])  # ADD R1, R1, #20
@@ -74,12 +117,8 @@ class pipeline_stress_test(unittest.TestCase):
         # Cycle until an END instruction is found in writeback.
         #   If no END instruction is encounter within 20k cycles,
         #   report a failure.
-        cycle_counter = 0
-        while self.pipeline._pipeline[4].opcode != OpCode.END and cycle_counter <= self.max_instructions:
-            self.pipeline.cycle_pipeline()
-            cycle_counter += 1
-
-        self.assertLessEqual(cycle_counter, self.max_instructions)
+        result = self.pipeline.run(max_cycles=self.max_instructions)
+        self.assertEqual(result.stop_reason, StopReason.END)
 
         # Verify arithmetic
         self.assertEqual(20, self.pipeline._registers[1])
@@ -106,12 +145,8 @@ class pipeline_stress_test(unittest.TestCase):
         # Cycle until an END instruction is found in writeback.
         #   If no END instruction is encounter within 20k cycles,
         #   report a failure.
-        cycle_counter = 0
-        while self.pipeline._pipeline[4].opcode != OpCode.END and cycle_counter <= self.max_instructions:
-            self.pipeline.cycle_pipeline()
-            cycle_counter += 1
-
-        self.assertLessEqual(cycle_counter, self.max_instructions)
+        result = self.pipeline.run(max_cycles=self.max_instructions)
+        self.assertEqual(result.stop_reason, StopReason.END)
 
         # Verify arithmetic
         self.assertEqual(25, self.pipeline._registers[25])
@@ -182,10 +217,7 @@ class pipeline_stress_test(unittest.TestCase):
         # Cycle until an END instruction is found in writeback.
         #   If no END instruction is encounter within 20k cycles,
         #   report a failure.
-        cycle_counter = 0
-        while self.pipeline._pipeline[4].opcode != OpCode.END and cycle_counter <= self.max_instructions:
-            self.pipeline.cycle_pipeline()
-            cycle_counter += 1
+        self.pipeline.run(max_cycles=self.max_instructions + 1)
 
         # Verify arithmetic
         self.assertEqual(50, self.memory._RAM[6])
@@ -217,11 +249,9 @@ class pipeline_stress_test(unittest.TestCase):
 
         """ Copied and edited from ui.py (self.cycle_ui) """
         #  Cycle the pipeline until either an END op is found in writeback or the cycle limit is reached
-        while self.pipeline._pipeline[4].opcode != 32:
-            self.pipeline.cycle_pipeline()
-            if self.pipeline._cycles >= self.max_instructions:
-                print(f"Error: Exceeded maximum number of program cycles: {self.max_instructions}")
-                break
+        result = self.pipeline.run(max_cycles=self.max_instructions - self.pipeline._cycles)
+        if result.stop_reason is StopReason.CYCLES:
+            print(f"Error: Exceeded maximum number of program cycles: {self.max_instructions}")
         self.pipeline.cycle_pipeline()
 
         # Verify that each element in the array is less than or equal to its adjacent successor
@@ -255,11 +285,9 @@ class pipeline_stress_test(unittest.TestCase):
 
         """ Copied and edited from ui.py (self.cycle_ui) """
         #  Cycle the pipeline until either an END op is found in writeback or the cycle limit is reached
-        while self.pipeline._pipeline[4].opcode != 32:
-            self.pipeline.cycle_pipeline()
-            if self.pipeline._cycles >= self.max_instructions:
-                print(f"Error: Exceeded maximum number of program cycles: {self.max_instructions}")
-                break
+        result = self.pipeline.run(max_cycles=self.max_instructions - self.pipeline._cycles)
+        if result.stop_reason is StopReason.CYCLES:
+            print(f"Error: Exceeded maximum number of program cycles: {self.max_instructions}")
         self.pipeline.cycle_pipeline()
 
         # Verify that each element in the array is less than or equal to its adjacent successor
@@ -298,11 +326,9 @@ class pipeline_stress_test(unittest.TestCase):
 
         """ Copied and edited from ui.py (self.cycle_ui) """
         #  Cycle the pipeline until either an END op is found in writeback or the cycle limit is reached
-        while self.pipeline._pipeline[4].opcode != 32:
-            self.pipeline.cycle_pipeline()
-            if self.pipeline._cycles >= self.max_instructions:
-                print(f"Error: Exceeded maximum number of program cycles: {self.max_instructions}")
-                break
+        result = self.pipeline.run(max_cycles=self.max_instructions - self.pipeline._cycles)
+        if result.stop_reason is StopReason.CYCLES:
+            print(f"Error: Exceeded maximum number of program cycles: {self.max_instructions}")
         self.pipeline.cycle_pipeline()
 
         # Verify that each element in the array is less than or equal to its adjacent successor
@@ -359,5 +385,1236 @@ class pipeline_stress_test(unittest.TestCase):
         return assembled_lines
 
 
+class decode_cache_test(unittest.TestCase):
+
+    def test_store_invalidates_decoded_instruction(self):
+        memory = MemorySubsystem(EISA.ADDRESS_SIZE, 4, 1, 1, EISA.ADDRESS_SIZE, 2, 2)
+        pipeline = PipeLine(0, [0 for i in range(EISA.NUM_GP_REGS)], memory)
+
+        add = Instructions[OpCode.ADD].encoding(val={'opcode': OpCode.ADD, 'dest': 1, 'op1': 1, 'op2': 2})._bits
+
+        entry = pipeline.predecode(3, add)
+        self.assertIs(entry, pipeline.predecode(3, add))  # reused while the word is unchanged
+        self.assertEqual(entry.instruction_type.mnemonic, 'ADD')
+        self.assertEqual(sorted(entry.dependencies), [1, 2])
+
+        # a word that was changed behind the pipeline's back gets decoded again
+        self.assertEqual(pipeline.predecode(3, 0b0).opcode, OpCode.NOOP)
+
+        pipeline.invalidate_decoded(3)
+        self.assertNotIn(3, pipeline._decode_cache)
+
+
+class functional_core_test(unittest.TestCase):
+    def run_pipeline(self, pipeline: PipeLine):
+        pipeline.run(max_cycles=100000)
+
+    def test_matches_pipeline(self):
+        reference = load_exchange_sort()
+        self.run_pipeline(reference)
+
+        functional = load_exchange_sort()
+        core = FunctionalCore(functional)
+        core.run()
+
+        self.assertTrue(core.is_finished)
+        self.assertEqual(reference._memory._RAM._memory, functional._memory._RAM._memory)
+        self.assertEqual(reference._registers[:SpecialRegister.zr], functional._registers[:SpecialRegister.zr])
+
+    def test_switch_to_pipeline(self):
+        reference = load_exchange_sort()
+        self.run_pipeline(reference)
+
+        pipeline = load_exchange_sort()
+        core = fast_forward(pipeline, max_instructions=200)
+        self.assertEqual(core.instructions, 200)
+
+        self.run_pipeline(pipeline)
+        self.assertEqual(reference._memory._RAM._memory, pipeline._memory._RAM._memory)
+
+    def test_until_pc(self):
+        pipeline = load_exchange_sort()
+        core = FunctionalCore(pipeline)
+        core.run(until_pc=9)
+
+        self.assertEqual(pipeline._pc, 9)
+        self.assertFalse(core.is_finished)
+
+    def test_translated_blocks(self):
+        interpreted = load_exchange_sort()
+        interpreted_core = FunctionalCore(interpreted, translate=False)
+        interpreted_core.run()
+
+        translated = load_exchange_sort()
+        translated_core = FunctionalCore(translated, hot_threshold=1)
+        translated_core.run()
+
+        self.assertTrue(translated_core._blocks)
+        self.assertEqual(interpreted_core.instructions, translated_core.instructions)
+        self.assertEqual(interpreted._memory._RAM._memory, translated._memory._RAM._memory)
+        self.assertEqual(interpreted._registers, translated._registers)
+
+    def test_store_invalidates_block(self):
+        pipeline = load_exchange_sort()
+        core = FunctionalCore(pipeline, hot_threshold=1)
+        core.run(max_instructions=500)
+
+        start = next(iter(core._blocks))
+        self.assertTrue(core._store(start, pipeline._memory._RAM[start]))
+        self.assertNotIn(start, core._blocks)
+        self.assertNotIn(start, core._code_map)
+
+
+class stall_skip_test(unittest.TestCase):
+    def test_matches_cycle_by_cycle(self):
+        reference = load_exchange_sort()
+        reference.skip_stalls = False
+
+        skipping = load_exchange_sort()
+
+        # check the state in chunks, so that skips have to stop part way through stalls
+        while reference._pipeline[4].opcode != OpCode.END and reference._cycles < 100000:
+            reference.cycle(137)
+            skipping.cycle(137)
+
+            self.assertEqual(reference._cycles, skipping._cycles)
+            self.assertEqual(reference._frozen_state(), skipping._frozen_state())
+            self.assertEqual(reference._memory.stalls_remaining_reading, skipping._memory.stalls_remaining_reading)
+            self.assertEqual(reference._memory.stalls_remaining_writing, skipping._memory.stalls_remaining_writing)
+
+        self.assertEqual(reference._memory._RAM._memory, skipping._memory._RAM._memory)
+
+    def test_skips_memory_stall(self):
+        pipeline = load_exchange_sort()
+
+        # the very first fetch misses in the cache, so the pipeline freezes until RAM responds
+        calls = 0
+        while pipeline._cycles < EISA.RAM_READ_SPEED:
+            pipeline.cycle_skipping(EISA.RAM_READ_SPEED - pipeline._cycles)
+            calls += 1
+
+        self.assertEqual(pipeline._cycles, EISA.RAM_READ_SPEED)
+        self.assertLess(calls, 10)
+
+
+class memory_request_test(unittest.TestCase):
+    def setUp(self):
+        self.memory = MemorySubsystem(EISA.ADDRESS_SIZE, EISA.CACHE_SIZE, EISA.CACHE_READ_SPEED, EISA.CACHE_WRITE_SPEED,
+                                      EISA.RAM_SIZE, EISA.RAM_READ_SPEED, EISA.RAM_WRITE_SPEED)
+
+    def test_read_miss(self):
+        self.memory._RAM[5] = 42
+
+        request = self.memory.read(5)
+        self.assertEqual(request.status, RequestStatus.PENDING)
+        self.assertEqual(request.stalls_remaining, EISA.RAM_READ_SPEED)
+
+        # the read needs to be polled once per stalled cycle
+        polls = 0
+        while not self.memory.read(5).ready:
+            polls += 1
+
+        self.assertEqual(polls + 1, EISA.RAM_READ_SPEED)
+        self.assertTrue(request.ready)
+        self.assertEqual(request.value, 42)
+
+        # the line is in the cache now, so the next read is quicker
+        polls = 1
+        while not (hit := self.memory.read(6)).ready:
+            polls += 1
+        self.assertIsNot(hit, request)
+        self.assertLess(polls, EISA.RAM_READ_SPEED)
+
+    def test_write(self):
+        request = self.memory.write(7, 13)
+        while not request.ready:
+            self.assertIs(self.memory.write(7, 13), request)
+
+        self.assertEqual(self.memory._RAM[7], 13)
+        self.assertEqual(request.stalls_remaining, 0)
+
+    def test_other_address(self):
+        self.memory._RAM[4] = 7
+        self.memory._RAM[45] = 42
+
+        # a fetch of another address waits for the load using the channel, without moving it on
+        load = self.memory.read(45)
+        for i in range(10):
+            waiting = self.memory.read(4, fetch=True)
+            self.assertEqual((waiting.address, waiting.status), (4, RequestStatus.PENDING))
+            self.assertIsNot(waiting, load)
+        self.assertEqual(load.stalls_remaining, EISA.RAM_READ_SPEED)
+
+        polls = 1
+        while not self.memory.read(45).ready:
+            polls += 1
+        self.assertEqual(polls, EISA.RAM_READ_SPEED)
+        self.assertEqual((load.address, load.value), (45, 42))
+
+        # a load takes the channel from a fetch of another address, and pays for its own miss
+        fetch = self.memory.read(4, fetch=True)
+        self.memory.read(4, fetch=True)
+        load = self.memory.read(50)
+        self.assertIsNot(load, fetch)
+        self.assertEqual(fetch.status, RequestStatus.PENDING)
+        self.assertEqual(load.stalls_remaining, EISA.RAM_READ_SPEED)
+        while not self.memory.read(50).ready:
+            pass
+        self.assertEqual(load.address, 50)
+        self.assertFalse(self.memory.l1_holds(4))
+        self.assertTrue(self.memory.l1_holds(50))
+
+        # the fetch starts again once it is polled
+        fetch = self.memory.read(4, fetch=True)
+        while not self.memory.read(4, fetch=True).ready:
+            pass
+        self.assertEqual((fetch.address, fetch.value), (4, 7))
+
+
+class shared_noop_test(unittest.TestCase):
+    def test_frozen(self):
+        with self.assertRaises(AttributeError):
+            NOOP.computed = 1
+        with self.assertRaises(AttributeError):
+            NOOP['opcode'] = 1
+
+        self.assertEqual(NOOP.opcode, OpCode.NOOP)
+        self.assertEqual(NOOP.dependencies(), [])
+
+    def test_no_allocations_while_stalled(self):
+        pipeline = load_exchange_sort()
+
+        # the first fetch misses in the cache, so nothing should be created while waiting on RAM
+        pipeline.cycle_pipeline()
+        with count_allocations([Instruction, BitVector]) as counts:
+            pipeline.cycle(EISA.RAM_READ_SPEED // 2)
+
+        self.assertEqual(counts, {'Instruction': 0, 'BitVector': 0})
+
+
+class dispatch_test(unittest.TestCase):
+    def setUp(self):
+        memory = MemorySubsystem(EISA.ADDRESS_SIZE, EISA.CACHE_SIZE, EISA.CACHE_READ_SPEED, EISA.CACHE_WRITE_SPEED,
+                                 EISA.RAM_SIZE, EISA.RAM_READ_SPEED, EISA.RAM_WRITE_SPEED)
+        self.pipeline = PipeLine(0, [0 for i in range(EISA.NUM_GP_REGS)], memory)
+
+    def test_condition_flags(self):
+        flags = self.pipeline.condition_flags
+        flags['z'] = True
+        flags['v'] = True
+        self.assertEqual(self.pipeline._nzcv, 0b0101)
+        self.assertEqual(dict(self.pipeline.condition_flags), {'n': False, 'z': True, 'c': False, 'v': True})
+
+        self.pipeline.condition_flags = {'n': True, 'z': False, 'c': True, 'v': False}
+        self.assertEqual(self.pipeline._nzcv, 0b1010)
+
+    def test_condition_table(self):
+        self.pipeline.condition_flags = {'n': False, 'z': True, 'c': False, 'v': False}
+        self.assertTrue(CONDITION_TABLE[ConditionCode.EQ][self.pipeline._nzcv])
+        self.assertFalse(CONDITION_TABLE[ConditionCode.NE][self.pipeline._nzcv])
+        self.assertTrue(CONDITION_TABLE[ConditionCode.LE][self.pipeline._nzcv])
+        self.assertFalse(CONDITION_TABLE[ConditionCode.GT][self.pipeline._nzcv])
+        self.assertTrue(all(CONDITION_TABLE[ConditionCode.AL]))
+
+        # compare 3 with 5, which is negative and not zero
+        self.pipeline._nzcv = CMP_Instruction.compute_flags(3 - 5)
+        self.assertTrue(B_Instruction.condition_passed(ConditionCode.LT, self.pipeline.condition_flags))
+        self.assertFalse(B_Instruction.condition_passed(ConditionCode.GE, self.pipeline.condition_flags))
+
+    def test_fetched_type(self):
+        # ADD r1, r1, r2
+        encoded = ALU_Instruction.encoding({'opcode': OpCode.ADD, 'dest': 1, 'op1': 1, 'op2': 2})._bits
+        instruction = Instruction.from_decoded(self.pipeline, self.pipeline.predecode(0, encoded))
+
+        self.assertIs(type(instruction), Instructions[OpCode.ADD])
+        self.assertIs(STAGE_HANDLERS[instruction.opcode].execute, Instructions[OpCode.ADD].execute_stage_func)
+
+
+class run_test(unittest.TestCase):
+    def test_stop_reasons(self):
+        reference = load_exchange_sort()
+        reference.skip_stalls = False
+        while reference._pipeline[4].opcode != OpCode.END:
+            reference.cycle_pipeline()
+
+        pipeline = load_exchange_sort()
+        result = pipeline.run()
+        self.assertEqual(result.stop_reason, StopReason.END)
+        self.assertEqual(result.cycles, reference._cycles)
+        self.assertEqual(result.instructions, reference._instructions_retired)
+
+        pipeline = load_exchange_sort()
+        self.assertEqual(pipeline.run(max_cycles=1000).stop_reason, StopReason.CYCLES)
+        self.assertEqual(pipeline._cycles, 1000)
+
+        result = pipeline.run(max_instructions=10)
+        self.assertEqual(result.stop_reason, StopReason.INSTRUCTIONS)
+        self.assertEqual(result.instructions, 10)
+
+        result = pipeline.run(until_pc=9)
+        self.assertEqual(result.stop_reason, StopReason.PC)
+        self.assertEqual(pipeline._pc, 9)
+
+        result = pipeline.run(predicate=lambda p: p._registers[1] != 0)
+        self.assertEqual(result.stop_reason, StopReason.PREDICATE)
+        self.assertNotEqual(pipeline._registers[1], 0)
+
+
+class forwarding_test(unittest.TestCase):
+    def test_matches_without_forwarding(self):
+        reference = load_exchange_sort()
+        reference.run(max_cycles=100000)
+
+        pipeline = load_exchange_sort()
+        pipeline.forwarding = True
+        self.assertEqual(pipeline.run(max_cycles=100000).stop_reason, StopReason.END)
+
+        self.assertEqual(reference._memory._RAM._memory, pipeline._memory._RAM._memory)
+        self.assertEqual(reference._registers[:SpecialRegister.zr], pipeline._registers[:SpecialRegister.zr])
+        self.assertLessEqual(pipeline._cycles, reference._cycles)
+
+        stats = pipeline.forwarding_stats
+        self.assertLess(stats.dependency_stalls, reference.forwarding_stats.dependency_stalls)
+        self.assertGreater(stats.stalls_avoided, 0)
+        self.assertGreater(stats.forwarded_operands, 0)
+
+    def test_never_slower(self):
+        # the stress programs, apart from the exchange sort which needs its own array, and the demos
+        programs = [os.path.join(dir_name, '..', 'asrc', f'{name}.out')
+                    for name in ('test_add_str', 'test_load', 'test_conditional_branch', 'test_unconditional_branching', 'test_branch_link')]
+        programs += [default_program, os.path.join(dir_name, '..', 'demos', 'matrix_multi.expected')]
+
+        for program in programs:
+            array_size = 16 if program == default_program else 0
+            cycles = []
+            for forwarding in (False, True):
+                pipeline = load_pipeline(program, array_size, True, forwarding)
+                self.assertEqual(pipeline.run(max_cycles=100000).stop_reason, StopReason.END)
+                cycles.append(pipeline._cycles)
+            self.assertLessEqual(cycles[1], cycles[0], program)
+
+    def test_back_to_back(self):
+        # r1 = 5, r2 = r1 + r1, r3 = r2 * r1
+        program = [
+            {'opcode': OpCode.ADD, 'dest': 1, 'op1': 1, 'lit': 1, 'literal': 5},
+            {'opcode': OpCode.ADD, 'dest': 2, 'op1': 1, 'op2': 1},
+            {'opcode': OpCode.MULT, 'dest': 3, 'op1': 2, 'op2': 1},
+            {'opcode': OpCode.END},
+        ]
+
+        reference = load_program(program, False)
+        reference.run(max_cycles=1000)
+        pipeline = load_program(program, True)
+        pipeline.run(max_cycles=1000)
+
+        self.assertEqual(pipeline._registers[1:4], [5, 10, 50])
+        self.assertEqual(reference._registers[1:4], [5, 10, 50])
+        self.assertEqual(pipeline.forwarding_stats.dependency_stalls, 0)
+        self.assertGreater(pipeline.forwarding_stats.forwarded_operands, 0)
+        self.assertGreater(reference.forwarding_stats.dependency_stalls, 0)
+
+    def test_load_use(self):
+        # r1 = [10], r2 = r1 + r1
+        program = [
+            {'opcode': OpCode.LDR, 'dest': 1, 'imm': 1, 'immediate': 10},
+            {'opcode': OpCode.ADD, 'dest': 2, 'op1': 1, 'op2': 1},
+            {'opcode': OpCode.END},
+        ]
+        pipeline = load_program(program, True)
+        pipeline._memory._RAM[10] = 21
+        pipeline.run(max_cycles=1000)
+
+        self.assertEqual(pipeline._registers[2], 42)
+        self.assertGreater(pipeline.forwarding_stats.load_use_stalls, 0)
+        self.assertEqual(pipeline.forwarding_stats.load_use_stalls, pipeline.forwarding_stats.dependency_stalls)
+
+
+class branch_prediction_test(unittest.TestCase):
+    def test_predictors(self):
+        bimodal = BimodalPredictor(16)
+        self.assertFalse(bimodal.predict(5))
+        bimodal.update(5, True)
+        self.assertTrue(bimodal.predict(5))
+        self.assertFalse(bimodal.predict(6))
+
+        # alternating outcomes can only be learned from the history
+        gshare = GSharePredictor(64, 4)
+        for i in range(20):
+            gshare.update(5, i % 2 == 0)
+        correct = 0
+        for i in range(20, 40):
+            correct += gshare.predict(5) == (i % 2 == 0)
+            gshare.update(5, i % 2 == 0)
+        self.assertEqual(correct, 20)
+
+        btb = BranchTargetBuffer(4)
+        btb.insert(3, 10)
+        self.assertEqual(btb.lookup(3), 10)
+        btb.insert(7, 20)  # maps to the same entry
+        self.assertIsNone(btb.lookup(3))
+
+        ras = ReturnAddressStack(2)
+        for address in (1, 2, 3):
+            ras.push(address)
+        self.assertEqual([ras.pop(), ras.pop(), ras.pop()], [3, 2, None])
+
+    def test_matches_without_prediction(self):
+        reference = load_exchange_sort()
+        reference.run(max_cycles=100000)
+
+        for predictor in PREDICTORS.values():
+            pipeline = load_exchange_sort()
+            pipeline.branch_unit = BranchUnit(predictor())
+            self.assertEqual(pipeline.run(max_cycles=100000).stop_reason, StopReason.END)
+
+            self.assertEqual(reference._memory._RAM._memory, pipeline._memory._RAM._memory)
+            self.assertEqual(reference._registers[:SpecialRegister.zr], pipeline._registers[:SpecialRegister.zr])
+            self.assertLess(pipeline._cycles, reference._cycles)
+            self.assertGreater(pipeline.branch_unit.accuracy, 0.9)
+
+            # every branch in the sort is in the per branch stats
+            self.assertEqual(len(pipeline.branch_unit.stats), 5)
+
+    def test_call_return(self):
+        program = [
+            {'opcode': OpCode.BL, 'cond': ConditionCode.AL, 'imm': 1, 'offset': 3},
+            {'opcode': OpCode.ADD, 'dest': 2, 'op1': 2, 'lit': 1, 'literal': 1},
+            {'opcode': OpCode.END},
+            {'opcode': OpCode.ADD, 'dest': 1, 'op1': 1, 'lit': 1, 'literal': 7},
+            {'opcode': OpCode.B, 'cond': ConditionCode.AL, 'imm': 0, 'base': SpecialRegister.lr, 'offset': 0},
+        ]
+        # BL links to the instruction after it whether or not fetch predicts branches
+        for predictor in (None, BimodalPredictor):
+            pipeline = load_program(program, False)
+            if predictor is not None:
+                pipeline.branch_unit = BranchUnit(predictor())
+            self.assertEqual(pipeline.run(max_cycles=1000).stop_reason, StopReason.END)
+
+            self.assertEqual(pipeline._registers[1:3], [7, 1])
+            self.assertEqual(pipeline.lr, 1)
+
+        # the call's target isn't in the branch target buffer yet, but the return is predicted by the return address stack
+        self.assertEqual(pipeline.branch_unit.stats[0].mispredicted, 1)
+        self.assertEqual(pipeline.branch_unit.stats[4].mispredicted, 0)
+
+        # linking never moves the PC, and a branch that was never fetched has nothing to link to
+        pc = pipeline._pc
+        branch = Instructions[OpCode.BL](pipeline, encode(program[:1])[0])
+        with self.assertRaises(ValueError):
+            branch.link()
+        branch.address = 10
+        branch.link()
+        self.assertEqual((pipeline.lr, pipeline._pc), (11, pc))
+
+
+class scoreboard_test(unittest.TestCase):
+    def out_of_order(self, pipeline: PipeLine) -> ScoreboardPipeLine:
+        # swap the in order pipeline for an out of order one, running on the same memory
+        return ScoreboardPipeLine(0, [0 for i in range(EISA.NUM_GP_REGS)], pipeline._memory)
+
+    def test_matches_in_order(self):
+        reference = load_exchange_sort()
+        reference.run(max_cycles=100000)
+
+        for skip_stalls in (False, True):
+            pipeline = self.out_of_order(load_exchange_sort())
+            pipeline.skip_stalls = skip_stalls
+            self.assertEqual(pipeline.run(max_cycles=100000).stop_reason, StopReason.END)
+
+            self.assertEqual(reference._memory._RAM._memory, pipeline._memory._RAM._memory)
+            self.assertEqual(reference._registers[:SpecialRegister.zr], pipeline._registers[:SpecialRegister.zr])
+            self.assertEqual(reference._instructions_retired, pipeline._instructions_retired)
+            self.assertEqual(pipeline.instruction_queue, [])
+
+    def test_dispatch_around_stall(self):
+        # the load has to wait for the store to the same cache block to be written,
+        # and the independent adds after it get dispatched ahead of the add using its result
+        program = [
+            {'opcode': OpCode.ADD, 'dest': 1, 'op1': 1, 'lit': 1, 'literal': 9},
+            {'opcode': OpCode.STR, 'src': 1, 'imm': 1, 'immediate': 20},
+            {'opcode': OpCode.LDR, 'dest': 2, 'imm': 1, 'immediate': 21},
+            {'opcode': OpCode.ADD, 'dest': 3, 'op1': 2, 'op2': 2},
+            {'opcode': OpCode.ADD, 'dest': 4, 'op1': 4, 'lit': 1, 'literal': 5},
+            {'opcode': OpCode.ADD, 'dest': 5, 'op1': 4, 'lit': 1, 'literal': 1},
+            {'opcode': OpCode.END},
+        ]
+        pipeline = self.out_of_order(load_program(program, False))
+        pipeline._memory._RAM[21] = 4
+        self.assertEqual(pipeline.run(max_cycles=1000).stop_reason, StopReason.END)
+
+        self.assertEqual(pipeline._registers[1:6], [9, 4, 8, 5, 6])
+        self.assertEqual(pipeline._memory._RAM[20], 9)
+        self.assertEqual(pipeline.stats.out_of_order_dispatches, 1)
+
+    def test_store_forwarding(self):
+        # r2 = [20] after [20] = 9, r3 = popped r1
+        program = [
+            {'opcode': OpCode.ADD, 'dest': 1, 'op1': 1, 'lit': 1, 'literal': 9},
+            {'opcode': OpCode.STR, 'src': 1, 'imm': 1, 'immediate': 20},
+            {'opcode': OpCode.LDR, 'dest': 2, 'imm': 1, 'immediate': 20},
+            {'opcode': OpCode.PUSH, 'src': 1},
+            {'opcode': OpCode.POP, 'dest': 3},
+            {'opcode': OpCode.END},
+        ]
+        pipeline = self.out_of_order(load_program(program, False))
+        self.assertEqual(pipeline.run(max_cycles=1000).stop_reason, StopReason.END)
+
+        self.assertEqual(pipeline._registers[1:4], [0, 9, 9])
+        self.assertEqual(pipeline._memory._RAM[20], 9)
+        self.assertEqual(pipeline.sp, SpecialRegister.bp)
+        self.assertEqual(pipeline._memory._RAM[SpecialRegister.bp], 0)
+        self.assertGreater(pipeline.stats.store_forwards, 0)
+
+
+class superscalar_test(unittest.TestCase):
+    def superscalar(self, pipeline: PipeLine, issue_width: int) -> SuperscalarPipeLine:
+        # swap the scalar pipeline for a superscalar one, running on the same memory
+        return SuperscalarPipeLine(0, [0 for i in range(EISA.NUM_GP_REGS)], pipeline._memory, issue_width)
+
+    def test_matches_scalar(self):
+        reference = load_exchange_sort()
+        reference.run(max_cycles=100000)
+
+        cycles = []
+        for issue_width in (1, 2):
+            pipeline = self.superscalar(load_exchange_sort(), issue_width)
+            self.assertEqual(pipeline.run(max_cycles=100000).stop_reason, StopReason.END)
+
+            self.assertEqual(reference._memory._RAM._memory, pipeline._memory._RAM._memory)
+            self.assertEqual(reference._registers[:SpecialRegister.zr], pipeline._registers[:SpecialRegister.zr])
+            self.assertEqual(reference._instructions_retired, pipeline._instructions_retired)
+            cycles.append(pipeline._cycles)
+
+        self.assertLess(cycles[1], cycles[0])
+
+        # speedups are reported against the scalar pipeline, not against an issue width of 1
+        results = benchmark(default_program, 16, True, 100000, issue_width=2)
+        self.assertEqual(results['cycles'], cycles[1])
+        self.assertEqual(results['PipeLine cycles'], reference._cycles)
+        self.assertAlmostEqual(results['speedup over PipeLine'], reference._cycles / cycles[1])
+
+    def test_dual_issue(self):
+        # independent adds, like the register setup at the start of the matrix multiply demo
+        program = [{'opcode': OpCode.ADD, 'dest': reg, 'op1': reg, 'lit': 1, 'literal': reg} for reg in range(1, 9)]
+        program.append({'opcode': OpCode.END})
+
+        pipeline = self.superscalar(load_program(program, False), 2)
+        retired_per_cycle = []
+        while pipeline._pipeline[4].opcode != OpCode.END:
+            retired = pipeline._instructions_retired
+            pipeline.cycle_pipeline()
+            retired_per_cycle.append(pipeline._instructions_retired - retired)
+
+        self.assertEqual(pipeline._registers[1:9], list(range(1, 9)))
+        self.assertEqual(max(retired_per_cycle), 2)
+        # the adds are issued in pairs, followed by END on its own
+        self.assertEqual(pipeline.stats.slot_issued, [5, 4])
+
+    def test_pairing(self):
+        # r1 = [10], r2 = [11], r3 = r1 + r2
+        program = [
+            {'opcode': OpCode.LDR, 'dest': 1, 'imm': 1, 'immediate': 10},
+            {'opcode': OpCode.LDR, 'dest': 2, 'imm': 1, 'immediate': 11},
+            {'opcode': OpCode.ADD, 'dest': 3, 'op1': 1, 'op2': 2},
+            {'opcode': OpCode.END},
+        ]
+        pipeline = self.superscalar(load_program(program, False), 2)
+        pipeline._memory._RAM[10] = 3
+        pipeline._memory._RAM[11] = 4
+        self.assertEqual(pipeline.run(max_cycles=1000).stop_reason, StopReason.END)
+
+        self.assertEqual(pipeline._registers[1:4], [3, 4, 7])
+        # the loads can't share the memory port, and the add has to wait for the loads
+        self.assertEqual(pipeline.stats.pairing_splits, 1)
+        self.assertEqual(pipeline.stats.slot_issued[1], 1)
+
+
+class checkpoint_test(unittest.TestCase):
+    def round_trip(self, pipeline: PipeLine) -> PipeLine:
+        file = io.BytesIO()
+        save_checkpoint(pipeline, file)
+        file.seek(0)
+        return load_checkpoint(file)
+
+    def test_resume_matches(self):
+        reference = load_exchange_sort()
+        reference.run(max_cycles=100000)
+
+        for forwarding in (False, True):
+            pipeline = load_exchange_sort()
+            pipeline.forwarding = forwarding
+            # stop part way through a memory stall
+            while pipeline._cycles < 500 or not pipeline._memory._is_reading:
+                pipeline.cycle_pipeline()
+
+            resumed = self.round_trip(pipeline)
+            self.assertEqual(resumed._cycles, pipeline._cycles)
+            self.assertEqual(resumed._frozen_state(), pipeline._frozen_state())
+
+            pipeline.run(max_cycles=100000)
+            self.assertEqual(resumed.run(max_cycles=100000).stop_reason, StopReason.END)
+
+            self.assertEqual(resumed._cycles, pipeline._cycles)
+            self.assertEqual(resumed._registers, pipeline._registers)
+            self.assertEqual(resumed._memory._RAM._memory, pipeline._memory._RAM._memory)
+            self.assertEqual(resumed._memory._RAM._memory, reference._memory._RAM._memory)
+
+    def test_wide_words(self):
+        pipeline = load_exchange_sort()
+        pipeline._memory._RAM[100] = -5
+        pipeline._memory._RAM[101] = 1 << 40
+        pipeline._registers[3] = -(1 << 33)
+
+        resumed = self.round_trip(pipeline)
+        self.assertEqual(resumed._memory._RAM._memory, pipeline._memory._RAM._memory)
+        self.assertEqual(resumed._registers, pipeline._registers)
+
+    def test_rejects(self):
+        with self.assertRaises(CheckpointError):
+            load_checkpoint(io.BytesIO(b'not a checkpoint'))
+
+        pipeline = load_exchange_sort()
+        with self.assertRaises(CheckpointError):
+            save_checkpoint(SuperscalarPipeLine(0, [0 for i in range(EISA.NUM_GP_REGS)], pipeline._memory), io.BytesIO())
+
+
+class history_test(unittest.TestCase):
+    def state(self, pipeline: PipeLine) -> tuple:
+        return pipeline._cycles, pipeline._frozen_state(), list(pipeline._memory._RAM._memory)
+
+    def test_step_back(self):
+        reference = load_exchange_sort()
+        states = {}
+        while reference._cycles <= 3000:
+            states[reference._cycles] = self.state(reference)
+            reference.cycle_pipeline()
+
+        pipeline = load_exchange_sort()
+        history = History(pipeline, interval=500)
+        history.run(max_cycles=3000)
+        self.assertEqual(self.state(pipeline), states[3000])
+
+        for cycles in (1, 499, 500, 1234):
+            cycle = history.step_back(cycles)
+            self.assertEqual(self.state(pipeline), states[cycle])
+
+        # going forwards again records a new future
+        history.cycle(100)
+        self.assertEqual(self.state(pipeline), states[pipeline._cycles])
+
+    def test_run_back(self):
+        reference = load_exchange_sort()
+        pcs = []
+        while reference._cycles < 2000:
+            pcs.append(reference._pc)
+            reference.cycle_pipeline()
+
+        pipeline = load_exchange_sort()
+        history = History(pipeline, interval=300)
+        history.cycle(2000)
+
+        target = pcs[1500]
+        expected = max(cycle for cycle in range(1, 2000) if pcs[cycle] == target and pcs[cycle - 1] != target)
+        self.assertEqual(history.run_back(target), expected)
+        self.assertEqual(pipeline._cycles, expected)
+        self.assertEqual(pipeline._pc, target)
+
+        # an address the PC never reached leaves the pipeline where it was
+        self.assertIsNone(history.run_back(EISA.RAM_ADDR_SPACE - 1))
+        self.assertEqual(pipeline._cycles, expected)
+
+    def test_budget(self):
+        pipeline = load_exchange_sort()
+        history = History(pipeline, interval=100, budget=4000)
+        history.cycle(3000)
+
+        self.assertLessEqual(history.size, 4000)
+        self.assertGreater(history.oldest_cycle, 0)
+        with self.assertRaises(ValueError):
+            history.go_to(0)
+
+
+class batch_test(unittest.TestCase):
+    def exchange_sort_job(self, array_size: int, forwarding: bool) -> Job:
+        program = default_program
+        with open(program) as f:
+            end = len([line for line in f if line.strip()])
+
+        # the array length is stored right after the program, followed by the array
+        return Job(f'exchange sort {array_size}', program, {end: [array_size] + list(range(array_size, 0, -1))},
+                   MachineConfig(forwarding=forwarding), [(end + 1, array_size)])
+
+    def test_matches_serial(self):
+        jobs = [self.exchange_sort_job(array_size, array_size % 2 == 0) for array_size in (4, 5, 6, 7)]
+        jobs.append(Job('missing program', os.path.join(dir_name, 'missing.out')))
+
+        results = {result.name: result for result in run_batch(jobs, workers=2)}
+        self.assertEqual(set(results), {job.name for job in jobs})
+        self.assertIn('FileNotFoundError', results['missing program'].error)
+
+        for job in jobs[:-1]:
+            serial = run_job(job)
+            result = results[job.name]
+            self.assertIsNone(result.error)
+            self.assertEqual(result.stop_reason, 'END')
+            self.assertEqual((result.cycles, result.registers, result.ram, result.stats),
+                             (serial.cycles, serial.registers, serial.ram, serial.stats))
+
+            start, length = job.ram_ranges[0]
+            self.assertEqual(result.ram[start], list(range(1, length + 1)))
+
+    def test_unsupported_config(self):
+        for config in (MachineConfig(out_of_order=True, forwarding=True, predictor='gshare'),
+                       MachineConfig(out_of_order=True, yes_pipe=False), MachineConfig(issue_width=2, forwarding=True),
+                       MachineConfig(out_of_order=True, issue_width=2)):
+            job = Job('unsupported', default_program, config=config)
+            with self.assertRaises(ValueError):
+                build_pipeline(job)
+            self.assertIn('ValueError', run_job(job).error)
+
+
+class multicore_test(unittest.TestCase):
+    def test_single_core_matches(self):
+        reference = load_exchange_sort()
+        reference.run(max_cycles=100000)
+
+        machine = MultiCore(1)
+        # copy the program and the array from the reference's starting RAM
+        start = load_exchange_sort()._memory._RAM._memory
+        machine.load_program(0, start[:100])
+        machine.run(100000)
+
+        self.assertEqual(machine.cycles, reference._cycles)
+        self.assertEqual(machine._RAM._memory, reference._memory._RAM._memory)
+        self.assertEqual(machine.cores[0]._registers[:SpecialRegister.zr], reference._registers[:SpecialRegister.zr])
+        self.assertEqual(machine.bus.stats.invalidations, 0)
+
+    def test_coherence(self):
+        # core 0 updates [40] and [41], core 1 reads [41] before and after
+        writer = [
+            {'opcode': OpCode.LDR, 'dest': 1, 'imm': 1, 'immediate': 40},
+            {'opcode': OpCode.ADD, 'dest': 1, 'op1': 1, 'lit': 1, 'literal': 5},
+            {'opcode': OpCode.STR, 'src': 1, 'imm': 1, 'immediate': 40},
+            {'opcode': OpCode.STR, 'src': 1, 'imm': 1, 'immediate': 41},
+            {'opcode': OpCode.END},
+        ]
+        reader = [{'opcode': OpCode.LDR, 'dest': 2, 'imm': 1, 'immediate': 41}]
+        reader += [{'opcode': OpCode.ADD, 'dest': 4, 'op1': 4, 'lit': 1, 'literal': 1}] * 12
+        reader += [{'opcode': OpCode.LDR, 'dest': 3, 'imm': 1, 'immediate': 41}, {'opcode': OpCode.END}]
+
+        machine = MultiCore(2, ram_read_speed=2, ram_write_speed=2)
+        machine.load_program(0, encode(writer), 0)
+        machine.load_program(1, encode(reader), 100)
+        machine._RAM[40] = 3
+        machine.run(1000)
+
+        self.assertEqual(machine.cores[0]._registers[1], 8)
+        # the first read is before the store, the second sees it
+        self.assertEqual(machine.cores[1]._registers[2:4], [0, 8])
+        self.assertEqual(machine.cores[1]._memory.stats.coherence_misses, 1)
+
+        stats = machine.bus.stats
+        self.assertEqual((stats.bus_upgrades, stats.invalidations, stats.downgrades), (1, 1, 1))
+        self.assertEqual(machine.bus.state(machine.cores[1]._memory, 41), LineState.SHARED)
+        self.assertEqual(machine.bus.state(machine.cores[0]._memory, 41), LineState.SHARED)
+
+        # every core gets its own stack
+        self.assertEqual(machine.cores[1].sp, SpecialRegister.bp - 256)
+
+        # and its own L1 cache, in front of the shared L2 cache and RAM
+        memories = [core._memory for core in machine.cores]
+        self.assertIsNot(memories[0]._cache, memories[1]._cache)
+        for memory in memories:
+            self.assertIs(memory._RAM, machine._RAM)
+            self.assertIs(memory._cache2, machine._cache2)
+            self.assertIs(memory._cache._next_device, machine._RAM)
+
+    def test_upgrade_during_read(self):
+        # core 0 stores to [40] twice, core 1 starts reading [40] at a range of times, so that some of its reads are still
+        # waiting for RAM when core 0 upgrades the line
+        add = {'opcode': OpCode.ADD, 'dest': 4, 'op1': 4, 'lit': 1, 'literal': 1}
+        writer = [
+            {'opcode': OpCode.LDR, 'dest': 1, 'imm': 1, 'immediate': 40},
+            {'opcode': OpCode.ADD, 'dest': 1, 'op1': 1, 'lit': 1, 'literal': 5},
+            {'opcode': OpCode.STR, 'src': 1, 'imm': 1, 'immediate': 40},
+        ]
+        writer += [add] * 20
+        writer += [
+            {'opcode': OpCode.ADD, 'dest': 1, 'op1': 1, 'lit': 1, 'literal': 5},
+            {'opcode': OpCode.STR, 'src': 1, 'imm': 1, 'immediate': 40},
+            {'opcode': OpCode.END},
+        ]
+
+        for delay in range(12):
+            reader = [add] * delay + [{'opcode': OpCode.LDR, 'dest': 2, 'imm': 1, 'immediate': 40}] + [add] * 40
+            reader += [{'opcode': OpCode.LDR, 'dest': 3, 'imm': 1, 'immediate': 40}, {'opcode': OpCode.END}]
+
+            machine = MultiCore(2)
+            machine.load_program(0, encode(writer), 0)
+            machine.load_program(1, encode(reader), 600)
+            while not all(machine.is_finished(core) for core in range(2)):
+                machine.cycle()
+                states = [machine.bus.state(core._memory, 40) for core in machine.cores]
+                # a modified line is never in another core's cache
+                if LineState.MODIFIED in states:
+                    self.assertEqual(states.count(LineState.INVALID), 1, f'delay {delay}, cycle {machine.cycles}')
+
+            self.assertEqual(machine.cores[0]._registers[1], 10)
+            self.assertEqual(machine.cores[1]._registers[3], 10)
+
+
+class cpi_stack_test(unittest.TestCase):
+    def run_with_stack(self, yes_pipe: bool, forwarding: bool, skip_stalls: bool) -> PipeLine:
+        pipeline = load_exchange_sort()
+        pipeline.yes_pipe = yes_pipe
+        pipeline.forwarding = forwarding
+        pipeline.skip_stalls = skip_stalls
+        pipeline.cpi_stack = CPIStack()
+        self.assertEqual(pipeline.run(max_cycles=100000).stop_reason, StopReason.END)
+        return pipeline
+
+    def test_every_cycle_counted(self):
+        for yes_pipe, forwarding in ((True, False), (True, True), (False, False)):
+            pipeline = self.run_with_stack(yes_pipe, forwarding, False)
+            cpi_stack = pipeline.cpi_stack
+            self.assertEqual(sum(cpi_stack.cycles), pipeline._cycles)
+            self.assertEqual(cpi_stack.cycles[CycleCategory.RETIRE], pipeline._instructions_retired)
+            self.assertEqual(sum(cpi_stack.retired.values()), pipeline._instructions_retired)
+            self.assertAlmostEqual(sum(cpi_stack.cpi().values()), pipeline._cycles / pipeline._instructions_retired)
+
+            # skipping over stalls charges the skipped cycles the same as running them one by one
+            skipped = self.run_with_stack(yes_pipe, forwarding, True)
+            self.assertEqual(skipped._cycles, pipeline._cycles)
+            self.assertEqual(skipped.cpi_stack.stack(), cpi_stack.stack())
+            self.assertEqual(skipped.cpi_stack._by_pc, cpi_stack._by_pc)
+
+        self.assertGreater(cpi_stack.cycles[CycleCategory.PIPELINE_DISABLED], 0)
+
+    def test_categories(self):
+        stack = self.run_with_stack(True, False, True).cpi_stack.stack()
+        for category in ('fetch_memory', 'data_memory', 'dependency', 'branch'):
+            self.assertGreater(stack[category], 0)
+        self.assertEqual(stack['pipeline_disabled'], 0)
+
+        # forwarding removes most of the dependency stalls
+        self.assertLess(self.run_with_stack(True, True, True).cpi_stack.stack()['dependency'], stack['dependency'])
+
+    def test_pc_ranges(self):
+        pipeline = self.run_with_stack(True, False, True)
+        cpi_stack = pipeline.cpi_stack
+        total = cpi_stack.stack()
+        unblamed = cpi_stack._by_pc.get(-1, [0 for category in CycleCategory])
+
+        halves = [cpi_stack.stack(None, 10), cpi_stack.stack(10, None)]
+        for i, category in enumerate(total):
+            self.assertEqual(halves[0][category] + halves[1][category] + unblamed[i], total[category])
+        self.assertEqual(cpi_stack.stack(10, 10), {category: 0 for category in total})
+
+    def test_checkpoint(self):
+        reference = self.run_with_stack(True, False, True)
+
+        pipeline = load_exchange_sort()
+        pipeline.cpi_stack = CPIStack()
+        pipeline.run(max_cycles=1234)
+
+        file = io.BytesIO()
+        save_checkpoint(pipeline, file)
+        file.seek(0)
+        resumed = load_checkpoint(file)
+        resumed.run(max_cycles=100000)
+
+        self.assertEqual(resumed.cpi_stack._by_pc, reference.cpi_stack._by_pc)
+        self.assertEqual(resumed.cpi_stack.retired, reference.cpi_stack.retired)
+
+    def test_other_pipelines_refuse(self):
+        memory = MemorySubsystem(EISA.ADDRESS_SIZE, 4, 1, 1, EISA.ADDRESS_SIZE, 2, 2)
+        for pipeline in (ScoreboardPipeLine(0, [0] * 32, memory), SuperscalarPipeLine(0, [0] * 32, memory)):
+            for cpi_stack in (CPIStack(), Profiler()):
+                with self.assertRaises(ValueError):
+                    pipeline.cpi_stack = cpi_stack
+            self.assertIsNone(pipeline.cpi_stack)
+            pipeline.cpi_stack = None
+
+
+class profiler_test(unittest.TestCase):
+    def profile(self, skip_stalls: bool) -> Tuple[PipeLine, Profiler]:
+        pipeline = load_exchange_sort()
+        pipeline.skip_stalls = skip_stalls
+        profiler = pipeline.cpi_stack = Profiler()
+        self.assertEqual(pipeline.run(max_cycles=100000).stop_reason, StopReason.END)
+        return pipeline, profiler
+
+    def test_counts(self):
+        pipeline, profiler = self.profile(True)
+        lines = profiler.flat_profile(pipeline._memory._RAM._memory)
+
+        self.assertEqual(sum(line.executions for line in lines), pipeline._instructions_retired)
+        self.assertEqual(sum(line.cycles for line in lines) + sum(profiler._by_pc.get(-1, [])), pipeline._cycles)
+        for line in lines:
+            # every instruction retired spends exactly one cycle in writeback
+            self.assertEqual(line.stage_cycles[4], line.executions)
+            self.assertLessEqual(line.l2_misses, line.l1_misses)
+        self.assertEqual(lines, sorted(lines, key=lambda line: -line.cycles))
+        self.assertGreater(sum(line.l1_misses for line in lines), 0)
+
+        # skipping over stalls counts the same as running every cycle
+        pipeline, stepped = self.profile(False)
+        self.assertEqual(stepped.stage_cycles, profiler.stage_cycles)
+        self.assertEqual(stepped.l1_misses, profiler.l1_misses)
+        self.assertEqual(stepped.l2_misses, profiler.l2_misses)
+
+    def test_disassembly(self):
+        program = os.path.join(os.path.dirname(__file__), '..', 'demos', 'exchange_sort')
+        with open(program + '.asm') as f:
+            source = [' '.join(line.split(';')[0].split()) for line in f if line.split(';')[0].strip()]
+        with open(program + '.out') as f:
+            self.assertEqual([disassemble(int(line, 2)) for line in f if line.strip()], source)
+
+        self.assertEqual(disassemble(0), 'NOOP')
+        self.assertTrue(disassemble(0xffffffff).startswith('.word'))
+
+
+class retire_trace_test(unittest.TestCase):
+    def trace(self, trace: RetireTrace, skip_stalls: bool = True) -> PipeLine:
+        pipeline = load_exchange_sort()
+        pipeline.skip_stalls = skip_stalls
+        pipeline.on_retire = trace.record
+        self.assertEqual(pipeline.run(max_cycles=100000).stop_reason, StopReason.END)
+        trace.flush()
+        return pipeline
+
+    def test_fields(self):
+        trace = RetireTrace(4096)
+        pipeline = self.trace(trace)
+        entries = trace.entries()
+
+        self.assertEqual(len(entries), pipeline._instructions_retired)
+        self.assertTrue((np.diff(entries['cycle']) > 0).all())
+        words = pipeline._memory._RAM._memory
+        self.assertTrue(all(words[pc] == word for pc, word in zip(entries['pc'], entries['word'])))
+
+        # only the loads and stores access memory, and each of those has a hit level
+        accessed = entries['mem_address'] >= 0
+        self.assertEqual(list(accessed), list(entries['hit_level'] > 0))
+        opcodes = {OpCode.LDR.value, OpCode.STR.value, OpCode.PUSH.value, OpCode.POP.value}
+        self.assertEqual(list(accessed), [DecodedInstruction(int(word)).opcode in opcodes for word in entries['word']])
+        self.assertIn(HitLevel.L1, entries['hit_level'])
+        self.assertIn(HitLevel.RAM, entries['hit_level'])
+
+        # skipping over stalls traces the same as running every cycle
+        stepped = RetireTrace(4096)
+        self.trace(stepped, skip_stalls=False)
+        self.assertTrue((stepped.entries() == entries).all())
+
+    def test_chunks(self):
+        full = RetireTrace(4096)
+        self.trace(full)
+
+        chunks = []
+        streamed = RetireTrace(100, consumer=lambda chunk: chunks.append(chunk.copy()))
+        self.trace(streamed)
+        self.assertTrue(all(len(chunk) == 100 for chunk in chunks[:-1]))
+        self.assertEqual(streamed.chunks, len(chunks))
+        self.assertTrue((np.concatenate(chunks) == full.entries()).all())
+
+        with tempfile.TemporaryDirectory() as directory:
+            saved = RetireTrace(100, directory=directory)
+            self.trace(saved)
+            self.assertTrue((load_trace(directory) == full.entries()).all())
+
+        # without anywhere to send the chunks, the oldest instructions are overwritten
+        ring = RetireTrace(64)
+        self.trace(ring)
+        self.assertEqual(len(ring), 64)
+        self.assertEqual(ring.recorded, len(full))
+        self.assertTrue((ring.entries() == full.entries()[-64:]).all())
+
+    def test_checkpoint(self):
+        pipeline = load_exchange_sort()
+        # stop part way through a memory stall, while the load or store is waiting in the memory stage
+        while pipeline._cycles < 500 or not pipeline._memory._is_reading:
+            pipeline.cycle_pipeline()
+
+        resumed = checkpoint_test.round_trip(self, pipeline)
+        traces = []
+        for machine in (pipeline, resumed):
+            trace = RetireTrace(4096)
+            machine.on_retire = trace.record
+            machine.run(max_cycles=100000)
+            traces.append(trace.entries())
+        self.assertTrue((traces[0] == traces[1]).all())
+
+
+class cache_trace_test(unittest.TestCase):
+    def test_replay_matches(self):
+        # without pipelining the accesses never overlap, so replaying them is exact
+        pipeline = load_exchange_sort()
+        pipeline.yes_pipe = False
+        trace = record_trace(pipeline, 100000)
+        self.assertIsNone(pipeline._memory.on_access)
+
+        for kind, address, pc in zip(trace.kinds, trace.addresses, trace.pcs):
+            if kind == AccessKind.FETCH:
+                self.assertEqual(pc, address)
+            else:
+                self.assertIn(DecodedInstruction(pipeline._memory._RAM[pc]).opcode,
+                              (OpCode.LDR.value, OpCode.STR.value, OpCode.PUSH.value, OpCode.POP.value))
+
+        result = replay(trace, keep_levels=True)
+        self.assertEqual(list(result.levels), list(trace.levels))
+        self.assertEqual(result.l1_hits + result.l2_hits + result.ram_accesses, len(trace))
+        self.assertEqual(result.ram_accesses, list(trace.levels).count(HitLevel.RAM))
+
+        file = io.BytesIO()
+        trace.save(file)
+        file.seek(0)
+        loaded = AccessTrace.load(file)
+        for column in ('kinds', 'addresses', 'pcs', 'levels'):
+            self.assertEqual(getattr(loaded, column), getattr(trace, column))
+        with self.assertRaises(ValueError):
+            AccessTrace.load(io.BytesIO(b'not a trace'))
+
+    def test_policies(self):
+        trace = AccessTrace()
+        for address in (0, 4, 0, 8, 0):
+            trace.append(AccessKind.READ, address)
+
+        hits = {}
+        for policy in ('lru', 'fifo', 'round_robin'):
+            config = HierarchyConfig(CacheConfig(1, 2, 4, policy=policy), None)
+            result = replay(trace, config)
+            hits[policy] = result.l1_hits
+            self.assertEqual(result.stall_cycles, result.l1_hits * config.l1.read_speed + result.ram_accesses * config.ram_read_speed)
+        # missing moves the round robin pointer on as well as filling, so each miss in a set replaces the same way
+        self.assertEqual(hits, {'lru': 2, 'fifo': 1, 'round_robin': 0})
+
+        # a bigger cache never does worse on the same trace
+        pipeline = load_exchange_sort()
+        trace = record_trace(pipeline, 100000)
+        results = sweep(trace, [HierarchyConfig(CacheConfig(sets, 4, policy='lru'), None) for sets in (1, 2, 4, 8, 16)])
+        misses = [result.ram_accesses for result in results]
+        self.assertEqual(misses, sorted(misses, reverse=True))
+        self.assertIn('16x4x4 lru', format_results(results))
+
+        with self.assertRaises(ValueError):
+            CacheConfig(policy='random')
+
+
+class vector_cache_test(unittest.TestCase):
+    def looped_hits(self, addresses, config: CacheConfig) -> List[bool]:
+        # looks up then fills each address, the same as a read does in the L1 cache
+        cache = TraceCache(config)
+        hits = []
+        for address in addresses.tolist():
+            hits.append(cache.lookup(address))
+            cache.fill(address)
+        return hits
+
+    def test_direct_mapped(self):
+        rng = default_rng(3)
+        addresses = rng.integers(0, 600, 5000)
+
+        # CacheBlock only ever replaces one of its ways, so the L1 cache is direct mapped
+        memory = MemorySubsystem(EISA.ADDRESS_SIZE, EISA.CACHE_SIZE, EISA.CACHE_READ_SPEED, EISA.CACHE_WRITE_SPEED,
+                                 EISA.RAM_SIZE, EISA.RAM_READ_SPEED, EISA.RAM_WRITE_SPEED)
+        cache = memory._cache
+        hits = []
+        for address in addresses.tolist():
+            hits.append(cache.check_hit(address))
+            cache.replace(cache.offset_align(address), 0)
+        self.assertEqual(list(cache_hits(addresses, CacheConfig())), hits)
+
+        for config in (CacheConfig(8, 1, 2), CacheConfig(32, 2, 8)):
+            self.assertEqual(list(cache_hits(addresses, config)), self.looped_hits(addresses, config))
+
+    def test_lru(self):
+        self.assertEqual(list(stack_distances(np.array([0, 4, 0, 8, 0, 1, 4]))), [-1, -1, 1, -1, 1, 0, 2])
+
+        rng = default_rng(4)
+        pipeline = load_exchange_sort()
+        recorded = trace_addresses(record_trace(pipeline, 100000))
+        for addresses in (rng.integers(0, 300, 4000), recorded):
+            for sets, ways, line_words in ((1, 8, 4), (4, 2, 1), (16, 3, 4), (2, 5, 8)):
+                config = CacheConfig(sets, ways, line_words, policy='lru')
+                self.assertEqual(list(cache_hits(addresses, config)), self.looped_hits(addresses, config))
+
+        with self.assertRaises(ValueError):
+            cache_hits(recorded, CacheConfig(ways=4))
+
+
+class reuse_distance_test(unittest.TestCase):
+    def test_curve(self):
+        addresses = trace_addresses(record_trace(load_exchange_sort(), 100000))
+        curve = miss_ratio_curve(addresses)
+
+        self.assertEqual(curve.accesses, len(addresses))
+        self.assertEqual(curve.lines, len(set(address // 4 for address in addresses.tolist())))
+        self.assertEqual(curve.miss_count(0), len(addresses))
+        self.assertEqual(curve.miss_count(curve.lines * 2), curve.compulsory)
+        self.assertEqual(curve.compulsory, curve.lines)
+        self.assertTrue((np.diff(curve.misses) <= 0).all())
+
+        # every size matches simulating a fully associative cache of that size
+        reads = AccessTrace()
+        for address in addresses.tolist():
+            reads.append(AccessKind.READ, address)
+        for lines in (1, 2, 3, 5, 8, curve.lines):
+            config = HierarchyConfig(CacheConfig(1, lines, policy='lru'), None)
+            self.assertEqual(curve.miss_count(lines), replay(reads, config).ram_accesses)
+
+        self.assertIn('miss %', curve.table())
+
+
+class miss_classes_test(unittest.TestCase):
+    def test_classes(self):
+        trace = record_trace(load_exchange_sort(), 100000)
+        lines = len(set(address // 4 for address in trace.addresses))
+
+        # small enough that the array doesn't fit in L1
+        config = HierarchyConfig(CacheConfig(4), CacheConfig(8))
+        result = classify_misses(trace, config)
+        replayed = replay(trace, config)
+
+        l1, l2 = result.misses
+        self.assertEqual(result.accesses, len(trace))
+        self.assertEqual(sum(l1), replayed.accesses - replayed.l1_hits)
+        self.assertEqual(sum(l2), replayed.ram_accesses)
+        self.assertEqual(l1[MissClass.COMPULSORY], lines)
+        self.assertEqual(l2[MissClass.COMPULSORY], lines)
+        # CacheBlock only ever uses one of its ways, so the 2 way L1 misses where a fully associative one wouldn't
+        self.assertGreater(l1[MissClass.CONFLICT], 0)
+
+        # the misses of every instruction add up to the totals
+        for level, counts in enumerate(result.misses):
+            for c in MissClass:
+                self.assertEqual(sum(pc_counts[level * len(MissClass) + c] for pc_counts in result.by_pc.values()), counts[c])
+
+        # a fully associative LRU cache is its own shadow, so it never has conflict misses
+        associative = classify_misses(trace, HierarchyConfig(CacheConfig(1, 8, policy='lru'), CacheConfig(8)))
+        self.assertEqual(associative.misses[0][MissClass.CONFLICT], 0)
+        self.assertEqual(associative.misses[0][MissClass.COMPULSORY], lines)
+
+        self.assertIn('conflict', result.table())
+        self.assertIn('L1 conflict', result.pc_table(top=3))
+
+
+class belady_test(unittest.TestCase):
+    def test_opt(self):
+        # lines 0 1 2 0 1 in a single set of 2 ways, OPT evicts 1 for 2 as 0 is used again first, LRU evicts 0
+        addresses = np.array([0, 4, 8, 0, 4])
+        config = CacheConfig(1, 2, policy='lru')
+        self.assertEqual(opt_hits(addresses, config).tolist(), [False, False, False, True, False])
+        comparison = compare_to_opt(addresses, config)
+        self.assertEqual((comparison.compulsory, comparison.policy_misses, comparison.opt_misses), (3, 5, 4))
+
+    def test_trace(self):
+        addresses = trace_addresses(record_trace(load_exchange_sort(), 100000))
+
+        comparisons = [compare_to_opt(addresses, config) for config in (
+            CacheConfig(), CacheConfig(4), CacheConfig(4, 1), CacheConfig(2, 4, policy='lru'), CacheConfig(2, 4, policy='fifo'),
+        )]
+        for comparison in comparisons:
+            self.assertLessEqual(comparison.compulsory, comparison.opt_misses)
+            self.assertLessEqual(comparison.opt_misses, comparison.policy_misses)
+
+        # there's nothing to choose with a single way, and CacheBlock only ever uses one of its 2
+        self.assertEqual(comparisons[2].excess, 0)
+        self.assertGreater(comparisons[1].excess, 0)
+        self.assertEqual(comparisons[1].policy_misses, comparisons[2].policy_misses)
+        self.assertIn('opt misses', format_comparisons(comparisons))
+
+
+class array_cache_test(unittest.TestCase):
+    def access(self, cache, addresses):
+        # looks each address up, and fills it if it missed, the same as a read
+        hits = []
+        for address in addresses:
+            hits.append(cache.check_hit(address))
+            if not hits[-1]:
+                cache.replace(cache.offset_align(address), address)
+        return hits
+
+    def test_matches_trace_cache(self):
+        addresses = default_rng(0).integers(0, 512, 3000).tolist()
+        ram = RAM(EISA.RAM_SIZE, None, 1, 1)
+
+        # round_robin with 2 ways is the same as Cache
+        self.assertEqual(self.access(ArrayCache(EISA.CACHE_SIZE, 2, ram, 1, 1, ways=2, policy='round_robin'), addresses),
+                         self.access(Cache(EISA.CACHE_SIZE, 2, ram, 1, 1, lambda: None), addresses))
+
+        for policy in ('round_robin', 'fifo', 'lru'):
+            for sets, ways in ((4, 4), (1, 8), (16, 1)):
+                cache = ArrayCache(sets.bit_length() - 1, 2, ram, 1, 1, ways=ways, policy=policy)
+                reference = TraceCache(CacheConfig(sets, ways, policy=policy))
+                expected = []
+                for address in addresses:
+                    expected.append(reference.lookup(address))
+                    if not expected[-1]:
+                        reference.fill(address)
+                self.assertEqual(self.access(cache, addresses), expected, f'{policy} {sets}x{ways}')
+
+    def test_plru(self):
+        ram = RAM(EISA.RAM_SIZE, None, 1, 1)
+        cache = ArrayCache(0, 2, ram, 1, 1, ways=4, policy='plru')
+        a, b, c, d, e = (line * 4 for line in range(5))
+
+        # the tree points away from the last 3 lines used, which leaves a rather than b, the least recently used
+        self.assertEqual(self.access(cache, [a, b, c, d, a, c, d, e]), [False] * 4 + [True] * 3 + [False])
+        self.assertFalse(cache.holds(a))
+        self.assertTrue(all(cache.holds(line) for line in (b, c, d, e)))
+
+        with self.assertRaises(ValueError):
+            ArrayCache(0, 2, ram, 1, 1, ways=3, policy='plru')
+
+    def test_random(self):
+        ram = RAM(EISA.RAM_SIZE, None, 1, 1)
+        addresses = default_rng(1).integers(0, 256, 1000).tolist()
+        hits = [self.access(ArrayCache(1, 2, ram, 1, 1, ways=4, policy='random', seed=7), addresses) for i in range(2)]
+        self.assertEqual(hits[0], hits[1])
+
+        # empty ways are filled before anything is replaced
+        cache = ArrayCache(0, 2, ram, 1, 1, ways=4, policy='random')
+        self.access(cache, [0, 4, 8, 12])
+        self.assertTrue(all(cache.holds(address) for address in (0, 4, 8, 12)))
+
+    def test_words(self):
+        ram = RAM(EISA.RAM_SIZE, None, 1, 1)
+        cache = ArrayCache(2, 3, ram, 1, 1, ways=2)
+        self.assertEqual(cache.offset_align(13), slice(8, 16))
+
+        cache.replace(cache.offset_align(13), sum(word << (EISA.WORD_SIZE * i) for i, word in enumerate(range(10, 18))))
+        self.assertEqual([cache[address] for address in range(8, 16)], list(range(10, 18)))
+        cache[9] = 99
+        self.assertEqual(cache[9], 99)
+
+        with self.assertRaises(MemoryMissError):
+            cache[16]
+        with self.assertRaises(MemoryMissError):
+            cache[16] = 1
+
+        self.assertTrue(cache.invalidate(9))
+        self.assertFalse(cache.holds(9))
+        self.assertFalse(cache.invalidate(9))
+
+    def test_pipeline(self):
+        reference = load_exchange_sort()
+        reference.run(max_cycles=100000)
+
+        # round_robin with 2 ways takes exactly as long as the default caches
+        pipeline = load_exchange_sort()
+        pipeline._memory.use_array_caches(2, 'round_robin')
+        pipeline.run(max_cycles=100000)
+        self.assertEqual(pipeline._cycles, reference._cycles)
+
+        for policy in ('lru', 'plru', 'fifo', 'random'):
+            pipeline = load_exchange_sort()
+            pipeline._memory.use_array_caches(4, policy, 6, 7)
+            pipeline.run(max_cycles=100000)
+            self.assertEqual(pipeline._memory._RAM._memory, reference._memory._RAM._memory, policy)
+
+        with self.assertRaises(CheckpointError):
+            save_checkpoint(pipeline, io.BytesIO())
+
+
 if __name__ == '__main__':
     unittest.main()
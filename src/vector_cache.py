@@ -0,0 +1,201 @@
+from __future__ import annotations
+from argparse import ArgumentParser
+from typing import List, Optional
+import time
+
+import numpy as np  # pip install numpy
+from tabulate import tabulate  # pip install tabulate
+
+from cache_trace import AccessTrace, AccessKind, CacheConfig
+
+"""the number of accesses handled together when counting stack distances,
+the counts within a chunk use a chunk by chunk matrix, so this trades memory for fewer passes
+"""
+CHUNK_SIZE = 256
+
+
+def trace_addresses(trace: AccessTrace, kinds: Optional[List[AccessKind]] = None) -> np.ndarray:
+    """the addresses of a recorded trace as an array, without copying them if every kind of access is kept
+
+    Parameters
+    ----------
+    trace : AccessTrace
+        the trace
+    kinds : Optional[List[AccessKind]], optional
+        only keep the accesses of these kinds, by default None to keep every access
+    """
+    addresses = np.frombuffer(trace.addresses, dtype=np.int64) if len(trace) else np.zeros(0, np.int64)
+    if kinds is None:
+        return addresses
+    return addresses[np.isin(np.frombuffer(trace.kinds, dtype=np.int8), kinds)]
+
+
+def _set_order(lines: np.ndarray, sets: int) -> np.ndarray:
+    # the accesses grouped by set, in the order they were made within each set
+    return np.argsort(lines % sets, kind='stable')
+
+
+def _previous_use(lines: np.ndarray) -> np.ndarray:
+    # the position of the previous access to the same line, -1 for the first access to a line
+    order = np.argsort(lines, kind='stable')
+    same = lines[order[1:]] == lines[order[:-1]]
+    previous = np.full(len(lines), -1, dtype=np.int64)
+    previous[order[1:][same]] = order[:-1][same]
+    return previous
+
+
+def _fenwick_prefix(tree: np.ndarray, index: np.ndarray) -> np.ndarray:
+    # the sum of the counts at positions 0 to index inclusive, for every index at once.
+    # position 0 of the tree is always 0, so indexes which have run out of bits just keep adding it
+    total = np.zeros(len(index), dtype=np.int64)
+    i = index + 1
+    for level in range(len(tree).bit_length()):
+        total += tree[i]
+        i &= i - 1
+    return total
+
+
+def _fenwick_add(tree: np.ndarray, index: np.ndarray) -> None:
+    # adds one to the count at each index, repeats are added more than once.
+    # the last position of the tree is past the end of it, and catches the indexes which have run past the end
+    last = len(tree) - 1
+    i = index + 1
+    for level in range(len(tree).bit_length()):
+        np.add.at(tree, i, 1)
+        np.minimum(i + (i & -i), last, out=i)
+
+
+def stack_distances(addresses: np.ndarray, sets: int = 1, line_words: int = 4) -> np.ndarray:
+    """the LRU stack distance of each access within its set, ie. the number of other lines of the set used since the line was last used.
+    an access hits in an LRU cache with that many sets and ways exactly when its stack distance is less than the number of ways.
+
+    the distance of an access is the number of accesses to its set since the line's last use which are the first use of their line since then.
+    every one of those counts is found at once, a chunk of accesses at a time, with the counts before the chunk kept in a Fenwick tree
+
+    Parameters
+    ----------
+    addresses : np.ndarray
+        the addresses accessed, in order
+    sets : int, optional
+        the number of sets, by default 1 for a fully associative cache
+    line_words : int, optional
+        the words in each line, by default 4 like Cache
+
+    Returns
+    -------
+    np.ndarray
+        the stack distance of each access, -1 for the first access to a line
+    """
+    lines = np.asarray(addresses, dtype=np.int64) // line_words
+    order = _set_order(lines, sets)
+    # lines only ever map to a single set, so the previous use of a line is always earlier in the same set
+    previous = _previous_use(lines[order])
+
+    n = len(lines)
+    distances = np.full(n, -1, dtype=np.int64)
+    tree = np.zeros(n + 3, dtype=np.int64)  # counts of previous + 1, for the accesses before the chunk
+    tril = np.tri(CHUNK_SIZE, k=-1, dtype=bool)
+
+    for start in range(0, n, CHUNK_SIZE):
+        stop = min(start + CHUNK_SIZE, n)
+        chunk = previous[start:stop]
+        reused = np.flatnonzero(chunk >= 0)
+        last = chunk[reused]
+
+        # the accesses after the last use whose own previous use is before it, ie. the first use of each line since then.
+        # every access up to and including the last use is counted too, so they are taken off again.
+        # the previous use of every access before the chunk is before the chunk, so only reuses from before the chunk need the tree
+        before = np.full(len(last), start, dtype=np.int64)
+        far = last < start
+        before[far] = _fenwick_prefix(tree, last[far])
+        within = ((chunk[None, :] < last[:, None]) & tril[reused, :stop - start]).sum(axis=1)
+        distances[start + reused] = before + within - last - 1
+
+        _fenwick_add(tree, chunk + 1)
+
+    result = np.empty(n, dtype=np.int64)
+    result[order] = distances
+    return result
+
+
+def direct_mapped_hits(addresses: np.ndarray, sets: int, line_words: int = 4) -> np.ndarray:
+    """which accesses hit in a direct mapped cache, an access hits when the last access to its set was to the same line
+
+    Parameters
+    ----------
+    addresses : np.ndarray
+        the addresses accessed, in order
+    sets : int
+        the number of lines in the cache
+    line_words : int, optional
+        the words in each line, by default 4 like Cache
+
+    Returns
+    -------
+    np.ndarray
+        True for each access which hit
+    """
+    lines = np.asarray(addresses, dtype=np.int64) // line_words
+    order = _set_order(lines, sets)
+    grouped = lines[order]
+
+    hits = np.empty(len(lines), dtype=bool)
+    # consecutive accesses to the same line are always in the same set
+    hits[order] = np.concatenate(([False], grouped[1:] == grouped[:-1])) if len(lines) else []
+    return hits
+
+
+def cache_hits(addresses: np.ndarray, config: CacheConfig) -> np.ndarray:
+    """which accesses hit in a single cache, when each address is looked up and then filled,
+    the same as MemorySubsystem.read does with its L1 cache.
+
+    looking up an address which misses moves the round_robin pointer on, and filling it moves it on again,
+    so CacheBlock with its 2 ways only ever replaces one of them, and behaves the same as a direct mapped cache
+
+    Parameters
+    ----------
+    addresses : np.ndarray
+        the addresses accessed, in order
+    config : CacheConfig
+        the geometry of the cache, only lru, and round_robin with 1 or 2 ways are supported
+
+    Returns
+    -------
+    np.ndarray
+        True for each access which hit
+
+    Raises
+    ------
+    ValueError
+        if the policy isn't supported for the number of ways, use cache_trace.replay instead
+    """
+    if config.ways == 1 or (config.policy == 'round_robin' and config.ways == 2):
+        return direct_mapped_hits(addresses, config.sets, config.line_words)
+    if config.policy == 'lru':
+        distances = stack_distances(addresses, config.sets, config.line_words)
+        return (distances >= 0) & (distances < config.ways)
+    raise ValueError(f'the {config.policy} policy with {config.ways} ways can only be simulated with cache_trace.replay')
+
+
+if __name__ == '__main__':
+    arg_parse = ArgumentParser(description='simulates a single cache over every access of a recorded trace at once')
+    arg_parse.add_argument('trace', type=str, help='a trace saved by cache_trace.py -o')
+    arg_parse.add_argument('--sets', type=int, nargs='+', default=[CacheConfig().sets])
+    arg_parse.add_argument('--ways', type=int, nargs='+', default=[CacheConfig().ways])
+    arg_parse.add_argument('--line-words', type=int, nargs='+', default=[CacheConfig().line_words])
+    arg_parse.add_argument('--policy', choices=('round_robin', 'lru'), default='lru')
+
+    args = arg_parse.parse_args()
+
+    addresses = trace_addresses(AccessTrace.load(args.trace))
+    rows = []
+    for sets in args.sets:
+        for ways in args.ways:
+            for line_words in args.line_words:
+                config = CacheConfig(sets, ways, line_words, policy=args.policy)
+                start = time.perf_counter()
+                hits = int(cache_hits(addresses, config).sum())
+                rows.append([str(config), config.size, hits, len(addresses) - hits, 100 * hits / max(len(addresses), 1),
+                             time.perf_counter() - start])
+
+    print(tabulate(rows, headers=['cache', 'words', 'hits', 'misses', 'hit %', 'seconds'], floatfmt=('', '', '', '', '.1f', '.3f')))